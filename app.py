@@ -1,23 +1,46 @@
 import os
 import requests
 import base64
-from flask import Flask, jsonify, request, redirect, session, render_template, make_response
+from flask import Flask, Response, jsonify, request, redirect, session, render_template, make_response, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
 import secrets
 import datetime
 import time
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sqlalchemy import text
+from services.cache_backend import create_cache_backend
+from services.job_aggregator import JobAggregator, TaskFailed, ndjson_records
+from services.jwt_validator import b64url_decode
+from services.http_client import HTTPClient
+from services.name_resolver import NameResolver, BackendNameCache
 
 load_dotenv()
 db = SQLAlchemy()
 cors = CORS()
 
-# Простой кэш для типов и локаций
-type_cache = {}
-location_cache = {}
+# Кэш типов, локаций и имен из /universe/names/: в памяти процесса или,
+# при CACHE_BACKEND=sqlite, общий для всех воркеров gunicorn на хосте
+local_cache = create_cache_backend('legacy')
+# Имена из /universe/names/ - тот же NameResolver, что и в app_new.py, поверх local_cache
+name_resolver = NameResolver(BackendNameCache(local_cache), HTTPClient())
 cache_duration = 3600  # 1 час
 
+# Срок действия токена доступа записан в нем самом (claim exp JWT EVE SSO), поэтому после
+# перезапуска он известен из таблицы users. Кэш разбора: character_id -> (access_token, exp)
+token_expiry = {}
+token_safety_window = 120  # обновлять токен, если до истечения осталось меньше 2 минут
+# Refresh token, который SSO отклонил: фоновый поток не повторяет его, пока токен не сменится
+token_refresh_failed = {}
+# Один захват на персонажа: токен обновляет либо фоновый поток, либо запрос, но не оба сразу
+token_locks = {}
+token_locks_guard = threading.Lock()
+
 # Проверяем загрузку переменных окружения
 print("DATABASE_URL:", os.environ.get('DATABASE_URL', 'NOT SET'))
 print("EVE_CLIENT_ID:", os.environ.get('EVE_CLIENT_ID', 'NOT SET'))
@@ -54,11 +77,9 @@ def create_app():
 
     def get_cached_type_info(type_id):
         """Получает информацию о типе с кэшированием"""
-        current_time = time.time()
-        if type_id in type_cache:
-            cached_data, timestamp = type_cache[type_id]
-            if current_time - timestamp < cache_duration:
-                return cached_data
+        cached_data = local_cache.get(f'type_{type_id}')
+        if cached_data is not None:
+            return cached_data
         
         try:
             resp = requests.get(f'https://esi.evetech.net/latest/universe/types/{type_id}/')
@@ -71,7 +92,7 @@ def create_app():
                     'group_id': type_data.get('group_id'),
                     'market_group_id': type_data.get('market_group_id')
                 }
-                type_cache[type_id] = (cached_data, current_time)
+                local_cache.set(f'type_{type_id}', cached_data, time.time() + cache_duration)
                 return cached_data
         except:
             pass
@@ -80,11 +101,9 @@ def create_app():
 
     def get_cached_location_info(location_id):
         """Получает информацию о локации с кэшированием"""
-        current_time = time.time()
-        if location_id in location_cache:
-            cached_data, timestamp = location_cache[location_id]
-            if current_time - timestamp < cache_duration:
-                return cached_data
+        cached_data = local_cache.get(f'location_{location_id}')
+        if cached_data is not None:
+            return cached_data
         
         try:
             if location_id > 1000000000000:  # Structure
@@ -97,7 +116,7 @@ def create_app():
                         'type': 'structure',
                         'solar_system_id': location_data.get('solar_system_id')
                     }
-                    location_cache[location_id] = (cached_data, current_time)
+                    local_cache.set(f'location_{location_id}', cached_data, time.time() + cache_duration)
                     return cached_data
             else:  # Station
                 resp = requests.get(f'https://esi.evetech.net/latest/universe/stations/{location_id}/')
@@ -109,51 +128,210 @@ def create_app():
                         'type': 'station',
                         'solar_system_id': location_data.get('system_id')
                     }
-                    location_cache[location_id] = (cached_data, current_time)
+                    local_cache.set(f'location_{location_id}', cached_data, time.time() + cache_duration)
                     return cached_data
         except:
             pass
         
         return {'location_id': location_id, 'name': f'Location {location_id}'}
 
-    def refresh_access_token(user):
-        try:
-            CLIENT_ID = os.environ.get('EVE_CLIENT_ID')
-            SECRET_KEY = os.environ.get('EVE_SECRET_KEY')
-            
-            if not CLIENT_ID or not SECRET_KEY:
-                print("Missing EVE_CLIENT_ID or EVE_SECRET_KEY environment variables")
-                return False
-                
-            auth_str = f"{CLIENT_ID}:{SECRET_KEY}"
-            encoded_auth_str = base64.b64encode(auth_str.encode('utf-8')).decode('utf-8')
-            token_url = 'https://login.eveonline.com/v2/oauth/token'
-            headers = {'Authorization': f'Basic {encoded_auth_str}', 'Content-Type': 'application/x-www-form-urlencoded'}
-            data = {'grant_type': 'refresh_token', 'refresh_token': user.refresh_token}
+    def get_cached_names(ids):
+        """Имена для набора ID через NameResolver: POST /universe/names/ пачками по 1000, с таймаутами и негативным кэшем"""
+        # Записи старого формата (строка вместо словаря) могут остаться в общем кэше CACHE_BACKEND=sqlite
+        return {entity_id: entry['name'] if isinstance(entry, dict) else entry
+                for entity_id, entry in name_resolver.resolve(ids).items()}
+
+    def request_new_token(refresh_token):
+        """Запрос нового токена доступа у EVE SSO; возвращает ответ SSO или None"""
+        CLIENT_ID = os.environ.get('EVE_CLIENT_ID')
+        SECRET_KEY = os.environ.get('EVE_SECRET_KEY')
+        
+        if not CLIENT_ID or not SECRET_KEY:
+            print("Missing EVE_CLIENT_ID or EVE_SECRET_KEY environment variables")
+            return None
             
-            print(f"Refreshing token for user {user.character_name}")
-            response = requests.post(token_url, headers=headers, data=data)
-            print(f"Token refresh response status: {response.status_code}")
+        auth_str = f"{CLIENT_ID}:{SECRET_KEY}"
+        encoded_auth_str = base64.b64encode(auth_str.encode('utf-8')).decode('utf-8')
+        token_url = 'https://login.eveonline.com/v2/oauth/token'
+        headers = {'Authorization': f'Basic {encoded_auth_str}', 'Content-Type': 'application/x-www-form-urlencoded'}
+        data = {'grant_type': 'refresh_token', 'refresh_token': refresh_token}
+        
+        response = requests.post(token_url, headers=headers, data=data, timeout=15)
+        print(f"Token refresh response status: {response.status_code}")
+        
+        if response.status_code != 200:
+            print(f"Token refresh failed: {response.text}")
+            return None
             
-            if response.status_code != 200:
-                print(f"Token refresh failed: {response.text}")
-                return False
-                
-            token_data = response.json()
-            if 'access_token' in token_data:
-                user.access_token = token_data['access_token']
-                user.refresh_token = token_data.get('refresh_token', user.refresh_token)
-                db.session.commit()
-                print("Token refreshed successfully")
+        token_data = response.json()
+        if 'access_token' not in token_data:
+            print(f"Token refresh response missing access_token: {token_data}")
+            return None
+        return token_data
+
+    def apply_token(user, token_data):
+        user.access_token = token_data['access_token']
+        user.refresh_token = token_data.get('refresh_token', user.refresh_token)
+        token_expiry[user.character_id] = (user.access_token, time.time() + token_data.get('expires_in', 1200))
+        token_refresh_failed.pop(user.character_id, None)
+
+    def token_expires_at(user):
+        """Время истечения токена доступа (unix time) из claim exp; None, если токен не JWT"""
+        cached = token_expiry.get(user.character_id)
+        if cached and cached[0] == user.access_token:
+            return cached[1]
+        try:
+            expires_at = float(json.loads(b64url_decode(user.access_token.split('.')[1]))['exp'])
+        except (ValueError, IndexError, KeyError, TypeError):
+            return None
+        token_expiry[user.character_id] = (user.access_token, expires_at)
+        return expires_at
+
+    def token_is_fresh(user, lead_time=token_safety_window):
+        expires_at = token_expires_at(user)
+        return expires_at is not None and expires_at - time.time() > lead_time
+
+    def token_lock(character_id):
+        with token_locks_guard:
+            return token_locks.setdefault(character_id, threading.Lock())
+
+    def refresh_access_token(user):
+        # Токен еще действителен: его заранее обновляет фоновый поток, SSO не вызываем
+        if token_is_fresh(user):
+            return True
+        lock = token_lock(user.character_id)
+        if not lock.acquire(timeout=30):
+            print(f"Timed out waiting for token refresh of {user.character_name}")
+            return False
+        try:
+            # Пока ждали захват, токен мог обновить фоновый поток или другой запрос
+            db.session.refresh(user)
+            if token_is_fresh(user):
                 return True
-            else:
-                print(f"Token refresh response missing access_token: {token_data}")
+            print(f"Refreshing token for user {user.character_name}")
+            token_data = request_new_token(user.refresh_token)
+            if not token_data:
+                token_refresh_failed[user.character_id] = user.refresh_token
                 return False
+            apply_token(user, token_data)
+            db.session.commit()
+            print("Token refreshed successfully")
+            return True
         except Exception as e:
             print(f"Error refreshing token: {str(e)}")
             import traceback
             traceback.print_exc()
             return False
+        finally:
+            lock.release()
+
+    @contextmanager
+    def refresher_lock():
+        """Advisory lock PostgreSQL: фоновое обновление выполняет один воркер из всех"""
+        if db.engine.dialect.name != 'postgresql':
+            yield True
+            return
+        lock_id = int.from_bytes(hashlib.blake2b(b'legacy-token-refresher', digest_size=8).digest(), 'big', signed=True)
+        with db.engine.connect() as connection:
+            locked = bool(connection.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': lock_id}).scalar())
+            try:
+                yield locked
+            finally:
+                if locked:
+                    connection.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': lock_id})
+
+    def save_tokens(updated):
+        """Один commit на пакет; если он не прошел, по commit на персонажа, чтобы не потерять новые refresh token"""
+        try:
+            db.session.commit()
+            return
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error saving refreshed tokens, saving them one at a time: {e}")
+        for user_id, token_data in updated:
+            try:
+                user = db.session.get(User, user_id)
+                if user:
+                    apply_token(user, token_data)
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error saving refreshed token for user {user_id}: {e}")
+
+    def start_token_refresher(interval, lead_time=300, max_workers=4, batch_size=50):
+        """Фоновое обновление токенов всех персонажей до истечения, начиная с самых срочных.
+        Запросы к SSO идут параллельно (не больше max_workers), сохранение - одним commit на batch_size персонажей"""
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='token-refresh')
+
+        def fetch(user):
+            character_name, refresh_token = user
+            try:
+                return request_new_token(refresh_token)
+            except Exception as e:
+                print(f"Error refreshing token for {character_name}: {e}")
+                return None
+
+        def refresh_batch(user_ids):
+            # Персонажи, которых уже обновляет запрос, пропускаются
+            claimed = {}
+            for user_id, character_id in user_ids:
+                lock = token_lock(character_id)
+                if lock.acquire(blocking=False):
+                    claimed[user_id] = lock
+            try:
+                # Строки перечитываются после захвата: запрос мог успеть обновить токен
+                users = [user for user in User.query.filter(User.id.in_(list(claimed)))
+                         .execution_options(populate_existing=True).all()
+                         if not token_is_fresh(user, lead_time)]
+                # Потоки пула не работают с сессией БД: им передаются только строки
+                results = list(executor.map(fetch, [(user.character_name, user.refresh_token) for user in users]))
+                updated = []
+                for user, token_data in zip(users, results):
+                    if token_data:
+                        apply_token(user, token_data)
+                        updated.append((user.id, token_data))
+                    else:
+                        # Дальше токен обновляет только запрос; при отказе SSO персонаж удаляется
+                        token_refresh_failed[user.character_id] = user.refresh_token
+                if updated:
+                    save_tokens(updated)
+            finally:
+                for lock in claimed.values():
+                    lock.release()
+
+        def refresh_due():
+            now = time.time()
+            due = []
+            for user in User.query.all():
+                expires_at = token_expires_at(user)
+                # Срок неизвестен или SSO уже отклонил этот refresh token: токен обновит запрос
+                if expires_at is None or token_refresh_failed.get(user.character_id) == user.refresh_token:
+                    continue
+                if expires_at - now < lead_time:
+                    due.append((expires_at, user.id, user.character_id))
+            due.sort()
+            for offset in range(0, len(due), batch_size):
+                refresh_batch([(user_id, character_id) for _, user_id, character_id in due[offset:offset + batch_size]])
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context():
+                        with refresher_lock() as acquired:
+                            if acquired:
+                                refresh_due()
+                except Exception as e:
+                    print(f"Error refreshing tokens in background: {e}")
+
+        threading.Thread(target=run, name='token-refresher', daemon=True).start()
+
+    job_aggregator = JobAggregator(app, max_workers=int(os.environ.get('JOBS_MAX_WORKERS', 8)),
+                                   timeout=float(os.environ.get('JOBS_CHARACTER_TIMEOUT', 20)))
+
+    token_refresh_interval = float(os.environ.get('TOKEN_REFRESH_INTERVAL', 60))
+    if token_refresh_interval > 0:
+        start_token_refresher(token_refresh_interval)
 
     @app.route('/')
     def home(): return "Бэкенд EVE Profit Master работает!"
@@ -244,6 +422,8 @@ def create_app():
         else: 
             db.session.add(User(character_id=char_data['CharacterID'], character_name=char_data['CharacterName'], access_token=access_token, refresh_token=refresh_token))
         db.session.commit()
+        # Новый токен: срок действия берется из него самого
+        token_refresh_failed.pop(char_data['CharacterID'], None)
         
         # Перенаправляем на фронтенд в зависимости от режима
         if app.config.get('FLASK_ENV') == 'development':
@@ -254,70 +434,106 @@ def create_app():
     @app.route('/popup_close')
     def popup_close(): return render_template('popup_close.html')
 
-    @app.route('/get_jobs')
-    def get_jobs():
-        users = User.query.all()
-        jobs_by_character = {}
-        users_to_remove = []
+    def fetch_character_jobs(user_id):
+        """Обновление токена, загрузка и преобразование работ одного персонажа (в потоке JobAggregator)"""
+        user = db.session.get(User, user_id)
+        if not refresh_access_token(user):
+            print(f"Token refresh failed for {user.character_name}, marking for removal")
+            raise TaskFailed('auth_failed', 'Token refresh failed')
         
-        for user in users:
-            if not refresh_access_token(user): 
-                print(f"Token refresh failed for {user.character_name}, marking for removal")
-                users_to_remove.append(user)
-                continue
-            
-            headers = {'Authorization': f'Bearer {user.access_token}'}
-            jobs_url = f'https://esi.evetech.net/latest/characters/{user.character_id}/industry/jobs/'
-            print(f"Fetching jobs for {user.character_name} from {jobs_url}")
-            
-            resp = requests.get(jobs_url, headers=headers)
-            print(f"Jobs API response for {user.character_name}: {resp.status_code}")
-            
-            if resp.status_code == 200:
-                jobs_data = resp.json()
-                # Преобразуем данные EVE ESI API в формат, ожидаемый frontend
-                transformed_jobs = []
-                for job in jobs_data:
-                    # Получаем название продукта с кэшированием
-                    product_type_id = job.get('product_type_id')
+        headers = {'Authorization': f'Bearer {user.access_token}'}
+        jobs_url = f'https://esi.evetech.net/latest/characters/{user.character_id}/industry/jobs/'
+        print(f"Fetching jobs for {user.character_name} from {jobs_url}")
+        
+        resp = requests.get(jobs_url, headers=headers, timeout=15)
+        print(f"Jobs API response for {user.character_name}: {resp.status_code}")
+        
+        if resp.status_code == 200:
+            jobs_data = resp.json()
+            # Все имена продуктов и локаций получаем одним запросом
+            names = get_cached_names(
+                [job.get('product_type_id') for job in jobs_data] + [job.get('location_id') for job in jobs_data]
+            )
+            # Преобразуем данные EVE ESI API в формат, ожидаемый frontend
+            transformed_jobs = []
+            for job in jobs_data:
+                # Получаем название продукта с кэшированием
+                product_type_id = job.get('product_type_id')
+                if product_type_id in names:
+                    product_name = names[product_type_id]
+                else:
                     product_info = get_cached_type_info(product_type_id) if product_type_id else {'name': 'Unknown Product'}
                     product_name = product_info.get('name', f'Type {product_type_id}')
-                    
-                    # Получаем название локации с кэшированием
-                    location_id = job.get('location_id')
+                
+                # Получаем название локации с кэшированием (структуры - через отдельный запрос)
+                location_id = job.get('location_id')
+                if location_id in names:
+                    location_name = names[location_id]
+                else:
                     location_info = get_cached_location_info(location_id) if location_id else {'name': 'Unknown Location'}
                     location_name = location_info.get('name', f'Location {location_id}')
-                    
-                    transformed_job = {
-                        'job_id': job.get('job_id'),
-                        'product_name': product_name,
-                        'product_type_id': job.get('product_type_id'),
-                        'activity_id': job.get('activity_id'),
-                        'start_date': job.get('start_date'),
-                        'end_date': job.get('end_date'),
-                        'location_name': location_name,
-                        'location_id': job.get('location_id'),
-                        'status': 'in-progress' if job.get('status') == 'active' else 'completed',
-                        'runs': job.get('runs', 1),
-                        'cost': job.get('cost', 0)
-                    }
-                    transformed_jobs.append(transformed_job)
                 
-                jobs_by_character[str(user.character_id)] = transformed_jobs
-                print(f"Found {len(transformed_jobs)} jobs for {user.character_name}")
-                if transformed_jobs:
-                    print(f"Sample job data: {transformed_jobs[0]}")
-            else:
-                print(f"Jobs API error for {user.character_name}: {resp.text}")
-                jobs_by_character[str(user.character_id)] = []
-        
+                transformed_job = {
+                    'job_id': job.get('job_id'),
+                    'product_name': product_name,
+                    'product_type_id': job.get('product_type_id'),
+                    'activity_id': job.get('activity_id'),
+                    'start_date': job.get('start_date'),
+                    'end_date': job.get('end_date'),
+                    'location_name': location_name,
+                    'location_id': job.get('location_id'),
+                    'status': 'in-progress' if job.get('status') == 'active' else 'completed',
+                    'runs': job.get('runs', 1),
+                    'cost': job.get('cost', 0)
+                }
+                transformed_jobs.append(transformed_job)
+            
+            print(f"Found {len(transformed_jobs)} jobs for {user.character_name}")
+            if transformed_jobs:
+                print(f"Sample job data: {transformed_jobs[0]}")
+            return transformed_jobs
+        else:
+            print(f"Jobs API error for {user.character_name}: {resp.text}")
+            return []
+
+    def remove_users(users_to_remove):
         # Remove users with invalid tokens
         for user in users_to_remove:
             db.session.delete(user)
         if users_to_remove:
             db.session.commit()
             print(f"Removed {len(users_to_remove)} users with invalid tokens")
+
+    @app.route('/get_jobs')
+    def get_jobs():
+        # Персонажи обрабатываются параллельно; упавший или медленный персонаж не задерживает остальных
+        users = User.query.all()
+        tasks = {str(user.character_id): (lambda user_id=user.id: fetch_character_jobs(user_id)) for user in users}
+        
+        # ?stream=1 - NDJSON, по строке на персонажа сразу по готовности, последняя строка - {"done": true}
+        if request.args.get('stream', '').lower() in ('1', 'true', 'yes') or \
+                request.accept_mimetypes.best == 'application/x-ndjson':
+            def results():
+                failed = []
+                for key, status, jobs in job_aggregator.iter_results(tasks):
+                    if status['status'] == 'auth_failed':
+                        failed.append(key)
+                    yield key, status, jobs
+                remove_users([user for user in users if str(user.character_id) in failed])
             
+            return Response(stream_with_context(ndjson_records(results())), mimetype='application/x-ndjson',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+        jobs_by_character, statuses = job_aggregator.run(tasks)
+        remove_users([user for user in users if statuses[str(user.character_id)]['status'] == 'auth_failed'])
+        
+        # ?status=1 - вместе с работами вернуть статус каждого персонажа (ok, auth_failed, error, timeout)
+        if request.args.get('status', '').lower() in ('1', 'true', 'yes'):
+            return jsonify({
+                'jobs': jobs_by_character,
+                'characters': statuses,
+                'complete': all(status['status'] == 'ok' for status in statuses.values())
+            })
         return jsonify(jobs_by_character)
 
     @app.route('/get_characters')
@@ -747,16 +963,27 @@ def create_app():
             
             jobs_data = resp.json()
             
+            # Resolve all product and location names in one bulk request
+            names = get_cached_names(
+                [job.get('product_type_id') for job in jobs_data] + [job.get('location_id') for job in jobs_data]
+            )
+            
             # Process and enrich jobs data
             processed_jobs = []
             for job in jobs_data:
                 # Get product info
                 product_type_id = job.get('product_type_id')
-                product_info = get_cached_type_info(product_type_id) if product_type_id else {'name': 'Unknown Product'}
+                if product_type_id in names:
+                    product_info = {'name': names[product_type_id]}
+                else:
+                    product_info = get_cached_type_info(product_type_id) if product_type_id else {'name': 'Unknown Product'}
                 
-                # Get location info
+                # Get location info (player structures still need their own lookup)
                 location_id = job.get('location_id')
-                location_info = get_cached_location_info(location_id) if location_id else {'name': 'Unknown Location'}
+                if location_id in names:
+                    location_info = {'name': names[location_id]}
+                else:
+                    location_info = get_cached_location_info(location_id) if location_id else {'name': 'Unknown Location'}
                 
                 # Calculate additional fields
                 start_date = datetime.datetime.fromisoformat(job.get('start_date', '').replace('Z', '+00:00'))
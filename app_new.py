@@ -6,7 +6,7 @@ Comprehensive backend for EVE Online production planning application
 import os
 import secrets
 import datetime
-from flask import Flask, jsonify, request, redirect, session, render_template
+from flask import Flask, Response, jsonify, request, redirect, session, render_template, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
@@ -20,10 +20,16 @@ cors = CORS()
 
 # Import services and controllers
 from services.eve_sso_service import EVESSOService
+from services.token_manager import TokenManager
+from services.token_refresher import TokenRefresher
+from services.job_aggregator import JobAggregator, ndjson_records
 from services.esi_data_service import ESIDataService
 from services.cache_service import CacheService
+from services.cache_backend import create_cache_backend
 from services.business_logic_service import BusinessLogicService
 from services.market_data_service import MarketDataService
+from services.market_history_service import MarketHistoryService
+from services.http_client import HTTPClient
 
 from controllers.auth_controller import AuthController
 from controllers.character_controller import CharacterController
@@ -33,7 +39,9 @@ from controllers.industry_controller import IndustryController
 from models.user import User
 from models.project import Project
 from models.cache_entry import CacheEntry
+from models.cache_tag import CacheTag
 from models.market_data import MarketData
+from models.market_history import MarketHistory
 
 
 def create_app():
@@ -61,25 +69,57 @@ def create_app():
     user_model = User(db).model
     project_model = Project(db).model
     cache_entry_model = CacheEntry(db).model
+    cache_tag_model = CacheTag(db).model
     market_data_model = MarketData(db).model
+    market_history_model = MarketHistory(db).model
     
     # Initialize services
-    cache_service = CacheService(db)
+    http_client = HTTPClient()
+    # CACHE_BACKEND=sqlite shares the hot tier between all workers of the host
+    cache_service = CacheService(db, cache_entry_model, backend=create_cache_backend(), cache_tag_model=cache_tag_model)
+    cache_service.init_app(app)
+    if os.environ.get('CACHE_WRITE_BEHIND', 'true').lower() in ('1', 'true', 'yes'):
+        cache_service.enable_write_behind(app)
+    sweep_interval = float(os.environ.get('CACHE_SWEEP_INTERVAL', 300))
+    # Expired rows are kept this long for ETag revalidation and stale-while-revalidate
+    sweep_retention = int(os.environ.get('CACHE_SWEEP_RETENTION', 86400))
+    if sweep_interval > 0:
+        cache_service.enable_sweeper(app, interval=sweep_interval, retention=sweep_retention)
     eve_sso_service = EVESSOService(
         os.environ.get('EVE_CLIENT_ID', ''),
-        os.environ.get('EVE_SECRET_KEY', '')
+        os.environ.get('EVE_SECRET_KEY', ''),
+        http_client
     )
-    esi_service = ESIDataService(cache_service)
+    # Access tokens stay in memory and are refreshed only this many seconds before they expire
+    token_manager = TokenManager(eve_sso_service, db, safety_window=int(os.environ.get('TOKEN_SAFETY_WINDOW', 120)))
+    # Refreshes tokens ahead of expiry so request handlers never wait on EVE SSO
+    token_refresher = None
+    token_refresh_interval = float(os.environ.get('TOKEN_REFRESH_INTERVAL', 60))
+    if token_refresh_interval > 0:
+        token_refresher = TokenRefresher(app, db, user_model, token_manager, interval=token_refresh_interval)
+        token_refresher.start()
+    esi_service = ESIDataService(cache_service, http_client)
     business_logic_service = BusinessLogicService(esi_service)
-    market_service = MarketDataService(cache_service)
+    market_history_service = MarketHistoryService(db, market_history_model, cache_service, http_client)
+    # Region order books live in process memory, this many regions at most
+    market_service = MarketDataService(cache_service, http_client, market_history_service, db, market_data_model,
+                                       max_order_books=int(os.environ.get('MARKET_ORDER_BOOKS', 4)))
     
     # Initialize controllers
-    auth_controller = AuthController(eve_sso_service, user_model, db)
-    character_controller = CharacterController(esi_service, business_logic_service, auth_controller)
+    auth_controller = AuthController(eve_sso_service, user_model, db, cache_service, token_manager)
+    # Per-character work of /get_jobs runs concurrently, each character with its own timeout
+    job_aggregator = JobAggregator(app, max_workers=int(os.environ.get('JOBS_MAX_WORKERS', 8)),
+                                   timeout=float(os.environ.get('JOBS_CHARACTER_TIMEOUT', 20)))
+    character_controller = CharacterController(esi_service, business_logic_service, auth_controller, job_aggregator)
     market_controller = MarketController(market_service)
-    industry_controller = IndustryController()
+    industry_controller = IndustryController(esi_service, business_logic_service, market_service)
     
     # Helper functions
+    def ndjson_response(results):
+        """Stream (character_id, status, result) tuples as NDJSON, flushing each line as it is ready"""
+        return Response(stream_with_context(ndjson_records(results)), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
     def get_working_api_url():
         """Get the working API URL (local or production)"""
         if app.config.get('FLASK_ENV') == 'development':
@@ -113,6 +153,54 @@ def create_app():
                 'error': str(e)
             }), 500
     
+    @app.route('/api/admin/http/stats')
+    def get_http_stats():
+        """Get outbound HTTP connection pool statistics"""
+        return jsonify(http_client.stats())
+    
+    @app.route('/api/admin/auth/tokens')
+    def get_token_stats():
+        """Get access token hits, refreshes, shared refreshes and local JWT validations"""
+        return jsonify(dict(token_manager.stats(), refresher=token_refresher.stats() if token_refresher else None,
+                            jwt=eve_sso_service.jwt_validator.stats()))
+    
+    @app.route('/api/admin/jobs/stats')
+    def get_job_aggregator_stats():
+        """Get per-character task outcomes of the /get_jobs aggregation"""
+        return jsonify(job_aggregator.stats())
+    
+    @app.route('/api/admin/cache/stats')
+    def get_cache_stats():
+        """Get cache tier sizes and hit/miss/eviction counters"""
+        return jsonify(cache_service.stats())
+    
+    @app.route('/api/admin/cache/metrics')
+    def get_cache_metrics():
+        """Cache counters per key namespace in the Prometheus text format"""
+        return cache_service.prometheus_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    
+    @app.route('/api/admin/cache/invalidate', methods=['POST'])
+    def invalidate_cache_tag():
+        """Drop every cache entry carrying a tag, e.g. character:90000001 or region:10000002"""
+        tag = (request.get_json(silent=True) or {}).get('tag') or request.args.get('tag')
+        if not tag:
+            return jsonify({'error': 'tag is required'}), 400
+        
+        kind, _, value = tag.partition(':')
+        if kind == 'region' and value.isdigit():
+            # Also drops this process's region order book
+            invalidated = market_service.invalidate_region(int(value))
+        else:
+            invalidated = cache_service.invalidate_tag(tag)
+        return jsonify({'tag': tag, 'invalidated': invalidated})
+    
+    @app.route('/api/admin/cache/sweep', methods=['POST'])
+    def sweep_cache():
+        """Delete cache rows that expired more than the retention ago now, and report how many and how long it took"""
+        if not cache_service.sweeper:
+            return jsonify(cache_service.clear_expired(older_than=sweep_retention))
+        return jsonify(cache_service.sweeper.sweep())
+    
     # Authentication routes
     @app.route('/login')
     def login():
@@ -202,11 +290,38 @@ def create_app():
         return jsonify(result)
     
     # Market routes
+    def parse_market_scope(region_id=None):
+        """Region and optional station/structure filter from hub / location_ids (query string or JSON body)"""
+        data = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        hub = request.args.get('hub') or data.get('hub')
+        location_ids = data.get('location_ids') or [l for l in request.args.get('location_ids', '').split(',') if l]
+        location_ids = [int(location_id) for location_id in location_ids]
+        
+        if hub:
+            resolved = market_service.resolve_hub(hub)
+            if not resolved:
+                raise ValueError(f'Unknown trade hub: {hub}')
+            hub_region_id, station_ids = resolved
+            if region_id is not None and region_id != hub_region_id:
+                raise ValueError(f'Trade hub {hub} is not in region {region_id}')
+            region_id = hub_region_id
+            location_ids = station_ids + location_ids
+        
+        return region_id or 10000002, location_ids or None
+    
+    @app.route('/api/market/hubs')
+    def get_trade_hubs():
+        """List the trade hubs accepted by the hub parameter"""
+        return jsonify(market_controller.get_trade_hubs())
+    
     @app.route('/api/market/types/<int:type_id>/prices')
     def get_type_prices(type_id):
-        """Get prices for a specific type"""
-        region_id = request.args.get('region_id', 10000002, type=int)
-        return jsonify(market_controller.get_type_prices(type_id, region_id))
+        """Get prices for a specific type, optionally at a hub or specific stations"""
+        try:
+            region_id, location_ids = parse_market_scope(request.args.get('region_id', type=int))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(market_controller.get_type_prices(type_id, region_id, location_ids))
     
     @app.route('/api/market/regions/<int:region_id>/orders')
     def get_market_orders(region_id):
@@ -219,6 +334,75 @@ def create_app():
         """Get market prices for a region"""
         return jsonify(market_controller.get_market_prices(region_id))
     
+    @app.route('/api/market/regions/<int:region_id>/prices/batch', methods=['GET', 'POST'])
+    def get_prices_batch(region_id):
+        """Get prices for many types from the region's order book"""
+        if request.method == 'POST':
+            type_ids = (request.get_json(silent=True) or {}).get('type_ids', [])
+        else:
+            type_ids = [t for t in request.args.get('type_ids', '').split(',') if t]
+        
+        try:
+            type_ids = [int(type_id) for type_id in type_ids]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'type_ids must be integers'}), 400
+        if not type_ids:
+            return jsonify({'error': 'type_ids is required'}), 400
+        try:
+            region_id, location_ids = parse_market_scope(region_id)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = market_controller.get_prices_batch(type_ids, region_id, location_ids)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
+    
+    @app.route('/api/market/types/<int:type_id>/history')
+    def get_market_history(type_id):
+        """Get daily market history for a type"""
+        region_id = request.args.get('region_id', 10000002, type=int)
+        days = request.args.get('days', type=int)
+        result = market_controller.get_historical_prices(type_id, region_id, days)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
+    
+    @app.route('/api/market/regions/<int:region_id>/history/refresh', methods=['POST'])
+    def refresh_market_history(region_id):
+        """Append new daily history rows for many types"""
+        try:
+            type_ids = [int(type_id) for type_id in (request.get_json(silent=True) or {}).get('type_ids', [])]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'type_ids must be integers'}), 400
+        if not type_ids:
+            return jsonify({'error': 'type_ids is required'}), 400
+        
+        result = market_controller.refresh_history(type_ids, region_id)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
+    
+    @app.route('/api/market/regions/<int:region_id>/statistics', methods=['GET', 'POST'])
+    def get_price_statistics(region_id):
+        """Get rolling VWAP, volatility and average daily volume from stored history"""
+        if request.method == 'POST':
+            type_ids = (request.get_json(silent=True) or {}).get('type_ids', [])
+        else:
+            type_ids = [t for t in request.args.get('type_ids', '').split(',') if t]
+        
+        try:
+            type_ids = [int(type_id) for type_id in type_ids]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'type_ids must be integers'}), 400
+        if not type_ids:
+            return jsonify({'error': 'type_ids is required'}), 400
+        
+        result = market_controller.get_price_statistics(type_ids, region_id)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
+    
     @app.route('/api/market/calculate-value')
     def calculate_market_value():
         """Calculate market value for a quantity of items"""
@@ -231,6 +415,33 @@ def create_app():
         
         return jsonify(market_controller.calculate_market_value(type_id, quantity, region_id))
     
+    @app.route('/api/market/regions/<int:region_id>/valuation', methods=['POST'])
+    def value_items(region_id):
+        """Value a list of items against the region's order book depth"""
+        data = request.get_json(silent=True) or {}
+        items = []
+        try:
+            for item in data.get('items', []):
+                if isinstance(item, dict):
+                    items.append((int(item['type_id']), int(item['quantity'])))
+                else:
+                    items.append((int(item[0]), int(item[1])))
+        except (KeyError, IndexError, TypeError, ValueError):
+            return jsonify({'error': 'items must be {type_id, quantity} objects or [type_id, quantity] pairs'}), 400
+        if not items:
+            return jsonify({'error': 'items is required'}), 400
+        if any(quantity <= 0 for _, quantity in items):
+            return jsonify({'error': 'quantity must be positive'}), 400
+        try:
+            region_id, location_ids = parse_market_scope(region_id)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = market_controller.value_items(items, region_id, location_ids)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
+    
     @app.route('/api/market/regions/<int:region_id>')
     def get_region_info(region_id):
         """Get region information"""
@@ -383,8 +594,17 @@ def create_app():
     
     @app.route('/get_jobs')
     def get_jobs_legacy():
-        """Get all jobs for all characters (legacy endpoint)"""
-        return jsonify(character_controller.get_all_jobs())
+        """Get all jobs for all characters (legacy endpoint); ?status=1 adds per-character status,
+        ?stream=1 (or Accept: application/x-ndjson) sends one NDJSON line per character as it completes"""
+        if request.args.get('stream', '').lower() in ('1', 'true', 'yes') or \
+                request.accept_mimetypes.best == 'application/x-ndjson':
+            return ndjson_response(character_controller.iter_all_jobs())
+        
+        include_status = request.args.get('status', '').lower() in ('1', 'true', 'yes')
+        result = character_controller.get_all_jobs(include_status)
+        if isinstance(result, tuple):
+            return jsonify(result[0]), result[1]
+        return jsonify(result)
     
     @app.route('/get_character_planets/<int:character_id>')
     def get_character_planets_legacy(character_id):
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JSON text rows vs. CacheCodec binary rows for large cache payloads
+Measures row size, database write/read time (SQLite file) and decode time.
+
+Usage: python benchmarks/cache_codec_benchmark.py [rounds]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.cache_codec import CacheCodec
+
+
+def region_orders(count):
+    """ESI /markets/{region_id}/orders/ shaped payload"""
+    return [{
+        'duration': 90,
+        'is_buy_order': random.random() < 0.4,
+        'issued': '2026-10-17T11:48:09Z',
+        'location_id': random.choice([60003760, 60008494, 1035466617946]),
+        'min_volume': 1,
+        'order_id': 6800000000 + i,
+        'price': round(random.uniform(1, 5e8), 2),
+        'range': random.choice(['region', 'station', 'solarsystem']),
+        'system_id': 30000142,
+        'type_id': random.randint(18, 60000),
+        'volume_remain': random.randint(1, 100000),
+        'volume_total': 100000
+    } for i in range(count)]
+
+
+def assets(count):
+    """ESI /characters/{id}/assets/ shaped payload"""
+    return [{
+        'is_singleton': False,
+        'item_id': 1040000000000 + i,
+        'location_flag': random.choice(['Hangar', 'Cargo', 'Deliveries']),
+        'location_id': 60003760,
+        'location_type': 'station',
+        'quantity': random.randint(1, 50000),
+        'type_id': random.randint(18, 60000)
+    } for i in range(count)]
+
+
+def planet_pins(count):
+    """ESI /characters/{id}/planets/{planet_id}/ shaped payload"""
+    return {'pins': [{
+        'pin_id': 1030000000000 + i,
+        'type_id': 2848,
+        'latitude': random.uniform(-3, 3),
+        'longitude': random.uniform(-3, 3),
+        'contents': [{'type_id': 2268, 'amount': random.randint(0, 30000)}],
+        'extractor_details': {'cycle_time': 1800, 'head_radius': 0.01, 'heads': [
+            {'head_id': h, 'latitude': 1.1, 'longitude': 2.2} for h in range(10)
+        ], 'product_type_id': 2268, 'qty_per_cycle': 5000}
+    } for i in range(count)], 'links': [], 'routes': []}
+
+
+def timed(operation, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = operation()
+    return (time.perf_counter() - start) / rounds * 1000, result
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    random.seed(42)
+    payloads = {
+        'market_orders (20k)': region_orders(20000),
+        'assets (5k)': assets(5000),
+        'planet pins (300)': planet_pins(300)
+    }
+    codecs = {'json text': None, 'msgpack+zlib': CacheCodec('zlib')}
+    try:
+        codecs['msgpack+zstd'] = CacheCodec('zstd')
+    except ValueError:
+        pass
+
+    path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE cache_entries (cache_key TEXT PRIMARY KEY, cache_data TEXT, cache_blob BLOB)')
+
+    print(f"{'payload':<22}{'codec':<15}{'row bytes':>12}{'encode ms':>11}{'write ms':>10}"
+          f"{'read ms':>9}{'decode ms':>11}")
+    for name, data in payloads.items():
+        for label, codec in codecs.items():
+            if codec is None:
+                encode_ms, row = timed(lambda: json.dumps(data), rounds)
+                column = 'cache_data'
+            else:
+                encode_ms, (row, size) = timed(lambda: codec.encode(data), rounds)
+                column = 'cache_blob'
+
+            def write():
+                connection.execute(f'INSERT OR REPLACE INTO cache_entries (cache_key, {column}) VALUES (?, ?)',
+                                   (name, row))
+                connection.commit()
+
+            def read():
+                return connection.execute(f'SELECT {column} FROM cache_entries WHERE cache_key = ?',
+                                          (name,)).fetchone()[0]
+
+            write_ms, _ = timed(write, rounds)
+            read_ms, stored = timed(read, rounds)
+            decode = (lambda: json.loads(stored)) if codec is None else (lambda: codec.decode(stored))
+            decode_ms, decoded = timed(decode, rounds)
+            assert decoded == data
+            print(f"{name:<22}{label:<15}{len(row):>12,}{encode_ms:>11.2f}{write_ms:>10.2f}"
+                  f"{read_ms:>9.2f}{decode_ms:>11.2f}")
+        print()
+
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
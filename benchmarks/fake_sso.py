@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for EVE SSO v2: an RSA key, its JWKS and the tokens it signs
+Serves /oauth/jwks and /oauth/verify on 127.0.0.1 and issues RS256 access tokens
+shaped like login.eveonline.com's, so JWTValidator and EVESSOService.verify_token
+can be exercised without EVE traffic.
+
+Usage: python benchmarks/fake_sso.py [port]   (prints a token and serves until interrupted)
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.jwt_validator import b64url_decode
+
+
+def der(tag: int, body: bytes) -> bytes:
+    return bytes([tag, len(body)]) + body
+
+
+def der_oid(dotted: str) -> bytes:
+    first, second, *rest = (int(part) for part in dotted.split('.'))
+    body = bytes([40 * first + second])
+    for value in rest:
+        chunk = [value & 0x7f]
+        while value > 0x7f:
+            value >>= 7
+            chunk.insert(0, 0x80 | (value & 0x7f))
+        body += bytes(chunk)
+    return der(0x06, body)
+
+
+def sha256_digest_info(message: bytes) -> bytes:
+    """DER DigestInfo for SHA-256, encoded here from the OID rather than borrowed from the validator"""
+    algorithm = der(0x30, der_oid('2.16.840.1.101.3.4.2.1') + der(0x05, b''))
+    return der(0x30, algorithm + der(0x04, hashlib.sha256(message).digest()))
+
+
+def b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64url_uint(value: int) -> str:
+    return b64url(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+def is_probable_prime(n: int, rounds: int = 40) -> bool:
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % p == 0:
+            return n == p
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d, r = d // 2, r + 1
+    for _ in range(rounds):
+        x = pow(secrets.randbelow(n - 3) + 2, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def random_prime(bits: int) -> int:
+    while True:
+        candidate = secrets.randbits(bits) | (1 << (bits - 1)) | (1 << (bits - 2)) | 1
+        if is_probable_prime(candidate):
+            return candidate
+
+
+class FakeSSO:
+    """An RSA key pair with kid JWT-Signature-Key, the way EVE SSO publishes it"""
+    
+    def __init__(self, bits: int = 2048, kid: str = 'JWT-Signature-Key', client_id: str = 'fake-client-id'):
+        self.kid = kid
+        self.client_id = client_id
+        self.e = 65537
+        while True:
+            p, q = random_prime(bits // 2), random_prime(bits // 2)
+            phi = (p - 1) * (q - 1)
+            if p != q and phi % self.e:
+                break
+        self.n = p * q
+        self.d = pow(self.e, -1, phi)
+        self.verify_delay = 0.0  # Seconds /oauth/verify waits, to stand in for the round trip to EVE
+        self.server = None
+    
+    def jwks(self) -> dict:
+        return {'keys': [{'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': self.kid,
+                          'n': b64url_uint(self.n), 'e': b64url_uint(self.e)}]}
+    
+    def issue(self, character_id: int = 90000001, name: str = 'Fake Pilot', scopes=('publicData',),
+              expires_in: int = 1200, **overrides) -> str:
+        """A signed access token; overrides replace claims (exp, iss, aud, ...)"""
+        now = int(time.time())
+        claims = {
+            'scp': list(scopes),
+            'jti': secrets.token_hex(16),
+            'kid': self.kid,
+            'sub': f'CHARACTER:EVE:{character_id}',
+            'azp': self.client_id,
+            'tenant': 'tranquility',
+            'tier': 'live',
+            'region': 'world',
+            'aud': [self.client_id, 'EVE Online'],
+            'name': name,
+            'owner': b64url(hashlib.sha1(str(character_id).encode()).digest()),
+            'exp': now + expires_in,
+            'iat': now,
+            'iss': 'https://login.eveonline.com'
+        }
+        claims.update(overrides)
+        header = {'alg': 'RS256', 'kid': self.kid, 'typ': 'JWT'}
+        signing_input = f"{b64url(json.dumps(header).encode())}.{b64url(json.dumps(claims).encode())}"
+        return f"{signing_input}.{b64url(self.sign(signing_input.encode()))}"
+    
+    def sign(self, message: bytes) -> bytes:
+        size = (self.n.bit_length() + 7) // 8
+        digest_info = sha256_digest_info(message)
+        encoded = b'\x00\x01' + b'\xff' * (size - len(digest_info) - 3) + b'\x00' + digest_info
+        return pow(int.from_bytes(encoded, 'big'), self.d, self.n).to_bytes(size, 'big')
+    
+    def verify_response(self, access_token: str):
+        """What /oauth/verify answers: character info for a token this key signed"""
+        try:
+            claims = json.loads(b64url_decode(access_token.split('.')[1]))
+        except (ValueError, IndexError):
+            return 401, {'error': 'invalid_token'}
+        if claims['exp'] < time.time():
+            return 401, {'error': 'token_expired'}
+        return 200, {
+            'CharacterID': int(claims['sub'].rsplit(':', 1)[1]),
+            'CharacterName': claims['name'],
+            'ExpiresOn': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(claims['exp'])),
+            'Scopes': ' '.join(claims['scp']),
+            'TokenType': 'Character',
+            'CharacterOwnerHash': claims['owner'],
+            'IntellectualProperty': 'EVE'
+        }
+    
+    def start(self, port: int = 0) -> str:
+        """Serve /oauth/jwks and /oauth/verify in a background thread; returns the base URL"""
+        sso = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            
+            def do_GET(self):
+                if self.path.startswith('/oauth/jwks'):
+                    self._send(200, sso.jwks())
+                elif self.path.startswith('/oauth/verify'):
+                    if sso.verify_delay:
+                        time.sleep(sso.verify_delay)
+                    token = self.headers.get('Authorization', '').replace('Bearer ', '', 1)
+                    self._send(*sso.verify_response(token))
+                else:
+                    self._send(404, {'error': 'not found'})
+            
+            def _send(self, code, body):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_port}"
+    
+    def stop(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+
+
+if __name__ == '__main__':
+    sso = FakeSSO()
+    base_url = sso.start(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    print(f"Fake EVE SSO at {base_url} (client id {sso.client_id})")
+    print(f"Access token: {sso.issue()}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sso.stop()
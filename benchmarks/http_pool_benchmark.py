@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: warm pooled HTTPClient vs. cold per-call connections
+Runs against a local stand-in server, so no ESI traffic is generated.
+
+Usage: python benchmarks/http_pool_benchmark.py [requests] [delay_ms]
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.http_client import HTTPClient
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a small ESI-like JSON body over keep-alive HTTP/1.1"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.0
+    body = json.dumps({'type_id': 34, 'name': 'Tritanium', 'volume': 0.01}).encode()
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(label, fetch, url, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fetch(url).raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<12} mean {statistics.mean(timings):7.3f} ms   "
+          f"p50 {timings[len(timings) // 2]:7.3f} ms   "
+          f"p95 {timings[int(len(timings) * 0.95)]:7.3f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    StandInHandler.delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 0.0) / 1000
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/latest/universe/types/34/"
+
+    print(f"{count} sequential GETs against {url}")
+
+    def cold(u):
+        with requests.Session() as session:
+            return session.get(u, timeout=(3.05, 15))
+
+    client = HTTPClient()
+    client.get(url)  # open the pooled connection before timing
+
+    measure('cold', cold, url, count)
+    measure('warm pool', client.get, url, count)
+
+    print(json.dumps(client.stats(), indent=2))
+    client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Checks for services/jwt_validator.py: tokens it must accept, reject or leave to /oauth/verify
+Tampered, expired, wrong-audience, wrong-issuer and malformed tokens are built against
+benchmarks/fake_sso.py. When the openssl CLI is available, rs256_verify is also checked
+against signatures made by OpenSSL, so the signature check does not only agree with itself.
+
+Usage: python benchmarks/jwt_validator_check.py   (exits non-zero if any check fails)
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.http_client import HTTPClient
+from services.jwt_validator import JWTValidator, TokenInvalid, b64url_decode, rs256_verify
+from fake_sso import FakeSSO, b64url
+
+ACCEPT, REJECT, REMOTE = 'accept', 'reject', 'remote'
+
+
+def outcome(validator, token):
+    try:
+        return ACCEPT if validator.validate(token) else REMOTE
+    except TokenInvalid:
+        return REJECT
+
+
+def signed(sso, header, claims):
+    """A token with arbitrary (even non-object) header and claims, correctly signed by sso"""
+    signing_input = f"{b64url(json.dumps(header).encode())}.{b64url(json.dumps(claims).encode())}"
+    return f"{signing_input}.{b64url(sso.sign(signing_input.encode()))}"
+
+
+def cases(sso, other):
+    token = sso.issue()
+    header_part, payload_part, signature_part = token.split('.')
+    claims = json.loads(b64url_decode(payload_part))
+    header = {'alg': 'RS256', 'kid': sso.kid, 'typ': 'JWT'}
+    forged_claims = dict(claims, sub='CHARACTER:EVE:1')
+    signature = bytearray(b64url_decode(signature_part))
+    signature[-1] ^= 1
+    return [
+        ('valid token', token, ACCEPT),
+        ('payload swapped after signing', f"{header_part}.{b64url(json.dumps(forged_claims).encode())}.{signature_part}", REJECT),
+        ('signature bit flipped', f"{header_part}.{payload_part}.{b64url(bytes(signature))}", REJECT),
+        ('signature truncated', f"{header_part}.{payload_part}.{signature_part[:-8]}", REJECT),
+        ('signed by another key', other.issue(), REJECT),
+        ('expired', sso.issue(expires_in=-60), REJECT),
+        ('expired within leeway', sso.issue(expires_in=-2), ACCEPT),
+        ('wrong issuer', sso.issue(iss='https://evil.example.com'), REJECT),
+        ('wrong audience', sso.issue(aud=['someone-else', 'EVE Online']), REJECT),
+        ('audience without EVE Online', sso.issue(aud=[sso.client_id]), REJECT),
+        ('audience not a list', sso.issue(aud=42), REJECT),
+        ('non-character subject', sso.issue(sub='CORPORATION:EVE:98000001'), REJECT),
+        ('subject not a string', sso.issue(sub=90000001), REJECT),
+        ('exp not a number', sso.issue(exp='tomorrow'), REJECT),
+        ('exp missing', signed(sso, header, {k: v for k, v in claims.items() if k != 'exp'}), REJECT),
+        ('exp out of range', sso.issue(exp=10 ** 20), REJECT),
+        ('scopes not strings', sso.issue(scp=[1, 2]), REJECT),
+        ('claims a JSON array', signed(sso, header, [1]), REJECT),
+        ('header a JSON array', signed(sso, [1], claims), REMOTE),
+        ('alg none', f"{b64url(json.dumps({'alg': 'none'}).encode())}.{payload_part}.", REMOTE),
+        ('alg HS256', f"{b64url(json.dumps({'alg': 'HS256', 'kid': sso.kid}).encode())}.{payload_part}.{signature_part}", REMOTE),
+        ('unknown kid', signed(sso, dict(header, kid='rotated-away'), claims), REMOTE),
+        ('not a JWT', 'opaque-access-token', REMOTE),
+        ('not base64', 'é.é.é', REMOTE),
+        ('empty', '', REMOTE),
+    ]
+
+
+def openssl_check():
+    """rs256_verify against a key and signatures made by OpenSSL; None when openssl is missing"""
+    openssl = shutil.which('openssl')
+    if not openssl:
+        return None
+    with tempfile.TemporaryDirectory() as directory:
+        key = os.path.join(directory, 'key.pem')
+        message = os.path.join(directory, 'message')
+        subprocess.run([openssl, 'genpkey', '-algorithm', 'RSA', '-pkeyopt', 'rsa_keygen_bits:2048', '-out', key],
+                       check=True, capture_output=True)
+        modulus = subprocess.run([openssl, 'rsa', '-in', key, '-noout', '-modulus'],
+                                 check=True, capture_output=True, text=True).stdout.strip().split('=', 1)[1]
+        n = int(modulus, 16)
+        results = []
+        for text in (b'header.payload', b'', b'x' * 10000):
+            with open(message, 'wb') as f:
+                f.write(text)
+            signature = subprocess.run([openssl, 'dgst', '-sha256', '-sign', key, message],
+                                       check=True, capture_output=True).stdout
+            results.append(rs256_verify(text, signature, n, 65537))
+            results.append(not rs256_verify(text + b'!', signature, n, 65537))
+        return all(results)
+
+
+def main():
+    sso = FakeSSO()
+    other = FakeSSO()
+    base_url = sso.start()
+    validator = JWTValidator(HTTPClient(), f"{base_url}/oauth/jwks", client_id=sso.client_id)
+
+    failed = 0
+    for name, token, expected in cases(sso, other):
+        try:
+            got = outcome(validator, token)
+        except Exception as e:
+            got = f"{type(e).__name__}: {e}"
+        ok = got == expected
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<32} expected {expected:<7} got {got}")
+
+    openssl = openssl_check()
+    if openssl is None:
+        print("skip rs256_verify against OpenSSL signatures (openssl not found)")
+    else:
+        failed += not openssl
+        print(f"{'ok  ' if openssl else 'FAIL'} rs256_verify against OpenSSL signatures")
+
+    sso.stop()
+    print(f"\n{'all checks passed' if not failed else f'{failed} check(s) failed'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
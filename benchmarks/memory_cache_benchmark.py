@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark: lookup cost of the bounded MemoryCache at 100k entries
+Compares hits, misses and evicting inserts against a plain dict.
+
+Usage: python benchmarks/memory_cache_benchmark.py [entries] [lookups]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.memory_cache import MemoryCache
+
+
+def measure(label, operation, keys):
+    start = time.perf_counter()
+    for key in keys:
+        operation(key)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(keys) * 1e9:8.0f} ns/op")
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+
+    payload = {'type_id': 34, 'name': 'Tritanium', 'group_id': 18, 'volume': 0.01}
+    size = len(json.dumps(payload))
+    expires_at = time.time() + 3600
+    keys = [f"type_{i}" for i in range(entries)]
+    hit_keys = [random.choice(keys) for _ in range(lookups)]
+    miss_keys = [f"missing_{i}" for i in range(lookups)]
+    new_keys = [f"new_{i}" for i in range(lookups)]
+
+    plain = {}
+    for key in keys:
+        plain[key] = (payload, expires_at, None)
+
+    cache = MemoryCache(max_entries=entries)
+    start = time.perf_counter()
+    for key in keys:
+        cache.set(key, payload, expires_at, None, size)
+    print(f"Filled {entries} entries ({cache.bytes / 1024 / 1024:.1f} MB accounted) "
+          f"in {time.perf_counter() - start:.3f}s\n")
+
+    def plain_get(key):
+        entry = plain.get(key)
+        return entry[0] if entry and time.time() < entry[1] else None
+
+    measure('dict get (hit)', plain_get, hit_keys)
+    measure('MemoryCache.get (hit)', cache.get, hit_keys)
+    measure('dict get (miss)', plain_get, miss_keys)
+    measure('MemoryCache.get (miss)', cache.get, miss_keys)
+    # The cache is full, so every insert also evicts the least recently used entry
+    measure('MemoryCache.set (evicting)', lambda key: cache.set(key, payload, expires_at, None, size), new_keys)
+
+    print(f"\n{json.dumps(cache.stats(), indent=2)}")
+
+
+if __name__ == '__main__':
+    main()
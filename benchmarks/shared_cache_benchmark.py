@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-process MemoryCache vs. the SQLite SharedCache under several worker processes
+Every worker replays the same skewed key stream (a few hot types, a long tail). A miss
+costs a simulated origin fetch (database row or ESI call) and stores the result.
+Reports origin fetches, hot tier hit rate and lookup latency per worker count.
+
+Usage: python benchmarks/shared_cache_benchmark.py [lookups per worker] [origin ms]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.memory_cache import MemoryCache
+from services.shared_cache import SharedCache
+
+
+KEYS = 5000
+
+
+def payload(key):
+    """/universe/types/{type_id}/ shaped entry"""
+    return {'type_id': key, 'name': f'Type {key}', 'group_id': key % 1000, 'volume': 0.01,
+            'description': 'x' * 400}
+
+
+def worker(backend, path, lookups, origin_ms, seed, results):
+    cache = MemoryCache() if backend == 'memory' else SharedCache(path)
+    rng = random.Random(seed)
+    # Skewed popularity: most lookups hit a small set of types
+    keys = [f"type_{min(int(rng.paretovariate(1.2)) - 1, KEYS - 1)}" for _ in range(lookups)]
+    fetches = 0
+    hit_time = 0.0
+    hits = 0
+    start = time.perf_counter()
+    for key in keys:
+        lookup_start = time.perf_counter()
+        data = cache.get(key)
+        if data is not None:
+            hit_time += time.perf_counter() - lookup_start
+            hits += 1
+            continue
+        time.sleep(origin_ms / 1000)
+        fetches += 1
+        cache.set(key, payload(int(key[5:])), time.time() + 3600, None, 500)
+    results.put((fetches, hits, hit_time, time.perf_counter() - start))
+
+
+def run(backend, workers, lookups, origin_ms):
+    path = os.path.join(tempfile.mkdtemp(), 'shared-cache.sqlite')
+    if backend == 'sqlite':
+        SharedCache(path)  # create the schema once, as the app does before forking workers
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(backend, path, lookups, origin_ms, seed, results))
+                 for seed in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    fetches = sum(outcome[0] for outcome in outcomes)
+    hits = sum(outcome[1] for outcome in outcomes)
+    hit_us = sum(outcome[2] for outcome in outcomes) / hits * 1e6 if hits else 0.0
+    total = workers * lookups
+    print(f"{backend:<8}{workers:>8}{fetches:>10,}{hits / total:>10.1%}{hit_us:>12.1f}{elapsed:>10.2f}")
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    origin_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    print(f"{lookups} lookups per worker, {origin_ms} ms per origin fetch\n")
+    print(f"{'backend':<8}{'workers':>8}{'fetches':>10}{'hit rate':>10}{'hit us':>12}{'wall s':>10}")
+    for workers in (4, 8):
+        for backend in ('memory', 'sqlite'):
+            run(backend, workers, lookups, origin_ms)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: EVE SSO token verification through /oauth/verify vs. local JWT validation
+Both paths run against benchmarks/fake_sso.py on 127.0.0.1. The remote path waits
+rtt_ms per call on top of the loopback round trip to stand in for login.eveonline.com;
+the local path fetches the JWKS once and then checks RS256 signatures in process.
+
+Usage: python benchmarks/sso_verify_benchmark.py [verifications] [rtt_ms]
+"""
+
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.http_client import HTTPClient
+from services.eve_sso_service import EVESSOService
+from fake_sso import FakeSSO
+
+
+def timed(label, verify, tokens):
+    latencies = []
+    start = time.perf_counter()
+    for token in tokens:
+        call_start = time.perf_counter()
+        info = verify(token)
+        latencies.append((time.perf_counter() - call_start) * 1000)
+        assert info and info['CharacterID'], f"{label}: verification failed"
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<26}{len(tokens) / elapsed:>12,.0f}{statistics.median(latencies):>12.3f}{p99:>12.3f}")
+
+
+def main():
+    verifications = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rtt_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 40.0
+    
+    print("Generating a 2048-bit RSA key...")
+    sso = FakeSSO()
+    base_url = sso.start()
+    sso.verify_delay = rtt_ms / 1000
+    tokens = [sso.issue(character_id=90000000 + i, name=f'Pilot {i}') for i in range(verifications)]
+    
+    service = EVESSOService(sso.client_id, 'secret', HTTPClient())
+    service.base_url = base_url
+    service.jwt_validator.jwks_url = f"{base_url}/oauth/jwks"
+    
+    # The /oauth/verify path as it ran before local validation
+    def remote(token):
+        response = service.http.get(f"{base_url}/oauth/verify", headers={'Authorization': f'Bearer {token}'})
+        response.raise_for_status()
+        return response.json()
+    
+    assert remote(tokens[0]) == service.verify_token(tokens[0]), "local and remote character info differ"
+    print(f"{verifications} verifications, {rtt_ms} ms simulated round trip to SSO\n")
+    print(f"{'path':<26}{'per s':>12}{'p50 ms':>12}{'p99 ms':>12}")
+    timed('remote /oauth/verify', remote, tokens)
+    timed('local JWT (cached JWKS)', service.verify_token, tokens)
+    print(f"\nJWKS fetches: {service.jwt_validator.stats()['jwks_fetches']}")
+    
+    sso.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,18 +6,23 @@ Handles EVE SSO authentication and user management
 from flask import request, session, redirect, jsonify
 from typing import Dict, List, Optional
 from services.eve_sso_service import EVESSOService
+from services.token_manager import TokenManager
 from models.user import User
 from functools import wraps
 import datetime
+import json
 
 
 class AuthController:
     """Controller for authentication operations"""
     
-    def __init__(self, eve_sso_service: EVESSOService, user_model, db):
+    def __init__(self, eve_sso_service: EVESSOService, user_model, db, cache_service=None,
+                 token_manager: TokenManager = None):
         self.eve_sso_service = eve_sso_service
         self.user_model = user_model
         self.db = db
+        self.cache_service = cache_service
+        self.token_manager = token_manager or TokenManager(eve_sso_service, db)
     
     def require_auth(self, f):
         """Decorator to require authentication"""
@@ -31,31 +36,19 @@ class AuthController:
             if not user:
                 return jsonify({'error': 'Character not found'}), 404
             
-            if not self._refresh_user_token(user):
+            if not self.refresh_access_token(user):
                 return jsonify({'error': 'Token expired, please re-authenticate', 'requires_reauth': True}), 401
             
             return f(user, *args, **kwargs)
         return decorated_function
     
-    def _refresh_user_token(self, user) -> bool:
-        """Refresh user's access token"""
-        try:
-            new_token = self.eve_sso_service.refresh_token(user.refresh_token)
-            if new_token:
-                user.access_token = new_token.access_token
-                user.refresh_token = new_token.refresh_token
-                user.token_expires_at = new_token.expires_at
-                user.scopes = new_token.scopes
-                user.updated_at = datetime.utcnow()
-                self.db.session.commit()
-                return True
-            else:
-                user.is_active = False
-                self.db.session.commit()
-                return False
-        except Exception as e:
-            print(f"Error refreshing token for user {user.character_name}: {e}")
-            return False
+    def get_user_by_character_id(self, character_id: int):
+        """Active user for a character, or None"""
+        return self.user_model.query.filter_by(character_id=character_id, is_active=True).first()
+    
+    def refresh_access_token(self, user) -> bool:
+        """Make sure user carries a valid access token; only refreshes shortly before expiry"""
+        return self.token_manager.ensure_token(user)
     
     def login(self, redirect_uri: str) -> str:
         """Initiate EVE SSO login"""
@@ -102,8 +95,8 @@ class AuthController:
             user.access_token = token.access_token
             user.refresh_token = token.refresh_token
             user.token_expires_at = token.expires_at
-            user.scopes = token.scopes
-            user.updated_at = datetime.utcnow()
+            user.scopes = json.dumps(token.scopes)
+            user.updated_at = datetime.datetime.utcnow()
             user.is_active = True
         else:
             user = self.user_model(
@@ -112,11 +105,15 @@ class AuthController:
                 access_token=token.access_token,
                 refresh_token=token.refresh_token,
                 token_expires_at=token.expires_at,
-                scopes=token.scopes
+                scopes=json.dumps(token.scopes)
             )
             self.db.session.add(user)
         
         self.db.session.commit()
+        self.token_manager.store(user.character_id, token.access_token, token.expires_at)
+        # Data cached under the previous token may belong to other scopes; invalidate_tag
+        # commits and rolls back on its own, so it runs after the user row is saved
+        self._invalidate_character(user.character_id)
         
         return {'success': True, 'character_id': char_info['CharacterID']}
     
@@ -132,17 +129,25 @@ class AuthController:
             if user:
                 user.is_active = False
                 self.db.session.commit()
+                self.token_manager.invalidate(character_id)
+                self._invalidate_character(character_id)
                 return {'message': 'Character removed successfully'}
             else:
                 return {'error': 'Character not found'}, 404
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
     
+    def _invalidate_character(self, character_id: int) -> None:
+        """Drop every cache entry tagged with the character (skills, jobs, planets, assets, ...)"""
+        if self.cache_service:
+            self.cache_service.invalidate_tag(f"character:{character_id}")
+    
     def reset_database(self) -> Dict:
         """Reset database (remove all users)"""
         try:
             self.user_model.query.update({'is_active': False})
             self.db.session.commit()
+            self.token_manager.clear()
             return {'message': 'Database reset successfully'}
         except Exception as e:
             return {'error': f'Internal server error: {str(e)}'}, 500
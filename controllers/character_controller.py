@@ -3,20 +3,24 @@ Character Controller
 Handles character-related operations and data retrieval
 """
 
+import time
 from flask import request, jsonify
-from typing import Dict, List
+from typing import Dict, Iterator, List, Optional, Tuple
 from services.esi_data_service import ESIDataService
 from services.business_logic_service import BusinessLogicService
+from services.job_aggregator import JobAggregator, TaskFailed
 from controllers.auth_controller import AuthController
 
 
 class CharacterController:
     """Controller for character operations"""
     
-    def __init__(self, esi_service: ESIDataService, business_logic_service: BusinessLogicService, auth_controller: AuthController):
+    def __init__(self, esi_service: ESIDataService, business_logic_service: BusinessLogicService, auth_controller: AuthController,
+                 job_aggregator: JobAggregator = None):
         self.esi_service = esi_service
         self.business_logic_service = business_logic_service
         self.auth_controller = auth_controller
+        self.job_aggregator = job_aggregator
     
     def get_character_details(self, user) -> Dict:
         """Get detailed character information including activity limits"""
@@ -102,23 +106,66 @@ class CharacterController:
             'portrait_url': f'https://images.evetech.net/characters/{character_id}/portrait?size=128'
         }
     
-    def get_all_jobs(self) -> Dict:
-        """Get all jobs for all characters (legacy endpoint)"""
+    def get_all_jobs(self, include_status: bool = False) -> Dict:
+        """Get all jobs for all characters (legacy endpoint).
+        Characters are fetched concurrently; one that fails or times out is left out of the
+        result instead of failing or delaying the others. include_status adds why, per character"""
         try:
-            from models.user import User
-            users = User.query.filter_by(is_active=True).all()
-            all_jobs = {}
-            
-            for user in users:
-                if not self.auth_controller._refresh_user_token(user):
-                    continue
-                
-                jobs = self.esi_service.get_character_jobs(user.character_id, user.access_token)
-                processed_jobs = self.business_logic_service.process_jobs_data(jobs, user.character_id)
-                
-                all_jobs[str(user.character_id)] = processed_jobs
+            all_jobs, statuses = {}, {}
+            for character_id, status, jobs in self.iter_all_jobs():
+                statuses[character_id] = status
+                if status['status'] == 'ok':
+                    all_jobs[character_id] = jobs
             
+            if include_status:
+                return {
+                    'jobs': all_jobs,
+                    'characters': statuses,
+                    'complete': all(status['status'] == 'ok' for status in statuses.values())
+                }
             return all_jobs
         except Exception as e:
             print(f"Error getting all jobs: {e}")
             return {'error': f'Internal server error: {str(e)}'}, 500
+    
+    def iter_all_jobs(self) -> Iterator[Tuple[str, Dict, Optional[List[Dict]]]]:
+        """(character_id, status, processed jobs) for every active character, as each one completes"""
+        user_model = self.auth_controller.user_model
+        character_ids = [row.character_id for row in
+                         user_model.query.with_entities(user_model.character_id).filter_by(is_active=True).all()]
+        tasks = {str(character_id): self._character_jobs_task(character_id) for character_id in character_ids}
+        
+        if self.job_aggregator:
+            return self.job_aggregator.iter_results(tasks)
+        return self._iter_serially(tasks)
+    
+    def _character_jobs_task(self, character_id: int):
+        """Token refresh, jobs fetch and processing for one character, run on the aggregator"""
+        def task():
+            user = self.auth_controller.get_user_by_character_id(character_id)
+            if not user:
+                raise TaskFailed('not_found', 'Character not found')
+            if not self.auth_controller.refresh_access_token(user):
+                raise TaskFailed('auth_failed', 'Token expired, please re-authenticate')
+            
+            jobs = self.esi_service.get_character_jobs(character_id, user.access_token)
+            return self.business_logic_service.process_jobs_data(jobs, character_id)
+        return task
+    
+    @staticmethod
+    def _iter_serially(tasks: Dict):
+        # Same statuses as JobAggregator: one failing character must not fail the others
+        for key, task in tasks.items():
+            start = time.perf_counter()
+            try:
+                result = task()
+            except TaskFailed as e:
+                yield key, {'status': e.status, 'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+                            'error': e.message}, None
+                continue
+            except Exception as e:
+                print(f"Error getting jobs for character {key}: {e}")
+                yield key, {'status': 'error', 'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+                            'error': str(e)}, None
+                continue
+            yield key, {'status': 'ok', 'duration_ms': round((time.perf_counter() - start) * 1000, 2)}, result
@@ -9,10 +9,10 @@ from services.market_data_service import MarketDataService
 
 
 class IndustryController:
-    def __init__(self):
-        self.esi_service = ESIDataService()
-        self.business_logic = BusinessLogicService()
-        self.market_service = MarketDataService()
+    def __init__(self, esi_service: ESIDataService, business_logic: BusinessLogicService, market_service: MarketDataService):
+        self.esi_service = esi_service
+        self.business_logic = business_logic
+        self.market_service = market_service
     
     def get_character_industry_summary(self, character_id: int, access_token: str) -> Dict:
         """Get comprehensive industry summary for a character"""
@@ -5,7 +5,7 @@ Handles market data operations and price calculations
 
 from flask import request, jsonify
 from typing import Dict, List
-from services.market_data_service import MarketDataService
+from services.market_data_service import MarketDataService, TRADE_HUBS
 
 
 class MarketController:
@@ -14,15 +14,22 @@ class MarketController:
     def __init__(self, market_service: MarketDataService):
         self.market_service = market_service
     
-    def get_type_prices(self, type_id: int, region_id: int = 10000002) -> Dict:
+    def get_type_prices(self, type_id: int, region_id: int = 10000002, location_ids: List[int] = None) -> Dict:
         """Get prices for a specific type"""
         try:
-            prices = self.market_service.get_type_prices(type_id, region_id)
+            prices = self.market_service.get_type_prices(type_id, region_id, location_ids)
             return prices
         except Exception as e:
             print(f"Error getting type prices: {e}")
             return {'error': f'Internal server error: {str(e)}'}, 500
     
+    def get_trade_hubs(self) -> List[Dict]:
+        """List known trade hubs"""
+        return [
+            {'hub': hub, 'region_id': region_id, 'station_id': station_id}
+            for hub, (region_id, station_id) in TRADE_HUBS.items()
+        ]
+    
     def get_market_orders(self, region_id: int, type_id: int = None) -> List[Dict]:
         """Get market orders for a region"""
         try:
@@ -32,6 +39,19 @@ class MarketController:
             print(f"Error getting market orders: {e}")
             return {'error': f'Internal server error: {str(e)}'}, 500
     
+    def get_prices_batch(self, type_ids: List[int], region_id: int = 10000002, location_ids: List[int] = None) -> Dict:
+        """Get prices for many types in a region"""
+        try:
+            prices = self.market_service.get_prices_batch(type_ids, region_id, location_ids)
+            return {
+                'region_id': region_id,
+                'location_ids': location_ids or [],
+                'prices': {str(type_id): price for type_id, price in prices.items()}
+            }
+        except Exception as e:
+            print(f"Error getting batch prices: {e}")
+            return {'error': f'Internal server error: {str(e)}'}, 500
+    
     def get_market_prices(self, region_id: int) -> List[Dict]:
         """Get market prices for a region"""
         try:
@@ -50,6 +70,48 @@ class MarketController:
             print(f"Error calculating market value: {e}")
             return {'error': f'Internal server error: {str(e)}'}, 500
     
+    def value_items(self, items: List, region_id: int = 10000002, location_ids: List[int] = None) -> Dict:
+        """Value a list of (type_id, quantity) pairs against order book depth"""
+        try:
+            valuation = self.market_service.value_items(items, region_id, location_ids)
+            return valuation
+        except Exception as e:
+            print(f"Error valuing items: {e}")
+            return {'error': f'Internal server error: {str(e)}'}, 500
+    
+    def get_historical_prices(self, type_id: int, region_id: int = 10000002, days: int = None) -> List[Dict]:
+        """Get daily price history for a type"""
+        try:
+            history = self.market_service.get_historical_prices(type_id, region_id, days)
+            return history
+        except Exception as e:
+            print(f"Error getting historical prices: {e}")
+            return {'error': f'Internal server error: {str(e)}'}, 500
+    
+    def refresh_history(self, type_ids: List[int], region_id: int = 10000002) -> Dict:
+        """Ingest new market history days for many types"""
+        try:
+            added = self.market_service.refresh_history(type_ids, region_id)
+            return {
+                'region_id': region_id,
+                'rows_added': {str(type_id): count for type_id, count in added.items()}
+            }
+        except Exception as e:
+            print(f"Error refreshing market history: {e}")
+            return {'error': f'Internal server error: {str(e)}'}, 500
+    
+    def get_price_statistics(self, type_ids: List[int], region_id: int = 10000002) -> Dict:
+        """Get rolling price statistics for many types"""
+        try:
+            statistics = self.market_service.get_price_statistics(type_ids, region_id)
+            return {
+                'region_id': region_id,
+                'statistics': {str(type_id): entry for type_id, entry in statistics.items()}
+            }
+        except Exception as e:
+            print(f"Error getting price statistics: {e}")
+            return {'error': f'Internal server error: {str(e)}'}, 500
+    
     def get_region_info(self, region_id: int) -> Dict:
         """Get region information"""
         try:
@@ -44,12 +44,7 @@ export class DataLoader {
   }
 
   async makeRequest(url, options = {}) {
-    // Ограничиваем количество одновременных запросов
-    while (this.activeRequests >= this.concurrentLimit) {
-      await new Promise((resolve) => setTimeout(resolve, 100));
-    }
-
-    this.activeRequests++;
+    await this.acquireSlot();
 
     try {
       const response = await fetch(url, {
@@ -67,6 +62,77 @@ export class DataLoader {
     }
   }
 
+  // Потоковая загрузка NDJSON: onRecord вызывается для каждой строки сразу по ее получении,
+  // не дожидаясь конца ответа. Полный ответ кэшируется как массив записей;
+  // при попадании в кэш записи передаются в onRecord сразу
+  async stream(url, onRecord, options = {}) {
+    const cacheKey = this.getCacheKey(url, options);
+
+    if (this.cache.has(cacheKey)) {
+      const cached = this.cache.get(cacheKey);
+      if (Date.now() - cached.timestamp < this.cacheTimeout) {
+        cached.data.forEach((record) => onRecord(record));
+        return cached.data;
+      }
+      this.cache.delete(cacheKey);
+    }
+
+    await this.acquireSlot();
+
+    try {
+      const response = await fetch(url, {
+        ...options,
+        headers: { Accept: "application/x-ndjson", ...options.headers },
+        signal: AbortSignal.timeout(options.timeout || 120000),
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+      }
+
+      const records = [];
+      const emit = (line) => {
+        if (!line.trim()) return;
+        const record = JSON.parse(line);
+        records.push(record);
+        onRecord(record);
+      };
+
+      if (!response.body) {
+        // Браузер без ReadableStream: разбираем ответ целиком
+        (await response.text()).split("\n").forEach(emit);
+      } else {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        for (;;) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split("\n");
+          buffer = lines.pop();
+          lines.forEach(emit);
+        }
+        emit(buffer + decoder.decode());
+      }
+
+      // Кэшируем только полностью полученный ответ
+      this.setCache(cacheKey, records);
+      return records;
+    } finally {
+      this.activeRequests--;
+    }
+  }
+
+  // Ограничиваем количество одновременных запросов
+  async acquireSlot() {
+    while (this.activeRequests >= this.concurrentLimit) {
+      await new Promise((resolve) => setTimeout(resolve, 100));
+    }
+
+    this.activeRequests++;
+  }
+
   getCacheKey(url, options) {
     const params = new URLSearchParams(options.params || {});
     return `${url}?${params.toString()}`;
@@ -20,7 +20,9 @@ class CacheEntry:
             
             id = self.db.Column(self.db.Integer, primary_key=True)
             cache_key = self.db.Column(self.db.String(255), unique=True, nullable=False, index=True)
-            cache_data = self.db.Column(self.db.Text, nullable=False)  # JSON string
+            cache_data = self.db.Column(self.db.Text, nullable=True)  # Legacy JSON string
+            cache_blob = self.db.Column(self.db.LargeBinary, nullable=True)  # CacheCodec encoded payload
+            etag = self.db.Column(self.db.String(255), nullable=True)  # ESI ETag for conditional refreshes
             expires_at = self.db.Column(self.db.DateTime, nullable=False, index=True)
             created_at = self.db.Column(self.db.DateTime, default=datetime.utcnow)
             
@@ -31,6 +33,7 @@ class CacheEntry:
                 return {
                     'id': self.id,
                     'cache_key': self.cache_key,
+                    'etag': self.etag,
                     'expires_at': self.expires_at.isoformat() if self.expires_at else None,
                     'created_at': self.created_at.isoformat() if self.created_at else None
                 }
@@ -0,0 +1,27 @@
+"""
+Cache Tag Model
+Database model for the tags attached to cache entries
+"""
+
+from flask_sqlalchemy import SQLAlchemy
+
+
+class CacheTag:
+    """Cache tag model: one row per (cache key, tag) for invalidating groups of entries"""
+    
+    def __init__(self, db: SQLAlchemy):
+        self.db = db
+        self.model = self._create_model()
+    
+    def _create_model(self):
+        class CacheTagModel(self.db.Model):
+            __tablename__ = 'cache_tags'
+            
+            # Tags such as character:90000001, region:10000002 or namespace:jobs
+            cache_key = self.db.Column(self.db.String(255), primary_key=True)
+            tag = self.db.Column(self.db.String(255), primary_key=True, index=True)
+            
+            def __repr__(self):
+                return f'<CacheTag {self.tag} {self.cache_key}>'
+        
+        return CacheTagModel
@@ -24,11 +24,13 @@ class MarketData:
             buy_price = self.db.Column(self.db.Float, nullable=True)
             sell_price = self.db.Column(self.db.Float, nullable=True)
             volume = self.db.Column(self.db.BigInteger, nullable=True)
+            buy_volume = self.db.Column(self.db.BigInteger, nullable=True)
+            sell_volume = self.db.Column(self.db.BigInteger, nullable=True)
             updated_at = self.db.Column(self.db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
             
-            # Composite index for type_id and region_id
+            # Composite index for type_id and region_id, unique so snapshots can upsert on it
             __table_args__ = (
-                self.db.Index('ix_market_data_type_region', 'type_id', 'region_id'),
+                self.db.Index('ix_market_data_type_region', 'type_id', 'region_id', unique=True),
             )
             
             def __repr__(self):
@@ -42,6 +44,8 @@ class MarketData:
                     'buy_price': self.buy_price,
                     'sell_price': self.sell_price,
                     'volume': self.volume,
+                    'buy_volume': self.buy_volume,
+                    'sell_volume': self.sell_volume,
                     'updated_at': self.updated_at.isoformat() if self.updated_at else None
                 }
         
@@ -0,0 +1,43 @@
+"""
+Market History Model
+Database model for daily market history
+"""
+
+from flask_sqlalchemy import SQLAlchemy
+
+
+class MarketHistory:
+    """Market history model for storing one row per region, type and day"""
+    
+    def __init__(self, db: SQLAlchemy):
+        self.db = db
+        self.model = self._create_model()
+    
+    def _create_model(self):
+        class MarketHistoryModel(self.db.Model):
+            __tablename__ = 'market_history'
+            
+            # The natural key doubles as the primary key, no surrogate id
+            region_id = self.db.Column(self.db.Integer, primary_key=True)
+            type_id = self.db.Column(self.db.Integer, primary_key=True)
+            date = self.db.Column(self.db.Date, primary_key=True)
+            average = self.db.Column(self.db.Float, nullable=False)
+            highest = self.db.Column(self.db.Float, nullable=False)
+            lowest = self.db.Column(self.db.Float, nullable=False)
+            order_count = self.db.Column(self.db.BigInteger, nullable=False)
+            volume = self.db.Column(self.db.BigInteger, nullable=False)
+            
+            def __repr__(self):
+                return f'<MarketHistory {self.type_id} in {self.region_id} on {self.date}>'
+            
+            def to_dict(self):
+                return {
+                    'date': self.date.isoformat(),
+                    'average': self.average,
+                    'highest': self.highest,
+                    'lowest': self.lowest,
+                    'order_count': self.order_count,
+                    'volume': self.volume
+                }
+        
+        return MarketHistoryModel
@@ -0,0 +1,48 @@
+"""
+Bulk Upsert
+Dialect-aware INSERT ... ON CONFLICT DO UPDATE for many rows at once
+"""
+
+from typing import Dict, List
+
+from flask_sqlalchemy import SQLAlchemy
+
+
+def bulk_upsert(db: SQLAlchemy, model, rows: List[Dict], index_elements: List[str]) -> None:
+    """Insert rows, updating every other column when the unique key already exists.
+    Rows that only hold key columns are inserted unless they already exist.
+    
+    Runs as a single executemany statement on PostgreSQL and SQLite. Other
+    dialects fall back to deleting the conflicting keys and inserting. The
+    caller owns the transaction (commit/rollback).
+    """
+    if not rows:
+        return
+    
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+    
+    if insert is None:
+        for row in rows:
+            db.session.execute(table.delete().where(
+                *[table.c[column] == row[column] for column in index_elements]
+            ))
+        db.session.execute(table.insert(), rows)
+        return
+    
+    statement = insert(table)
+    update_columns = [column for column in rows[0] if column not in index_elements]
+    if update_columns:
+        statement = statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    db.session.execute(statement, rows)
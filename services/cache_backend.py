@@ -0,0 +1,94 @@
+"""
+Cache Backend
+Interface of the hot cache tier and the factory that picks one from the environment
+"""
+
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+class CacheBackend(ABC):
+    """Hot tier in front of the cache_entries table.
+    
+    Entries are (data, expires_at timestamp, etag) and are kept after they expire,
+    so their ETag and stale data stay available until evicted or cleared.
+    """
+    
+    name = 'backend'
+    on_evict = None  # Optional callback(key) for every entry evicted by the size limits
+    
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Fresh data for key, or None. Counts a hit or a miss"""
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Fresh data for the keys that have it"""
+        result = {}
+        for key in keys:
+            data = self.get(key)
+            if data is not None:
+                result[key] = data
+        return result
+    
+    @abstractmethod
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float, str]]:
+        """(data, expires_at, etag) regardless of expiry, without touching the counters"""
+    
+    @abstractmethod
+    def set(self, key: str, data: Any, expires_at: float, etag: str = None, size: int = 0,
+            blob: bytes = None) -> None:
+        """Store an entry. size is the approximate payload size in bytes; blob is the
+        same data already encoded by CacheCodec, for backends that store bytes"""
+    
+    def set_many(self, entries: Iterable[Tuple[str, Any, float, Optional[str], int, Optional[bytes]]]) -> None:
+        """set for many (key, data, expires_at, etag, size, blob) entries"""
+        for entry in entries:
+            self.set(*entry)
+    
+    @abstractmethod
+    def touch(self, key: str, expires_at: float) -> None:
+        """Move an entry's expiry without replacing its data"""
+    
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+    
+    def delete_many(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.delete(key)
+    
+    @abstractmethod
+    def clear_expired(self) -> int:
+        """Drop expired entries, returns how many were removed"""
+    
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+    
+    @abstractmethod
+    def stats(self) -> Dict:
+        pass
+
+
+def create_cache_backend(name: str = 'cache', codec=None, max_entries: int = 50000,
+                         max_bytes: int = 128 * 1024 * 1024) -> CacheBackend:
+    """Backend selected by CACHE_BACKEND: 'memory' (per process, default) or 'sqlite'.
+    
+    The sqlite backend is one WAL database file per host, in CACHE_SHARED_DIR
+    (/dev/shm when available), shared by every worker process. name keeps the
+    files of different applications apart.
+    """
+    from .memory_cache import MemoryCache
+    from .shared_cache import SharedCache
+    
+    backend = os.environ.get('CACHE_BACKEND', 'memory').lower()
+    if backend == 'memory':
+        return MemoryCache(max_entries, max_bytes)
+    if backend == 'sqlite':
+        directory = os.environ.get('CACHE_SHARED_DIR') or (
+            '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+        path = os.path.join(directory, f'eve-profitmaster-{name}.sqlite')
+        return SharedCache(path, codec, max_entries, max_bytes)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,92 @@
+"""
+Cache Codec
+Binary encoding for cache payloads with optional compression
+"""
+
+import json
+import zlib
+from typing import Any, Tuple
+
+import msgpack
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, zlib is always available
+    zstandard = None
+
+
+class CacheCodec:
+    """Encodes JSON-compatible data as MessagePack, compressed above a size threshold.
+    
+    Every blob starts with one format byte so the encoding can change without
+    breaking rows that are already stored:
+        
+        0x01  msgpack
+        0x02  msgpack + zlib
+        0x03  msgpack + zstd
+    
+    Rows written before the codec existed have no blob and are read as JSON text.
+    """
+    
+    MSGPACK = 0x01
+    MSGPACK_ZLIB = 0x02
+    MSGPACK_ZSTD = 0x03
+    
+    def __init__(self, compression: str = None, threshold: int = 1024, level: int = 3):
+        if compression is None:
+            compression = 'zstd' if zstandard else 'zlib'
+        if compression == 'zstd' and not zstandard:
+            raise ValueError("zstd compression requires the zstandard package")
+        if compression not in ('zstd', 'zlib', 'none'):
+            raise ValueError(f"Unknown cache compression: {compression}")
+        
+        self.compression = compression
+        self.threshold = threshold
+        self.level = level
+        if zstandard:
+            self.zstd_compressor = zstandard.ZstdCompressor(level=level)
+            self.zstd_decompressor = zstandard.ZstdDecompressor()
+    
+    def encode(self, data: Any) -> Tuple[bytes, int]:
+        """(blob, uncompressed size) for data"""
+        try:
+            raw = msgpack.packb(data, use_bin_type=True)
+        except TypeError:
+            # Values msgpack doesn't know (e.g. numpy integers): normalise through JSON like the text format did
+            raw = msgpack.packb(json.loads(json.dumps(data, default=self._json_default)), use_bin_type=True)
+        if self.compression == 'none' or len(raw) < self.threshold:
+            return bytes([self.MSGPACK]) + raw, len(raw)
+        if self.compression == 'zstd':
+            return bytes([self.MSGPACK_ZSTD]) + self.zstd_compressor.compress(raw), len(raw)
+        return bytes([self.MSGPACK_ZLIB]) + zlib.compress(raw, self.level), len(raw)
+    
+    def decode(self, blob: bytes) -> Any:
+        """Data from a blob written by encode, with any past or present format byte"""
+        return self.decode_sized(blob)[0]
+    
+    def decode_sized(self, blob: bytes) -> Tuple[Any, int]:
+        """(data, uncompressed size) for a blob, the same size encode reports"""
+        blob = bytes(blob)
+        format_byte, body = blob[0], blob[1:]
+        if format_byte == self.MSGPACK:
+            raw = body
+        elif format_byte == self.MSGPACK_ZLIB:
+            raw = zlib.decompress(body)
+        elif format_byte == self.MSGPACK_ZSTD:
+            if not zstandard:
+                raise ValueError("Cache entry is zstd compressed but zstandard is not installed")
+            raw = self.zstd_decompressor.decompress(body)
+        else:
+            raise ValueError(f"Unknown cache blob format {format_byte}")
+        return self._unpack(raw), len(raw)
+    
+    @staticmethod
+    def _unpack(raw: bytes) -> Any:
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    
+    @staticmethod
+    def _json_default(value: Any) -> Any:
+        # numpy scalars and arrays expose item()/tolist()
+        if hasattr(value, 'tolist'):
+            return value.tolist()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
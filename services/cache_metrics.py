@@ -0,0 +1,107 @@
+"""
+Cache Metrics
+Per-namespace cache counters with JSON and Prometheus text output
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+
+COUNTERS = ('hits', 'misses', 'negative_hits', 'negative_sets', 'sets', 'bytes_written',
+            'evictions', 'fills', 'fill_ms')
+
+# name, help text; exported as eve_cache_<name>_total{namespace="..."}
+PROMETHEUS_COUNTERS = (
+    ('hits', 'Lookups answered from any cache tier'),
+    ('misses', 'Lookups that found no fresh entry'),
+    ('negative_hits', 'Hits on a cached failed lookup'),
+    ('negative_sets', 'Failed lookups cached negatively'),
+    ('sets', 'Entries written'),
+    ('bytes_written', 'Encoded bytes written'),
+    ('evictions', 'Entries evicted from the hot tier'),
+    ('fills', 'Loader runs after a miss'),
+)
+
+
+def namespace_of(key: str) -> str:
+    """Key prefix up to its first id: planet_details_1_2 -> planet_details, market_orders_1_all -> market_orders"""
+    prefix = []
+    for part in key.split('_'):
+        if part.isdigit() or part == 'all':
+            break
+        prefix.append(part)
+    return '_'.join(prefix) or key
+
+
+class CacheMetrics:
+    """Hits, misses, writes, evictions and fill latency per key namespace (counted per process)"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.namespaces = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+        self.max_fill_ms = defaultdict(float)
+    
+    def count(self, key: str, counter: str, amount: int = 1) -> None:
+        with self.lock:
+            self.namespaces[namespace_of(key)][counter] += amount
+    
+    def count_lookups(self, keys, found) -> None:
+        """hits for the keys in found, misses for the rest"""
+        with self.lock:
+            for key in keys:
+                self.namespaces[namespace_of(key)]['hits' if key in found else 'misses'] += 1
+    
+    def fill(self, key: str, elapsed_ms: float) -> None:
+        """Record one loader run and how long it took"""
+        namespace = namespace_of(key)
+        with self.lock:
+            counters = self.namespaces[namespace]
+            counters['fills'] += 1
+            counters['fill_ms'] += elapsed_ms
+            self.max_fill_ms[namespace] = max(self.max_fill_ms[namespace], elapsed_ms)
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """Counters per namespace with derived hit rate, fill latency and entry size"""
+        with self.lock:
+            namespaces = {namespace: dict(counters) for namespace, counters in self.namespaces.items()}
+            max_fill_ms = dict(self.max_fill_ms)
+        
+        for namespace, counters in namespaces.items():
+            lookups = counters['hits'] + counters['misses']
+            counters['hit_rate'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+            counters['avg_fill_ms'] = round(counters['fill_ms'] / counters['fills'], 2) if counters['fills'] else 0.0
+            counters['max_fill_ms'] = round(max_fill_ms.get(namespace, 0.0), 2)
+            counters['fill_ms'] = round(counters['fill_ms'], 2)
+            counters['avg_entry_bytes'] = counters['bytes_written'] // counters['sets'] if counters['sets'] else 0
+        return dict(sorted(namespaces.items()))
+    
+    def totals(self) -> Dict:
+        """Lookup counters summed over all namespaces"""
+        with self.lock:
+            totals = {counter: sum(counters[counter] for counters in self.namespaces.values())
+                      for counter in ('hits', 'misses', 'negative_hits', 'negative_sets')}
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+        return totals
+    
+    def prometheus(self, gauges: Dict[str, float] = None) -> str:
+        """Prometheus text exposition (format 0.0.4) of the counters plus optional tier gauges"""
+        namespaces = self.snapshot()
+        lines: List[str] = []
+        for counter, help_text in PROMETHEUS_COUNTERS:
+            name = f"eve_cache_{counter}_total"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for namespace, counters in namespaces.items():
+                lines.append(f'{name}{{namespace="{namespace}"}} {counters[counter]}')
+        
+        lines.append("# HELP eve_cache_fill_seconds_total Time spent in loaders after a miss")
+        lines.append("# TYPE eve_cache_fill_seconds_total counter")
+        for namespace, counters in namespaces.items():
+            lines.append(f'eve_cache_fill_seconds_total{{namespace="{namespace}"}} {counters["fill_ms"] / 1000:.6f}')
+        
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE eve_cache_{name} gauge")
+            lines.append(f"eve_cache_{name} {value}")
+        return '\n'.join(lines) + '\n'
@@ -5,120 +5,588 @@ Handles data caching with both memory and database storage
 
 import json
 import time
+import hashlib
 import datetime
-from typing import Optional, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Any, Tuple, Dict, Iterable, Callable
 from flask_sqlalchemy import SQLAlchemy
-from models.cache_entry import CacheEntry
+from sqlalchemy import text, select, delete
+from .memory_cache import MemoryCache
+from .cache_backend import CacheBackend
+from .cache_writer import CacheWriter, write_rows
+from .cache_codec import CacheCodec
+from .cache_sweeper import CacheSweeper
+from .cache_metrics import CacheMetrics, namespace_of
+
+
+# get(key, MISS) tells an absent key apart from a cached None, [] or {}
+MISS = object()
+# Negative entries are stored as {NEGATIVE: placeholder} and read back as the placeholder
+NEGATIVE = '__negative__'
 
 
 class CacheService:
     """Service for managing data caching"""
     
-    def __init__(self, db: SQLAlchemy):
+    def __init__(self, db: SQLAlchemy, cache_entry_model, max_memory_entries: int = 50000,
+                 max_memory_bytes: int = 128 * 1024 * 1024, codec: CacheCodec = None,
+                 backend: CacheBackend = None, cache_tag_model=None):
         self.db = db
-        self.memory_cache = {}
+        self.model = cache_entry_model
+        self.tag_model = cache_tag_model  # Without it entries are stored untagged
+        self.codec = codec or CacheCodec()
+        # Hot tier: per-process memory unless a shared backend is passed in
+        self.backend = backend if backend is not None else MemoryCache(max_memory_entries, max_memory_bytes)
+        self.backend.on_evict = lambda key: self.metrics.count(key, 'evictions')
+        self.writer = None  # CacheWriter when write-behind is enabled
+        self.sweeper = None  # CacheSweeper when scheduled expiry is enabled
         self.cache_duration = 3600  # 1 hour default
+        self.negative_ttl = 300  # failed lookups are retried after 5 minutes
+        self.metrics = CacheMetrics()
+        self.app = None
+        # Single-flight: one loader per key, per process and (on PostgreSQL) across processes
+        self.flight_locks = {}  # key -> [lock, users]
+        self.flight_guard = threading.Lock()
+        self.refreshing = set()
+        self.refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-refresh')
+        self.load_wait_timeout = 10.0
+        self.flight_stats = {'loads': 0, 'waited': 0, 'shared': 0, 'stale_served': 0,
+                             'background_refreshes': 0, 'advisory_waits': 0}
     
-    def get(self, key: str) -> Optional[Any]:
-        """Get data from cache"""
-        # Check memory cache first
-        if key in self.memory_cache:
-            data, timestamp = self.memory_cache[key]
-            if time.time() - timestamp < self.cache_duration:
+    def init_app(self, app) -> None:
+        """Remember the app so background refreshes can run inside its context"""
+        self.app = app
+    
+    def enable_write_behind(self, app, **options) -> None:
+        """Persist sets from a background thread instead of committing in the request"""
+        self.app = app
+        self.writer = CacheWriter(app, self.db, self.model, self.tag_model, **options)
+        self.writer.start()
+    
+    def enable_sweeper(self, app, **options) -> None:
+        """Delete expired rows on a schedule (see CacheSweeper)"""
+        self.sweeper = CacheSweeper(app, self, **options)
+        self.sweeper.start()
+    
+    def get_or_load(self, key: str, loader: Callable[[], Any], stale_while_revalidate: int = 0,
+                    missed: bool = False) -> Any:
+        """Get key, or run loader once for all concurrent callers that miss it.
+        
+        loader must fetch and store the value (as ESIClient.get does) and return it.
+        With stale_while_revalidate=N an entry that expired less than N seconds ago is
+        returned immediately while a single background refresh replaces it.
+        Pass missed=True when the caller has just looked the key up itself and missed.
+        """
+        if not missed:
+            # Uncounted, like the caller's own lookup would have been
+            data = self._get(key)
+            if data is not None:
+                return self._unwrap(key, data)
+        
+        if stale_while_revalidate and self.app:
+            entry = self._stale_entry(key)
+            if entry and time.time() < entry[1] + stale_while_revalidate:
+                self._refresh_in_background(key, loader)
+                self.flight_stats['stale_served'] += 1
+                return self._unwrap(key, entry[0])
+        
+        return self._load_once(key, loader)
+    
+    def _load_once(self, key: str, loader: Callable[[], Any]) -> Any:
+        with self._key_lock(key) as waited:
+            if waited:
+                # Another thread just loaded it
+                data = self._get(key)
+                if data is not None:
+                    self.flight_stats['shared'] += 1
+                    return self._unwrap(key, data)
+            
+            with self._advisory_lock(key) as acquired:
+                if not acquired:
+                    # Another worker holds the key; poll for its result before loading ourselves
+                    self.flight_stats['advisory_waits'] += 1
+                    deadline = time.time() + self.load_wait_timeout
+                    while time.time() < deadline:
+                        time.sleep(0.1)
+                        data = self._get(key)
+                        if data is not None:
+                            self.flight_stats['shared'] += 1
+                            return self._unwrap(key, data)
+                
+                self.flight_stats['loads'] += 1
+                start = time.perf_counter()
+                try:
+                    data = loader()
+                finally:
+                    # Failed loads count too: a slow failing upstream is what this should show
+                    self.metrics.fill(key, (time.perf_counter() - start) * 1000)
+                if self.writer and self._is_postgres():
+                    # Workers waiting on the advisory lock read the database, make this row visible first
+                    self.writer.flush_keys([key])
                 return data
-            else:
-                del self.memory_cache[key]
+    
+    def _refresh_in_background(self, key: str, loader: Callable[[], Any]) -> None:
+        with self.flight_guard:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        self.flight_stats['background_refreshes'] += 1
+        
+        def refresh():
+            try:
+                with self.app.app_context():
+                    self._load_once(key, loader)
+            except Exception as e:
+                print(f"Error refreshing cache key {key}: {e}")
+            finally:
+                with self.flight_guard:
+                    self.refreshing.discard(key)
+        
+        self.refresh_executor.submit(refresh)
+    
+    @contextmanager
+    def _key_lock(self, key: str):
+        """Per-key lock shared by the threads of this process; yields whether we had to wait"""
+        with self.flight_guard:
+            entry = self.flight_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        
+        waited = not entry[0].acquire(blocking=False)
+        if waited:
+            self.flight_stats['waited'] += 1
+            acquired = entry[0].acquire(timeout=self.load_wait_timeout)
+        else:
+            acquired = True
+        try:
+            yield waited
+        finally:
+            if acquired:
+                entry[0].release()
+            with self.flight_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.flight_locks[key]
+    
+    @contextmanager
+    def _advisory_lock(self, key: str):
+        """PostgreSQL session advisory lock for key; yields True when held (always on other databases)"""
+        if not self._is_postgres():
+            yield True
+            return
+        
+        lock_id = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big', signed=True)
+        # A dedicated connection: the session's connection goes back to the pool on every commit
+        with self.db.engine.connect() as connection:
+            try:
+                locked = bool(connection.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': lock_id}).scalar())
+                failed = False
+            except Exception as e:
+                print(f"Error taking advisory lock for {key}: {e}")
+                locked, failed = False, True
+            try:
+                # If the lock itself failed, load without it rather than wait for nothing
+                yield locked or failed
+            finally:
+                if locked:
+                    connection.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': lock_id})
+    
+    def _is_postgres(self) -> bool:
+        return self.db.engine.dialect.name == 'postgresql'
+    
+    def _stale_entry(self, key: str) -> Optional[Tuple[Any, float]]:
+        """(data, expires_at timestamp) regardless of expiry"""
+        entry = self.backend.get_entry(key)
+        if entry:
+            return entry[0], entry[1]
+        
+        row = self._pending_row(key)
+        if row:
+            return self.codec.decode(row['cache_blob']), self._to_timestamp(row['expires_at'])
         
-        # Check database cache
         try:
-            cache_entry = CacheEntry.query.filter_by(cache_key=key).first()
+            cache_entry = self.model.query.filter_by(cache_key=key).first()
+            if cache_entry:
+                return self._load(cache_entry)[0], self._to_timestamp(cache_entry.expires_at)
+        except Exception as e:
+            print(f"Error getting stale entry from cache: {e}")
+        return None
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get data from cache, or default when there is no fresh entry.
+        
+        Pass MISS as default to treat cached empty values ([], {}, 0) as hits. A
+        negative entry (see set_negative) returns the placeholder it was stored with.
+        """
+        data = self._get(key)
+        if data is None:
+            self.metrics.count(key, 'misses')
+            return default
+        self.metrics.count(key, 'hits')
+        return self._unwrap(key, data)
+    
+    def _get(self, key: str) -> Optional[Any]:
+        # Check memory cache first
+        data = self.backend.get(key)
+        if data is not None:
+            return data
+        
+        # A row that was evicted from memory may still be waiting for the writer
+        row = self._pending_row(key)
+        if row:
+            if row['expires_at'] > datetime.datetime.utcnow():
+                return self.codec.decode(row['cache_blob'])
+            return None
+        
+        # Check database cache. Expired rows are kept: their ETag is still
+        # useful for a conditional refresh (see get_stale).
+        try:
+            cache_entry = self.model.query.filter_by(cache_key=key).first()
             if cache_entry and cache_entry.expires_at > datetime.datetime.utcnow():
-                data = json.loads(cache_entry.cache_data)
+                data, size = self._load(cache_entry)
                 # Store in memory cache for faster access
-                self.memory_cache[key] = (data, time.time())
+                self.backend.set(key, data, self._to_timestamp(cache_entry.expires_at), cache_entry.etag, size,
+                                 cache_entry.cache_blob)
                 return data
-            elif cache_entry:
-                # Expired entry, remove it
-                self.db.session.delete(cache_entry)
-                self.db.session.commit()
         except Exception as e:
             print(f"Error getting from cache: {e}")
         
         return None
     
-    def set(self, key: str, data: Any, ttl: int = None) -> None:
-        """Set data in cache"""
-        if ttl is None:
-            ttl = self.cache_duration
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get fresh data for many keys; memory first, then a single IN query for the rest.
         
-        # Store in memory cache
-        self.memory_cache[key] = (data, time.time())
+        Keys without a fresh entry are absent from the result; negative entries map to their placeholder.
+        """
+        keys = set(keys)
+        result = self.backend.get_many(keys)
+        missing = [key for key in keys if key not in result and not self._pending_into(key, result, fresh_only=True)]
+        if not missing:
+            return self._count_many(keys, result)
         
-        # Store in database cache
         try:
-            expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
-            
-            # Remove existing entry if it exists
-            existing_entry = CacheEntry.query.filter_by(cache_key=key).first()
-            if existing_entry:
-                self.db.session.delete(existing_entry)
-            
-            # Create new entry
-            cache_entry = CacheEntry(
-                cache_key=key,
-                cache_data=json.dumps(data),
-                expires_at=expires_at
-            )
-            self.db.session.add(cache_entry)
+            cache_entries = self.model.query.filter(
+                self.model.cache_key.in_(missing),
+                self.model.expires_at > datetime.datetime.utcnow()
+            ).all()
+            promoted = []
+            for cache_entry in cache_entries:
+                data, size = self._load(cache_entry)
+                promoted.append((cache_entry.cache_key, data, self._to_timestamp(cache_entry.expires_at),
+                                 cache_entry.etag, size, cache_entry.cache_blob))
+                result[cache_entry.cache_key] = data
+            self.backend.set_many(promoted)
+        except Exception as e:
+            print(f"Error getting many from cache: {e}")
+        
+        return self._count_many(keys, result)
+    
+    def _count_many(self, keys, result: Dict[str, Any]) -> Dict[str, Any]:
+        self.metrics.count_lookups(keys, result)
+        for key, data in result.items():
+            result[key] = self._unwrap(key, data)
+        return result
+    
+    def get_stale(self, key: str) -> Optional[Tuple[Any, str]]:
+        """Get cached data and its ETag regardless of expiry, for conditional refreshes"""
+        entry = self.backend.get_entry(key)
+        if entry and entry[2]:
+            return entry[0], entry[2]
+        
+        row = self._pending_row(key)
+        if row:
+            return (self.codec.decode(row['cache_blob']), row['etag']) if row['etag'] else None
+        
+        try:
+            cache_entry = self.model.query.filter_by(cache_key=key).first()
+            if cache_entry and cache_entry.etag:
+                return self._load(cache_entry)[0], cache_entry.etag
+        except Exception as e:
+            print(f"Error getting stale entry from cache: {e}")
+        
+        return None
+    
+    def get_stale_many(self, keys: Iterable[str]) -> Dict[str, Tuple[Any, str]]:
+        """get_stale for many keys with at most one database query"""
+        result = {}
+        missing = []
+        for key in set(keys):
+            entry = self.backend.get_entry(key)
+            if entry and entry[2]:
+                result[key] = (entry[0], entry[2])
+            else:
+                missing.append(key)
+        
+        missing = [key for key in missing if not self._pending_into(key, result, fresh_only=False)]
+        if not missing:
+            return result
+        
+        try:
+            cache_entries = self.model.query.filter(
+                self.model.cache_key.in_(missing),
+                self.model.etag.isnot(None)
+            ).all()
+            for cache_entry in cache_entries:
+                result[cache_entry.cache_key] = (self._load(cache_entry)[0], cache_entry.etag)
+        except Exception as e:
+            print(f"Error getting stale entries from cache: {e}")
+        
+        return result
+    
+    def set(self, key: str, data: Any, ttl: int = None, etag: str = None, tags: Iterable[str] = None) -> None:
+        """Set data in cache; tags (e.g. character:{id}, region:{id}) group it for invalidate_tag"""
+        self.set_many([(key, data, ttl, etag, tags)])
+    
+    def set_many(self, items: Iterable[Tuple]) -> None:
+        """Set many (key, data, ttl, etag[, tags]) entries with one upsert and one commit"""
+        rows = {}
+        hot = {}
+        now = datetime.datetime.utcnow()
+        for key, data, ttl, etag, *tags in items:
+            if ttl is None:
+                ttl = self.cache_duration
+            blob, size = self.codec.encode(data)
+            self.metrics.count(key, 'sets')
+            self.metrics.count(key, 'bytes_written', len(blob))
+            hot[key] = (key, data, time.time() + ttl, etag, size, blob)
+            # Last write wins for repeated keys, ON CONFLICT cannot touch a row twice
+            rows[key] = {
+                'cache_key': key,
+                'cache_data': None,
+                'cache_blob': blob,
+                'etag': etag,
+                'expires_at': now + datetime.timedelta(seconds=ttl),
+                'created_at': now,
+                'tags': self._tags(key, tags[0] if tags else None)
+            }
+        
+        if not rows:
+            return
+        self.backend.set_many(hot.values())
+        
+        # Write-behind: memory is already updated, the writer persists the rows later
+        if self.writer and self.writer.put(list(rows.values())):
+            return
+        
+        try:
+            write_rows(self.db, self.model, self.tag_model, list(rows.values()))
             self.db.session.commit()
         except Exception as e:
+            self.db.session.rollback()
             print(f"Error setting cache: {e}")
     
+    def set_negative(self, key: str, placeholder: Any = None, ttl: int = None, tags: Iterable[str] = None) -> None:
+        """Remember a failed lookup for ttl (negative_ttl by default) so it is not retried on every request"""
+        self.set_negative_many([(key, placeholder)], ttl, tags)
+    
+    def set_negative_many(self, items: Iterable[Tuple[str, Any]], ttl: int = None, tags: Iterable[str] = None) -> None:
+        """set_negative for many (key, placeholder) pairs in one write"""
+        entries = [(key, {NEGATIVE: placeholder}, ttl or self.negative_ttl, None, tags) for key, placeholder in items]
+        for entry in entries:
+            self.metrics.count(entry[0], 'negative_sets')
+        self.set_many(entries)
+    
+    def invalidate_tag(self, tag: str) -> int:
+        """Drop every entry carrying tag from all tiers. Returns the number of keys dropped.
+        
+        The database rows go in one DELETE driven by the cache_tags tag index. Only
+        this process's memory tier is cleared; a shared backend is cleared for all.
+        """
+        if self.tag_model is None:
+            return 0
+        
+        keys = set(self.writer.discard_tag(tag)) if self.writer else set()
+        tagged = select(self.tag_model.cache_key).where(self.tag_model.tag == tag)
+        try:
+            keys.update(self.db.session.execute(tagged).scalars())
+            self.db.session.execute(delete(self.model).where(self.model.cache_key.in_(tagged.scalar_subquery())),
+                                    execution_options={'synchronize_session': False})
+            # All tags of the dropped keys, not only this one
+            self.db.session.execute(delete(self.tag_model).where(self.tag_model.cache_key.in_(tagged.scalar_subquery())),
+                                    execution_options={'synchronize_session': False})
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Error invalidating cache tag {tag}: {e}")
+        
+        self.backend.delete_many(keys)
+        return len(keys)
+    
+    def touch(self, key: str, ttl: int) -> None:
+        """Extend the lifetime of an entry without rewriting its data (e.g. after a 304)"""
+        self.backend.touch(key, time.time() + ttl)
+        
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl)
+        if self.writer and self.writer.touch(key, expires_at):
+            return
+        
+        try:
+            self.model.query.filter_by(cache_key=key).update({'expires_at': expires_at})
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Error touching cache: {e}")
+    
     def delete(self, key: str) -> None:
         """Delete data from cache"""
         # Remove from memory cache
-        if key in self.memory_cache:
-            del self.memory_cache[key]
+        self.backend.delete(key)
+        if self.writer:
+            self.writer.discard(key)
         
         # Remove from database cache
         try:
-            cache_entry = CacheEntry.query.filter_by(cache_key=key).first()
+            cache_entry = self.model.query.filter_by(cache_key=key).first()
             if cache_entry:
                 self.db.session.delete(cache_entry)
-                self.db.session.commit()
+            if self.tag_model is not None:
+                self.tag_model.query.filter_by(cache_key=key).delete()
+            self.db.session.commit()
         except Exception as e:
             print(f"Error deleting from cache: {e}")
     
-    def clear_expired(self) -> None:
-        """Clear expired cache entries"""
-        try:
-            # Clear expired memory cache
-            current_time = time.time()
-            expired_keys = [
-                key for key, (data, timestamp) in self.memory_cache.items()
-                if current_time - timestamp >= self.cache_duration
-            ]
-            for key in expired_keys:
-                del self.memory_cache[key]
-            
-            # Clear expired database cache
-            expired_entries = CacheEntry.query.filter(
-                CacheEntry.expires_at < datetime.datetime.utcnow()
-            ).all()
-            for entry in expired_entries:
-                self.db.session.delete(entry)
-            self.db.session.commit()
-        except Exception as e:
-            print(f"Error clearing expired cache: {e}")
+    def clear_expired(self, older_than: int = 0, batch_size: int = 1000, max_batches: int = None) -> Dict:
+        """Delete database rows that expired more than older_than seconds ago.
+        
+        Works in batches: the oldest expired rows are found through the expires_at
+        index and deleted by id, with their tags, in one commit per batch so locks
+        stay short. The deletes repeat the expiry check, so a row refreshed since it
+        was selected keeps itself and its tags. The hot tier is bounded by its own
+        limits and keeps expired entries for their ETags.
+        """
+        start = time.perf_counter()
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=older_than)
+        rows = 0
+        batches = 0
+        complete = True
+        while max_batches is None or batches < max_batches:
+            try:
+                ids = self.db.session.execute(
+                    select(self.model.id).where(
+                        self.model.expires_at < cutoff
+                    ).order_by(self.model.expires_at).limit(batch_size)
+                ).scalars().all()
+                deleted = self._delete_expired(ids, cutoff) if ids else 0
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                print(f"Error clearing expired cache: {e}")
+                complete = False
+                break
+            rows += deleted
+            batches += 1
+            if len(ids) < batch_size:
+                break
+        
+        return {
+            'rows': rows,
+            'batches': batches,
+            'complete': complete,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+    
+    def _delete_expired(self, ids: Iterable[int], cutoff: datetime.datetime) -> int:
+        """Delete the rows among ids still expired at cutoff, and only their tags"""
+        expired = self.model.id.in_(ids) & (self.model.expires_at < cutoff)
+        options = {'synchronize_session': False}
+        if self.tag_model is None:
+            return self.db.session.execute(delete(self.model).where(expired), execution_options=options).rowcount
+        
+        if self._is_postgres():
+            keys = self.db.session.execute(
+                delete(self.model).where(expired).returning(self.model.cache_key), execution_options=options
+            ).scalars().all()
+            if keys:
+                self.db.session.execute(
+                    delete(self.tag_model).where(self.tag_model.cache_key.in_(keys)), execution_options=options
+                )
+            return len(keys)
+        
+        # Tags first, while the subquery can still see the rows about to go
+        self.db.session.execute(
+            delete(self.tag_model).where(self.tag_model.cache_key.in_(select(self.model.cache_key).where(expired))),
+            execution_options=options
+        )
+        return self.db.session.execute(delete(self.model).where(expired), execution_options=options).rowcount
     
     def clear_all(self) -> None:
         """Clear all cache entries"""
         # Clear memory cache
-        self.memory_cache.clear()
+        self.backend.clear()
+        if self.writer:
+            self.writer.discard()
         
         # Clear database cache
         try:
-            CacheEntry.query.delete()
+            self.model.query.delete()
+            if self.tag_model is not None:
+                self.tag_model.query.delete()
             self.db.session.commit()
         except Exception as e:
             print(f"Error clearing all cache: {e}")
+    
+    def stats(self) -> Dict:
+        """Hot tier size and hit/miss/eviction counters, overall and per key namespace"""
+        stats = {
+            'memory': self.backend.stats(),
+            'lookups': self.metrics.totals(),
+            'namespaces': self.metrics.snapshot(),
+            'single_flight': dict(self.flight_stats)
+        }
+        if self.writer:
+            stats['write_behind'] = self.writer.stats()
+        if self.sweeper:
+            stats['sweeper'] = self.sweeper.stats()
+        return stats
+    
+    def prometheus_metrics(self) -> str:
+        """Namespace counters and tier gauges in the Prometheus text format"""
+        memory = self.backend.stats()
+        gauges = {'hot_tier_entries': memory['entries'], 'hot_tier_bytes': memory['bytes']}
+        if self.writer:
+            gauges['write_behind_queue_depth'] = self.writer.stats()['queue_depth']
+        if self.sweeper:
+            gauges['sweeper_last_rows'] = self.sweeper.metrics['last_rows']
+            gauges['sweeper_last_duration_seconds'] = self.sweeper.metrics['last_duration_ms'] / 1000
+        return self.metrics.prometheus(gauges)
+    
+    def _load(self, cache_entry) -> Tuple[Any, int]:
+        """(data, approximate size) of a stored row, binary or legacy JSON text.
+        Binary rows are charged their uncompressed size, as set_many charges new entries"""
+        if cache_entry.cache_blob is not None:
+            return self.codec.decode_sized(cache_entry.cache_blob)
+        return json.loads(cache_entry.cache_data), len(cache_entry.cache_data)
+    
+    def _unwrap(self, key: str, data: Any) -> Any:
+        """The placeholder of a negative entry, anything else unchanged"""
+        if type(data) is dict and len(data) == 1 and NEGATIVE in data:
+            self.metrics.count(key, 'negative_hits')
+            return data[NEGATIVE]
+        return data
+    
+    def _tags(self, key: str, tags: Optional[Iterable[str]]) -> Tuple[str, ...]:
+        """Caller tags plus namespace:{prefix} (see namespace_of)"""
+        if self.tag_model is None:
+            return ()
+        return tuple(sorted({f"namespace:{namespace_of(key)}", *(tags or ())}))
+    
+    def _pending_row(self, key: str) -> Optional[Dict]:
+        return self.writer.peek(key) if self.writer else None
+    
+    def _pending_into(self, key: str, result: Dict, fresh_only: bool) -> bool:
+        """Answer a batched lookup from the write-behind queue; True if the key is queued"""
+        row = self._pending_row(key)
+        if row is None:
+            return False
+        if fresh_only:
+            if row['expires_at'] > datetime.datetime.utcnow():
+                result[key] = self.codec.decode(row['cache_blob'])
+        elif row['etag']:
+            result[key] = (self.codec.decode(row['cache_blob']), row['etag'])
+        return True
+    
+    @staticmethod
+    def _to_timestamp(value: datetime.datetime) -> float:
+        """Convert a naive UTC datetime from the database to a Unix timestamp"""
+        return value.replace(tzinfo=datetime.timezone.utc).timestamp()
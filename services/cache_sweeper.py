@@ -0,0 +1,83 @@
+"""
+Cache Sweeper
+Scheduled set-based deletion of expired cache_entries rows
+"""
+
+import time
+import atexit
+import threading
+from typing import Dict
+
+from flask import Flask
+
+
+class CacheSweeper:
+    """Runs CacheService.clear_expired on an interval from a background thread.
+    
+    Rows are kept for retention seconds after they expire, because their ETag and
+    stale data still serve conditional and stale-while-revalidate refreshes.
+    """
+    
+    def __init__(self, app: Flask, cache_service, interval: float = 300.0, retention: int = 86400,
+                 batch_size: int = 1000):
+        self.app = app
+        self.cache_service = cache_service
+        self.interval = interval
+        self.retention = retention
+        self.batch_size = batch_size
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.metrics = {
+            'runs': 0,
+            'rows': 0,
+            'errors': 0,
+            'last_run_at': None,
+            'last_rows': 0,
+            'last_batches': 0,
+            'last_duration_ms': 0.0,
+            'max_duration_ms': 0.0
+        }
+    
+    def start(self) -> None:
+        """Start the sweeper thread; the first sweep runs after one interval"""
+        if self.thread:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='cache-sweeper', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+        self.thread = None
+    
+    def sweep(self) -> Dict:
+        """Delete rows that expired more than retention seconds ago, now. Returns the run's report"""
+        with self.app.app_context():
+            report = self.cache_service.clear_expired(older_than=self.retention, batch_size=self.batch_size)
+        
+        self.metrics['runs'] += 1
+        self.metrics['rows'] += report['rows']
+        self.metrics['errors'] += 0 if report['complete'] else 1
+        self.metrics['last_run_at'] = time.time()
+        self.metrics['last_rows'] = report['rows']
+        self.metrics['last_batches'] = report['batches']
+        self.metrics['last_duration_ms'] = report['duration_ms']
+        self.metrics['max_duration_ms'] = max(self.metrics['max_duration_ms'], report['duration_ms'])
+        if report['rows']:
+            print(f"Cache sweep reclaimed {report['rows']} rows in {report['duration_ms']} ms")
+        return report
+    
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                self.metrics['errors'] += 1
+                print(f"Error sweeping cache: {e}")
+    
+    def stats(self) -> Dict:
+        """Rows reclaimed and run durations"""
+        return dict(self.metrics, interval=self.interval, retention=self.retention, batch_size=self.batch_size)
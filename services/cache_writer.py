@@ -0,0 +1,214 @@
+"""
+Cache Writer
+Write-behind queue that persists cache rows off the request thread
+"""
+
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from models.upsert import bulk_upsert
+
+
+def write_rows(db: SQLAlchemy, cache_entry_model, cache_tag_model, rows: List[Dict]) -> None:
+    """Upsert cache rows and insert their tags. The caller owns the transaction"""
+    bulk_upsert(db, cache_entry_model, [
+        {column: value for column, value in row.items() if column != 'tags'} for row in rows
+    ], ['cache_key'])
+    if cache_tag_model is not None:
+        bulk_upsert(db, cache_tag_model, [
+            {'cache_key': row['cache_key'], 'tag': tag} for row in rows for tag in row.get('tags', ())
+        ], ['cache_key', 'tag'])
+
+
+class CacheWriter:
+    """Coalesces cache rows by key and batch-upserts them from a background thread"""
+    
+    def __init__(self, app: Flask, db: SQLAlchemy, cache_entry_model, cache_tag_model=None, max_pending: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 0.5, put_timeout: float = 5.0):
+        self.app = app
+        self.db = db
+        self.model = cache_entry_model
+        self.tag_model = cache_tag_model
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.pending = OrderedDict()  # cache_key -> row, latest write wins
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.metrics = {
+            'queued': 0,
+            'coalesced': 0,
+            'written': 0,
+            'flushes': 0,
+            'errors': 0,
+            'blocked_puts': 0,
+            'max_depth': 0,
+            'last_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+    
+    def start(self) -> None:
+        """Start the flusher thread; pending rows are flushed at interpreter exit"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='cache-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        """Stop the flusher and write whatever is still queued"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+        self.flush()
+    
+    def put(self, rows: List[Dict]) -> bool:
+        """Queue rows for persistence. Blocks while the queue is full (backpressure).
+        
+        Returns False if the queue stayed full for put_timeout, in which case the
+        caller should write the rows itself.
+        """
+        with self.condition:
+            if not self.running:
+                return False
+            new_keys = sum(1 for row in rows if row['cache_key'] not in self.pending)
+            if new_keys > self.max_pending:
+                # Could never fit, don't wait for it
+                return False
+            if len(self.pending) + new_keys > self.max_pending:
+                self.metrics['blocked_puts'] += 1
+                self.condition.notify_all()
+                deadline = time.time() + self.put_timeout
+                while len(self.pending) + new_keys > self.max_pending and self.running:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                if not self.running:
+                    return False
+            
+            for row in rows:
+                if row['cache_key'] in self.pending:
+                    self.metrics['coalesced'] += 1
+                    del self.pending[row['cache_key']]
+                self.pending[row['cache_key']] = row
+            self.metrics['queued'] += len(rows)
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], len(self.pending))
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+        return True
+    
+    def peek(self, key: str) -> Optional[Dict]:
+        """The queued row for a key that has not reached the database yet"""
+        with self.condition:
+            return self.pending.get(key)
+    
+    def touch(self, key: str, expires_at) -> bool:
+        """Move the expiry of a queued row. False if the key is not queued"""
+        with self.condition:
+            row = self.pending.get(key)
+            if row is None:
+                return False
+            self.pending[key] = dict(row, expires_at=expires_at)
+            return True
+    
+    def discard(self, key: str = None) -> None:
+        """Drop a queued key (or everything) so a later flush cannot resurrect it"""
+        # Waiting for an in-flight batch means the caller's own delete runs after it
+        with self.flush_lock, self.condition:
+            if key is None:
+                self.pending.clear()
+            else:
+                self.pending.pop(key, None)
+            self.condition.notify_all()
+    
+    def discard_tag(self, tag: str) -> List[str]:
+        """Drop every queued row carrying tag, returns their keys"""
+        with self.flush_lock, self.condition:
+            keys = [key for key, row in self.pending.items() if tag in row.get('tags', ())]
+            for key in keys:
+                del self.pending[key]
+            self.condition.notify_all()
+            return keys
+    
+    def flush(self) -> int:
+        """Write everything queued now, in batches. Returns the number of rows written"""
+        written = 0
+        while True:
+            # One flusher at a time, so batches holding the same key land in queue order
+            with self.flush_lock:
+                with self.condition:
+                    if not self.pending:
+                        return written
+                    keys = list(self.pending)[:self.batch_size]
+                    batch = [self.pending.pop(key) for key in keys]
+                    self.condition.notify_all()
+                written += self._write(batch)
+    
+    def flush_keys(self, keys: List[str]) -> int:
+        """Write only the queued rows for keys, now. Returns the number of rows written"""
+        with self.flush_lock:
+            with self.condition:
+                batch = [self.pending.pop(key) for key in keys if key in self.pending]
+                self.condition.notify_all()
+            return self._write(batch) if batch else 0
+    
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                if self.running and len(self.pending) < self.batch_size:
+                    self.condition.wait(self.flush_interval)
+                if not self.running:
+                    return
+            self.flush()
+    
+    def _write(self, rows: List[Dict]) -> int:
+        start = time.perf_counter()
+        with self.app.app_context():
+            try:
+                write_rows(self.db, self.model, self.tag_model, rows)
+                self.db.session.commit()
+                written = len(rows)
+            except Exception as e:
+                self.db.session.rollback()
+                self.metrics['errors'] += 1
+                print(f"Error flushing {len(rows)} cache rows: {e}")
+                written = 0
+        
+        elapsed = (time.perf_counter() - start) * 1000
+        self.metrics['flushes'] += 1
+        self.metrics['written'] += written
+        self.metrics['last_flush_ms'] = round(elapsed, 2)
+        self.metrics['total_flush_ms'] += elapsed
+        return written
+    
+    def stats(self) -> Dict:
+        """Queue depth, throughput and flush latency"""
+        with self.condition:
+            depth = len(self.pending)
+        flushes = self.metrics['flushes']
+        return {
+            'queue_depth': depth,
+            'max_pending': self.max_pending,
+            'queued': self.metrics['queued'],
+            'coalesced': self.metrics['coalesced'],
+            'written': self.metrics['written'],
+            'flushes': flushes,
+            'errors': self.metrics['errors'],
+            'blocked_puts': self.metrics['blocked_puts'],
+            'max_depth': self.metrics['max_depth'],
+            'last_flush_ms': self.metrics['last_flush_ms'],
+            'avg_flush_ms': round(self.metrics['total_flush_ms'] / flushes, 2) if flushes else 0.0
+        }
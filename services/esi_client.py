@@ -0,0 +1,86 @@
+"""
+ESI Client
+Conditional ESI requests that honour ETag and Expires headers
+"""
+
+import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import requests
+
+from .cache_service import CacheService
+from .http_client import HTTPClient
+
+
+class ESIClient:
+    """Fetches ESI resources with If-None-Match and caches them until the server's Expires"""
+    
+    def __init__(self, cache_service: CacheService, http_client: HTTPClient):
+        self.cache_service = cache_service
+        self.http = http_client
+    
+    def get(self, cache_key: str, url: str, ttl: int, headers: Dict = None, params: Dict = None,
+            transform: Callable[[Any], Any] = None, stale_while_revalidate: int = 0,
+            tags: Iterable[str] = None) -> Any:
+        """Refresh a cache entry from ESI, revalidating with the stored ETag when there is one.
+        
+        Call it after cache_service.get(cache_key, MISS) missed; that lookup is not repeated.
+        Concurrent callers missing the same key share one request (see CacheService.get_or_load).
+        """
+        def load():
+            stale = self.cache_service.get_stale(cache_key)
+            response = self.request(url, stale[1] if stale else None, headers, params)
+            return self.store(cache_key, response, ttl, stale, transform, tags)
+        
+        return self.cache_service.get_or_load(cache_key, load, stale_while_revalidate, missed=True)
+    
+    def request(self, url: str, etag: str = None, headers: Dict = None, params: Dict = None) -> requests.Response:
+        """Send a (conditional) GET. Does not touch the cache, so it is safe on worker threads"""
+        headers = dict(headers or {})
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.http.get(url, headers=headers, params=params)
+    
+    def store(self, cache_key: str, response: requests.Response, ttl: int, stale: Optional[Tuple[Any, str]] = None,
+              transform: Callable[[Any], Any] = None, tags: Iterable[str] = None) -> Any:
+        """Apply a response to the cache and return the resulting data"""
+        data, ttl, etag = self.parse(response, ttl, stale, transform)
+        if response.status_code == 304 and stale:
+            # Not modified: keep the cached body and only extend its lifetime
+            self.cache_service.touch(cache_key, ttl)
+        else:
+            self.cache_service.set(cache_key, data, ttl, etag=etag, tags=tags)
+        return data
+    
+    def parse(self, response: requests.Response, ttl: int, stale: Optional[Tuple[Any, str]] = None,
+              transform: Callable[[Any], Any] = None) -> Tuple[Any, int, Optional[str]]:
+        """(data, ttl, etag) for a response without writing the cache, for batched CacheService.set_many"""
+        ttl = self.expires_in(response, ttl)
+        if response.status_code == 304 and stale:
+            return stale[0], ttl, stale[1]
+        
+        response.raise_for_status()
+        data = response.json()
+        if transform:
+            data = transform(data)
+        return data, ttl, response.headers.get('ETag')
+    
+    @staticmethod
+    def expires_in(response: requests.Response, default: int) -> int:
+        """Seconds until the response expires according to its Expires header"""
+        expires = response.headers.get('Expires')
+        if not expires:
+            return default
+        
+        try:
+            expires_at = parsedate_to_datetime(expires)
+        except (TypeError, ValueError):
+            return default
+        
+        # Measure against the server's Date header so local clock skew doesn't matter
+        try:
+            now = parsedate_to_datetime(response.headers['Date'])
+        except (KeyError, TypeError, ValueError):
+            now = datetime.datetime.now(datetime.timezone.utc)
+        return max(int((expires_at - now).total_seconds()), 1)
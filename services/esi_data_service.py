@@ -3,75 +3,154 @@ EVE ESI Data Service
 Handles data collection from EVE ESI API with caching
 """
 
-import requests
-import time
-from typing import Dict, List, Optional, Any
-from .cache_service import CacheService
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from .cache_service import CacheService, MISS
+from .http_client import HTTPClient
+from .esi_client import ESIClient
+from .name_resolver import NameResolver
 
 
 class ESIDataService:
     """Service for collecting data from EVE ESI API"""
     
-    def __init__(self, cache_service: CacheService):
+    # Lookups used to enrich jobs: cache key prefix -> (job field, ESI path, fallback name)
+    JOB_LOOKUPS = {
+        'type': ('product_type_id', '/universe/types/{}/', 'Type {}'),
+        'location': ('location_id', None, 'Location {}'),
+        'station': ('station_id', '/universe/stations/{}/', 'Station {}'),
+        'system': ('system_id', '/universe/systems/{}/', 'System {}'),
+        'corporation': ('corporation_id', '/corporations/{}/', 'Corp {}'),
+    }
+    
+    # Lookups that only need a name go through the bulk /universe/names/ resolver;
+    # types (volume, group) and systems (security status) still need the detailed endpoints
+    NAME_ONLY_LOOKUPS = ('location', 'station', 'corporation')
+    
+    def __init__(self, cache_service: CacheService, http_client: HTTPClient = None, max_workers: int = 16):
         self.cache_service = cache_service
+        self.http = http_client or HTTPClient()
+        self.esi = ESIClient(cache_service, self.http)
         self.base_url = "https://esi.evetech.net/latest"
+        self.name_resolver = NameResolver(cache_service, self.http, self.base_url)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='esi-lookup')
     
     def get_character_skills(self, character_id: int, access_token: str) -> List[Dict]:
         """Get character skills from ESI"""
         cache_key = f"skills_{character_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/characters/{character_id}/skills/"
             headers = {'Authorization': f'Bearer {access_token}'}
             
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 3600)  # Cache for 1 hour
-            return data.get('skills', [])
+            # Cache the skills list itself so cache hits return the same shape
+            return self.esi.get(cache_key, url, 3600, headers=headers, tags=[f"character:{character_id}"],
+                                transform=lambda data: data.get('skills', []))  # Default: cache for 1 hour
         except Exception as e:
             print(f"Error getting character skills: {e}")
             return []
     
     def get_character_jobs(self, character_id: int, access_token: str) -> List[Dict]:
         """Get character industry jobs from ESI with detailed information"""
-        cache_key = f"jobs_{character_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
-            return cached_data
-        
+        # The raw ESI list is cached with its ETag. Names and the time-dependent fields
+        # (duration, time remaining, progress) are derived on every read, 304s included
+        cache_key = f"jobs_raw_{character_id}"
         try:
-            url = f"{self.base_url}/characters/{character_id}/industry/jobs/"
-            headers = {'Authorization': f'Bearer {access_token}'}
-            
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            jobs_data = response.json()
+            jobs = self.cache_service.get(cache_key, MISS)
+            if jobs is MISS:
+                url = f"{self.base_url}/characters/{character_id}/industry/jobs/"
+                headers = {'Authorization': f'Bearer {access_token}'}
+                jobs = self.esi.get(cache_key, url, 300, headers=headers, tags=[f"character:{character_id}"])  # Default: cache for 5 minutes
             
             # Обогащаем данные дополнительной информацией
-            enriched_jobs = []
-            for job in jobs_data:
-                enriched_job = self._enrich_job_data(job, character_id)
-                enriched_jobs.append(enriched_job)
-            
-            self.cache_service.set(cache_key, enriched_jobs, 300)  # Cache for 5 minutes
-            return enriched_jobs
+            return self._enrich_jobs(jobs, character_id)
         except Exception as e:
             print(f"Error getting character jobs: {e}")
             return []
     
-    def _enrich_job_data(self, job: Dict, character_id: int) -> Dict:
+    def _enrich_jobs(self, jobs: List[Dict], character_id: int) -> List[Dict]:
+        """Enrich a list of jobs, resolving every referenced ID once and concurrently"""
+        lookups = set()
+        for job in jobs:
+            for kind, (field, _, _) in self.JOB_LOOKUPS.items():
+                if job.get(field):
+                    lookups.add((kind, job[field]))
+        
+        names = self.name_resolver.resolve(
+            entity_id for kind, entity_id in lookups if kind in self.NAME_ONLY_LOOKUPS
+        )
+        resolved = {}
+        for kind, entity_id in lookups:
+            if kind in self.NAME_ONLY_LOOKUPS and entity_id in names:
+                resolved[(kind, entity_id)] = {
+                    'name': names[entity_id]['name'],
+                    'type': names[entity_id]['category']
+                }
+        
+        # Player structures and anything else ESI could not name fall back to per-ID lookups
+        resolved.update(self._resolve_lookups(lookups - resolved.keys()))
+        return [self._enrich_job_data(job, character_id, resolved) for job in jobs]
+    
+    def _resolve_lookups(self, lookups) -> Dict[Tuple[str, int], Dict]:
+        """Resolve (kind, id) pairs from cache, fetching all misses in parallel"""
+        keys = {(kind, entity_id): f"{kind}_{entity_id}" for kind, entity_id in lookups}
+        cached = self.cache_service.get_many(keys.values())
+        resolved = {lookup: cached[key] for lookup, key in keys.items() if key in cached}
+        stale = self.cache_service.get_stale_many(key for lookup, key in keys.items() if lookup not in resolved)
+        
+        # Only the HTTP calls run on worker threads; cache reads and writes stay
+        # on the calling thread because they need the Flask app context.
+        futures = {
+            (kind, entity_id): self.executor.submit(
+                self.esi.request, self._lookup_url(kind, entity_id), stale[key][1] if key in stale else None
+            )
+            for (kind, entity_id), key in keys.items() if (kind, entity_id) not in resolved
+        }
+        
+        updates = []
+        failures = []
+        for (kind, entity_id), future in futures.items():
+            key = keys[(kind, entity_id)]
+            try:
+                data, ttl, etag = self.esi.parse(future.result(), 86400, stale.get(key))
+                updates.append((key, data, ttl, etag))
+            except Exception as e:
+                print(f"Error getting {kind} info for {entity_id}: {e}")
+                if key in stale:
+                    # An outdated name beats a placeholder; the next enrichment retries
+                    data = stale[key][0]
+                else:
+                    # e.g. a structure the character cannot see: don't ask again for every job
+                    data = {'name': self.JOB_LOOKUPS[kind][2].format(entity_id)}
+                    failures.append((key, data))
+            resolved[(kind, entity_id)] = data
+        
+        # One upsert for everything fetched, 304s included (they only extend the expiry)
+        self.cache_service.set_many(updates)
+        self.cache_service.set_negative_many(failures)
+        return resolved
+    
+    def _lookup_url(self, kind: str, entity_id: int) -> str:
+        """Build the ESI URL for a job lookup"""
+        if kind == 'location':
+            if entity_id > 1000000000000:  # Structure
+                return f"{self.base_url}/universe/structures/{entity_id}/"
+            return f"{self.base_url}/universe/stations/{entity_id}/"
+        
+        return f"{self.base_url}{self.JOB_LOOKUPS[kind][1].format(entity_id)}"
+    
+    def _enrich_job_data(self, job: Dict, character_id: int, resolved: Dict[Tuple[str, int], Dict] = None) -> Dict:
         """Enrich job data with additional information"""
         enriched_job = job.copy()
+        resolved = resolved or {}
         
         # Добавляем информацию о продукте
         if job.get('product_type_id'):
-            product_info = self.get_type_info(job['product_type_id'])
+            product_info = resolved.get(('type', job['product_type_id'])) or self.get_type_info(job['product_type_id'])
             enriched_job['product_name'] = product_info.get('name', f'Type {job["product_type_id"]}')
             enriched_job['product_volume'] = product_info.get('volume', 0)
             enriched_job['product_category'] = product_info.get('category_id', 0)
@@ -79,26 +158,26 @@ class ESIDataService:
         
         # Добавляем информацию о локации
         if job.get('location_id'):
-            location_info = self.get_location_info(job['location_id'])
+            location_info = resolved.get(('location', job['location_id'])) or self.get_location_info(job['location_id'])
             enriched_job['location_name'] = location_info.get('name', f'Location {job["location_id"]}')
             enriched_job['location_type'] = location_info.get('type', 'unknown')
             enriched_job['location_security'] = location_info.get('security_status', 0.0)
         
         # Добавляем информацию о станции/структуре
         if job.get('station_id'):
-            station_info = self.get_station_info(job['station_id'])
+            station_info = resolved.get(('station', job['station_id'])) or self.get_station_info(job['station_id'])
             enriched_job['station_name'] = station_info.get('name', f'Station {job["station_id"]}')
             enriched_job['station_type'] = station_info.get('type', 'unknown')
         
         # Добавляем информацию о солнечной системе
         if job.get('system_id'):
-            system_info = self.get_system_info(job['system_id'])
+            system_info = resolved.get(('system', job['system_id'])) or self.get_system_info(job['system_id'])
             enriched_job['system_name'] = system_info.get('name', f'System {job["system_id"]}')
             enriched_job['system_security'] = system_info.get('security_status', 0.0)
         
         # Добавляем информацию о корпорации
         if job.get('corporation_id'):
-            corp_info = self.get_corporation_info(job['corporation_id'])
+            corp_info = resolved.get(('corporation', job['corporation_id'])) or self.get_corporation_info(job['corporation_id'])
             enriched_job['corporation_name'] = corp_info.get('name', f'Corp {job["corporation_id"]}')
         
         # Добавляем расчетные поля
@@ -158,57 +237,50 @@ class ESIDataService:
     def get_station_info(self, station_id: int) -> Dict:
         """Get station information"""
         cache_key = f"station_{station_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/universe/stations/{station_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            # Default: cache for 24 hours; static data, a day-old copy is fine while it refreshes
+            data = self.esi.get(cache_key, url, 86400, stale_while_revalidate=86400)
             return data
         except Exception as e:
             print(f"Error getting station info: {e}")
-            return {'station_id': station_id, 'name': f'Station {station_id}'}
+            placeholder = {'station_id': station_id, 'name': f'Station {station_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
     
     def get_corporation_info(self, corporation_id: int) -> Dict:
         """Get corporation information"""
         cache_key = f"corporation_{corporation_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/corporations/{corporation_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            data = self.esi.get(cache_key, url, 86400)  # Default: cache for 24 hours
             return data
         except Exception as e:
             print(f"Error getting corporation info: {e}")
-            return {'corporation_id': corporation_id, 'name': f'Corp {corporation_id}'}
-
+            placeholder = {'corporation_id': corporation_id, 'name': f'Corp {corporation_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
+    
     def get_character_planets(self, character_id: int, access_token: str) -> List[Dict]:
         """Get character planets from ESI"""
         cache_key = f"planets_{character_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/characters/{character_id}/planets/"
             headers = {'Authorization': f'Bearer {access_token}'}
             
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 1800)  # Cache for 30 minutes
+            data = self.esi.get(cache_key, url, 1800, headers=headers, tags=[f"character:{character_id}"])  # Default: cache for 30 minutes
             return data
         except Exception as e:
             print(f"Error getting character planets: {e}")
@@ -217,19 +289,15 @@ class ESIDataService:
     def get_character_blueprints(self, character_id: int, access_token: str) -> List[Dict]:
         """Get character blueprints from ESI"""
         cache_key = f"blueprints_{character_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/characters/{character_id}/blueprints/"
             headers = {'Authorization': f'Bearer {access_token}'}
             
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 3600)  # Cache for 1 hour
+            data = self.esi.get(cache_key, url, 3600, headers=headers, tags=[f"character:{character_id}"])  # Default: cache for 1 hour
             return data
         except Exception as e:
             print(f"Error getting character blueprints: {e}")
@@ -238,19 +306,15 @@ class ESIDataService:
     def get_character_assets(self, character_id: int, access_token: str) -> List[Dict]:
         """Get character assets from ESI"""
         cache_key = f"assets_{character_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/characters/{character_id}/assets/"
             headers = {'Authorization': f'Bearer {access_token}'}
             
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 1800)  # Cache for 30 minutes
+            data = self.esi.get(cache_key, url, 1800, headers=headers, tags=[f"character:{character_id}"])  # Default: cache for 30 minutes
             return data
         except Exception as e:
             print(f"Error getting character assets: {e}")
@@ -259,27 +323,26 @@ class ESIDataService:
     def get_type_info(self, type_id: int) -> Dict:
         """Get type information from ESI"""
         cache_key = f"type_{type_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/universe/types/{type_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            # Default: cache for 24 hours; static data, a day-old copy is fine while it refreshes
+            data = self.esi.get(cache_key, url, 86400, stale_while_revalidate=86400)
             return data
         except Exception as e:
             print(f"Error getting type info: {e}")
-            return {'type_id': type_id, 'name': f'Type {type_id}'}
+            placeholder = {'type_id': type_id, 'name': f'Type {type_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
     
     def get_location_info(self, location_id: int) -> Dict:
         """Get location information from ESI"""
         cache_key = f"location_{location_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
@@ -288,32 +351,26 @@ class ESIDataService:
             else:  # Station
                 url = f"{self.base_url}/universe/stations/{location_id}/"
             
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            data = self.esi.get(cache_key, url, 86400)  # Default: cache for 24 hours
             return data
         except Exception as e:
             print(f"Error getting location info: {e}")
-            return {'location_id': location_id, 'name': f'Location {location_id}'}
+            placeholder = {'location_id': location_id, 'name': f'Location {location_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
     
     def get_planet_details(self, character_id: int, planet_id: int, access_token: str) -> Dict:
         """Get detailed planet information from ESI"""
         cache_key = f"planet_details_{character_id}_{planet_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/characters/{character_id}/planets/{planet_id}/"
             headers = {'Authorization': f'Bearer {access_token}'}
             
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 1800)  # Cache for 30 minutes
+            data = self.esi.get(cache_key, url, 1800, headers=headers, tags=[f"character:{character_id}"])  # Default: cache for 30 minutes
             return data
         except Exception as e:
             print(f"Error getting planet details: {e}")
@@ -322,37 +379,34 @@ class ESIDataService:
     def get_system_info(self, system_id: int) -> Dict:
         """Get solar system information from ESI"""
         cache_key = f"system_{system_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/universe/systems/{system_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            # Default: cache for 24 hours; static data, a day-old copy is fine while it refreshes
+            data = self.esi.get(cache_key, url, 86400, stale_while_revalidate=86400)
             return data
         except Exception as e:
             print(f"Error getting system info: {e}")
-            return {'system_id': system_id, 'name': f'System {system_id}'}
+            placeholder = {'system_id': system_id, 'name': f'System {system_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
     
     def get_planet_info(self, planet_id: int) -> Dict:
         """Get planet information from ESI"""
         cache_key = f"planet_info_{planet_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.base_url}/universe/planets/{planet_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            data = self.esi.get(cache_key, url, 86400)  # Default: cache for 24 hours
             return data
         except Exception as e:
             print(f"Error getting planet info: {e}")
-            return {'planet_id': planet_id, 'name': f'Planet {planet_id}'}
+            placeholder = {'planet_id': planet_id, 'name': f'Planet {planet_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
@@ -9,6 +9,8 @@ import requests
 import datetime
 from typing import Optional, List, Dict
 from dataclasses import dataclass
+from .http_client import HTTPClient
+from .jwt_validator import JWTValidator, TokenInvalid
 
 
 @dataclass
@@ -22,11 +24,14 @@ class EVEToken:
 class EVESSOService:
     """Service for handling EVE SSO authentication and token management"""
     
-    def __init__(self, client_id: str, secret_key: str):
+    def __init__(self, client_id: str, secret_key: str, http_client: HTTPClient = None):
         self.client_id = client_id
+        self.http = http_client or HTTPClient()
         self.secret_key = secret_key
         self.auth_string = base64.b64encode(f"{client_id}:{secret_key}".encode()).decode()
         self.base_url = "https://login.eveonline.com"
+        # SSO v2 access tokens are JWTs signed with the keys published here
+        self.jwt_validator = JWTValidator(self.http, f"{self.base_url}/oauth/jwks", client_id)
     
     def get_authorization_url(self, redirect_uri: str, scopes: List[str], state: str = None) -> str:
         """Generate EVE SSO authorization URL"""
@@ -59,7 +64,7 @@ class EVESSOService:
                 'redirect_uri': redirect_uri
             }
             
-            response = requests.post(url, headers=headers, data=data)
+            response = self.http.post(url, headers=headers, data=data)
             response.raise_for_status()
             
             token_data = response.json()
@@ -88,7 +93,7 @@ class EVESSOService:
                 'refresh_token': refresh_token
             }
             
-            response = requests.post(url, headers=headers, data=data)
+            response = self.http.post(url, headers=headers, data=data)
             response.raise_for_status()
             
             token_data = response.json()
@@ -105,12 +110,21 @@ class EVESSOService:
             return None
     
     def verify_token(self, access_token: str) -> Optional[Dict]:
-        """Verify access token and get character information"""
+        """Verify access token and get character information.
+        Checked locally against the cached JWKS; /oauth/verify only when that is not possible"""
+        try:
+            char_info = self.jwt_validator.validate(access_token)
+            if char_info:
+                return char_info
+        except TokenInvalid as e:
+            print(f"Rejected access token: {e}")
+            return None
+        
         try:
             url = f"{self.base_url}/oauth/verify"
             headers = {'Authorization': f'Bearer {access_token}'}
             
-            response = requests.get(url, headers=headers)
+            response = self.http.get(url, headers=headers)
             response.raise_for_status()
             
             return response.json()
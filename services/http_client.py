@@ -0,0 +1,96 @@
+"""
+HTTP Client
+Shared keep-alive HTTP session for all outbound EVE API calls
+"""
+
+import time
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HTTPClient:
+    """Pooled HTTP client with per-host connection pools and default timeouts"""
+    
+    DEFAULT_POOL_SIZES = {
+        'esi.evetech.net': 32,
+        'login.eveonline.com': 8,
+    }
+    
+    def __init__(self, pool_sizes: Optional[Dict[str, int]] = None, default_pool_size: int = 10,
+                 timeout: Tuple[float, float] = (3.05, 15), user_agent: str = 'EVE-ProfitMaster'):
+        self.timeout = timeout
+        self.pool_sizes = dict(self.DEFAULT_POOL_SIZES)
+        self.pool_sizes.update(pool_sizes or {})
+        
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=default_pool_size))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=default_pool_size))
+        self.adapters = {}
+        for host, size in self.pool_sizes.items():
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size)
+            self.adapters[host] = adapter
+            self.session.mount(f'https://{host}', adapter)
+        
+        self._lock = threading.Lock()
+        self._stats = {}
+    
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared session"""
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).hostname
+        
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(host, time.perf_counter() - start, error=True)
+            raise
+        self._record(host, time.perf_counter() - start, error=response.status_code >= 500)
+        return response
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+    
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+    
+    def _record(self, host: str, elapsed: float, error: bool = False) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(host, {'requests': 0, 'errors': 0, 'total_time': 0.0})
+            stats['requests'] += 1
+            stats['total_time'] += elapsed
+            if error:
+                stats['errors'] += 1
+    
+    def stats(self) -> Dict[str, Dict]:
+        """Get per-host request and connection pool statistics"""
+        with self._lock:
+            result = {
+                host: {
+                    'requests': s['requests'],
+                    'errors': s['errors'],
+                    'avg_latency_ms': round(s['total_time'] / s['requests'] * 1000, 2) if s['requests'] else 0.0,
+                }
+                for host, s in self._stats.items()
+            }
+        
+        # urllib3 counts new connections per pool, so opened vs. requests shows reuse
+        for adapter in set(self.session.adapters.values()):
+            for pool_key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool is None:
+                    continue
+                host_stats = result.setdefault(pool.host, {'requests': 0, 'errors': 0, 'avg_latency_ms': 0.0})
+                host_stats['connections_opened'] = host_stats.get('connections_opened', 0) + pool.num_connections
+                host_stats['pool_maxsize'] = pool.pool.maxsize if pool.pool else 0
+                host_stats['idle_connections'] = pool.pool.qsize() if pool.pool else 0
+        return result
+    
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self.session.close()
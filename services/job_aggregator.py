@@ -0,0 +1,147 @@
+"""
+Job Aggregator
+Fans per-character work out onto a bounded thread pool and merges the results as they complete
+"""
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from flask import Flask
+
+
+class TaskFailed(Exception):
+    """Raised by a task to report its own status, e.g. TaskFailed('auth_failed', 'token refresh failed')"""
+    
+    def __init__(self, status: str, message: str = ''):
+        super().__init__(message or status)
+        self.status = status
+        self.message = message
+
+
+def ndjson_records(results: Iterator[Tuple[Hashable, Dict, Optional[Any]]]) -> Iterator[str]:
+    """NDJSON lines for iter_results output: one {"character_id", "status", ..., "jobs"} record per
+    character as it completes, then {"done": true, "complete": ..., "characters": n}"""
+    count = 0
+    complete = True
+    try:
+        for key, status, result in results:
+            count += 1
+            complete = complete and status['status'] == 'ok'
+            record = dict(status, character_id=key)
+            if result is not None:
+                record['jobs'] = result
+            yield json.dumps(record) + '\n'
+    except Exception as e:
+        # Headers are already sent; report the failure in the stream itself
+        print(f"Error streaming aggregated results: {e}")
+        yield json.dumps({'done': True, 'complete': False, 'characters': count, 'error': str(e)}) + '\n'
+        return
+    yield json.dumps({'done': True, 'complete': complete, 'characters': count}) + '\n'
+
+
+class JobAggregator:
+    """Runs one task per character on a shared pool of max_workers threads.
+    
+    Every task runs in the application context and gets timeout seconds from the
+    moment it starts. The whole run gives up after deadline seconds (2 * timeout by
+    default), so characters still queued behind slow ones are reported instead of
+    waited for. A timed out task keeps its thread until it returns, but its result
+    is discarded and nobody waits for it.
+    
+    Each result comes with a status: {'status': 'ok' | 'error' | 'timeout' | <TaskFailed
+    status>, 'duration_ms': ..., 'error': ...}.
+    """
+    
+    def __init__(self, app: Flask, max_workers: int = 8, timeout: float = 20.0):
+        self.app = app
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-aggregator')
+        self.lock = threading.Lock()
+        self.metrics = {'runs': 0, 'tasks': 0, 'ok': 0, 'failed': 0, 'errors': 0, 'timeouts': 0,
+                        'max_task_ms': 0.0, 'last_run_ms': 0.0}
+    
+    def run(self, tasks: Dict[Hashable, Callable[[], Any]], timeout: float = None,
+            deadline: float = None) -> Tuple[Dict[Hashable, Any], Dict[Hashable, Dict]]:
+        """All results at once: (results of the tasks that succeeded, status of every task)"""
+        results = {}
+        statuses = {}
+        for key, status, result in self.iter_results(tasks, timeout, deadline):
+            statuses[key] = status
+            if status['status'] == 'ok':
+                results[key] = result
+        return results, statuses
+    
+    def iter_results(self, tasks: Dict[Hashable, Callable[[], Any]], timeout: float = None,
+                     deadline: float = None) -> Iterator[Tuple[Hashable, Dict, Optional[Any]]]:
+        """Yield (key, status, result) for every task in completion order; result is None unless ok"""
+        timeout = timeout or self.timeout
+        run_start = time.monotonic()
+        run_deadline = run_start + (deadline or 2 * timeout)
+        started = {}
+        
+        def call(key, task):
+            started[key] = time.monotonic()
+            with self.app.app_context():
+                return task()
+        
+        futures = {self.executor.submit(call, key, task): key for key, task in tasks.items()}
+        pending = set(futures)
+        self._count('runs')
+        self._count('tasks', len(futures))
+        try:
+            while pending:
+                now = time.monotonic()
+                for future in list(pending):
+                    key = futures[future]
+                    if (key in started and now - started[key] > timeout) or now > run_deadline:
+                        # Queued tasks are dropped; running ones finish in the background, unobserved
+                        future.cancel()
+                        pending.discard(future)
+                        self._count('timeouts')
+                        elapsed = now - started[key] if key in started else 0.0
+                        yield key, {'status': 'timeout', 'duration_ms': round(elapsed * 1000, 2),
+                                    'error': f'No result within {timeout:g}s'}, None
+                if not pending:
+                    break
+                
+                # Wake up at the next task timeout; a task starting later times out later than now + timeout
+                wake = min([started[futures[future]] + timeout for future in pending if futures[future] in started]
+                           + [run_deadline, now + timeout])
+                done, pending = wait(pending, timeout=max(wake - now, 0.01), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = futures[future]
+                    yield (key, *self._outcome(future, time.monotonic() - started.get(key, run_start)))
+        finally:
+            for future in pending:
+                future.cancel()
+            with self.lock:
+                self.metrics['last_run_ms'] = round((time.monotonic() - run_start) * 1000, 2)
+    
+    def _outcome(self, future, elapsed: float) -> Tuple[Dict, Optional[Any]]:
+        duration_ms = round(elapsed * 1000, 2)
+        with self.lock:
+            self.metrics['max_task_ms'] = max(self.metrics['max_task_ms'], duration_ms)
+        try:
+            result = future.result()
+        except TaskFailed as e:
+            self._count('failed')
+            return {'status': e.status, 'duration_ms': duration_ms, 'error': e.message}, None
+        except Exception as e:
+            self._count('errors')
+            print(f"Error in aggregated task: {e}")
+            return {'status': 'error', 'duration_ms': duration_ms, 'error': str(e)}, None
+        self._count('ok')
+        return {'status': 'ok', 'duration_ms': duration_ms}, result
+    
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self.lock:
+            self.metrics[counter] += amount
+    
+    def stats(self) -> Dict:
+        """Tasks run, how they ended and the slowest task"""
+        with self.lock:
+            return dict(self.metrics, max_workers=self.max_workers, timeout=self.timeout)
@@ -0,0 +1,194 @@
+"""
+JWT Validator
+Local validation of EVE SSO v2 access tokens (RS256 JWTs) against a cached JWKS key set
+"""
+
+import json
+import time
+import hmac
+import base64
+import hashlib
+import datetime
+import threading
+from typing import Dict, Optional, Tuple
+
+from .http_client import HTTPClient
+
+
+# DER prefix of the PKCS#1 v1.5 DigestInfo for SHA-256 (RFC 8017, section 9.2)
+SHA256_DIGEST_INFO = bytes.fromhex('3031300d060960864801650304020105000420')
+
+ISSUERS = ('login.eveonline.com', 'https://login.eveonline.com')
+
+
+class TokenInvalid(Exception):
+    """The token is a well-formed JWT that must be rejected: bad signature, expired, wrong issuer"""
+
+
+def b64url_decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+def b64url_int(value: str) -> int:
+    return int.from_bytes(b64url_decode(value), 'big')
+
+
+def rs256_verify(signing_input: bytes, signature: bytes, n: int, e: int) -> bool:
+    """RSASSA-PKCS1-v1_5 with SHA-256: the public key operation and an encoded-message comparison"""
+    size = (n.bit_length() + 7) // 8
+    if len(signature) != size:
+        return False
+    s = int.from_bytes(signature, 'big')
+    if s >= n:
+        return False
+    encoded = pow(s, e, n).to_bytes(size, 'big')
+    digest_info = SHA256_DIGEST_INFO + hashlib.sha256(signing_input).digest()
+    expected = b'\x00\x01' + b'\xff' * (size - len(digest_info) - 3) + b'\x00' + digest_info
+    return hmac.compare_digest(encoded, expected)
+
+
+class JWTValidator:
+    """Validates EVE SSO access tokens without a round trip to /oauth/verify.
+    
+    The JWKS key set is fetched once, then refreshed in a background thread every
+    refresh_interval seconds while validations keep using the cached keys. An unknown
+    key id (EVE rotated its key) triggers an immediate refresh, at most once per
+    min_refresh_interval seconds. validate returns the /oauth/verify response shape.
+    """
+    
+    def __init__(self, http_client: HTTPClient, jwks_url: str, client_id: str = None,
+                 refresh_interval: float = 3600.0, min_refresh_interval: float = 60.0, leeway: int = 5):
+        self.http = http_client
+        self.jwks_url = jwks_url
+        self.client_id = client_id
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self.keys: Dict[str, Tuple[int, int]] = {}  # kid -> (modulus, exponent)
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.metrics = {'validated': 0, 'rejected': 0, 'unsupported': 0, 'jwks_fetches': 0, 'jwks_errors': 0}
+    
+    def validate(self, access_token: str) -> Optional[Dict]:
+        """Character info for a valid token; None when the token cannot be checked locally
+        (not an RS256 JWT, key set unavailable). Raises TokenInvalid for tokens to reject"""
+        try:
+            header_part, payload_part, signature_part = access_token.split('.')
+            header = json.loads(b64url_decode(header_part))
+            claims = json.loads(b64url_decode(payload_part))
+            signature = b64url_decode(signature_part)
+        except (ValueError, TypeError, AttributeError):
+            self.metrics['unsupported'] += 1
+            return None
+        if not isinstance(header, dict) or header.get('alg') != 'RS256':
+            self.metrics['unsupported'] += 1
+            return None
+        
+        key = self._key(header.get('kid'))
+        if not key:
+            self.metrics['unsupported'] += 1
+            return None
+        
+        try:
+            if not rs256_verify(f"{header_part}.{payload_part}".encode(), signature, *key):
+                raise TokenInvalid('signature mismatch')
+            info = self._character_info(claims)
+        except TokenInvalid:
+            self.metrics['rejected'] += 1
+            raise
+        self.metrics['validated'] += 1
+        return info
+    
+    def refresh(self) -> bool:
+        """Fetch the key set now; keeps the cached keys when the fetch fails"""
+        try:
+            response = self.http.get(self.jwks_url, timeout=10)
+            response.raise_for_status()
+            keys = {}
+            for jwk in response.json().get('keys', []):
+                if jwk.get('kty') == 'RSA' and jwk.get('alg', 'RS256') == 'RS256':
+                    keys[jwk.get('kid')] = (b64url_int(jwk['n']), b64url_int(jwk['e']))
+            self.metrics['jwks_fetches'] += 1
+            if keys:
+                self.keys = keys
+            return bool(keys)
+        except Exception as e:
+            self.metrics['jwks_errors'] += 1
+            print(f"Error fetching EVE SSO JWKS: {e}")
+            return False
+        finally:
+            self.fetched_at = time.time()
+    
+    def stats(self) -> Dict:
+        """Tokens validated locally, rejected or left to /oauth/verify, and key set fetches"""
+        return dict(self.metrics, keys=len(self.keys),
+                    key_age=round(time.time() - self.fetched_at, 1) if self.fetched_at else None)
+    
+    def _key(self, kid: str) -> Optional[Tuple[int, int]]:
+        age = time.time() - self.fetched_at
+        if kid in self.keys:
+            if age > self.refresh_interval:
+                self._refresh_in_background()
+            return self.keys[kid]
+        
+        # First use, or a key id we have not seen: fetch in the request, rate limited
+        if age > self.min_refresh_interval:
+            with self.lock:
+                if kid not in self.keys and time.time() - self.fetched_at > self.min_refresh_interval:
+                    self.refresh()
+        return self.keys.get(kid)
+    
+    def _refresh_in_background(self) -> None:
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self.refreshing = False
+        
+        threading.Thread(target=run, name='jwks-refresh', daemon=True).start()
+    
+    def _character_info(self, claims: Dict) -> Dict:
+        # The signature is valid, so anything malformed past this point is rejected rather than retried remotely
+        if not isinstance(claims, dict):
+            raise TokenInvalid('claims are not a JSON object')
+        expires = claims.get('exp')
+        if type(expires) not in (int, float):
+            raise TokenInvalid('missing or non-numeric exp')
+        if expires + self.leeway < time.time():
+            raise TokenInvalid('token expired')
+        if claims.get('iss') not in ISSUERS:
+            raise TokenInvalid(f"unexpected issuer {claims.get('iss')}")
+        audience = claims.get('aud', [])
+        audience = [audience] if isinstance(audience, str) else audience
+        if not isinstance(audience, list) or 'EVE Online' not in audience or \
+                (self.client_id and self.client_id not in audience):
+            raise TokenInvalid('unexpected audience')
+        
+        subject = claims.get('sub')
+        kind, _, character_id = subject.rpartition(':') if isinstance(subject, str) else ('', '', '')
+        if kind != 'CHARACTER:EVE' or not character_id.isdigit():
+            raise TokenInvalid(f"unexpected subject {subject}")
+        
+        scopes = claims.get('scp', [])
+        scopes = [scopes] if isinstance(scopes, str) else scopes
+        if not isinstance(scopes, list) or not all(isinstance(scope, str) for scope in scopes):
+            raise TokenInvalid('unexpected scopes')
+        try:
+            expires_on = datetime.datetime.fromtimestamp(expires, datetime.timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise TokenInvalid('exp out of range')
+        return {
+            'CharacterID': int(character_id),
+            'CharacterName': claims.get('name'),
+            'ExpiresOn': expires_on.strftime('%Y-%m-%dT%H:%M:%S'),
+            'Scopes': ' '.join(scopes),
+            'TokenType': 'Character',
+            'CharacterOwnerHash': claims.get('owner'),
+            'IntellectualProperty': 'EVE'
+        }
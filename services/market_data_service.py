@@ -3,23 +3,68 @@ Market Data Service
 Handles market data collection and price calculations
 """
 
+import time
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 import requests
-from typing import Dict, List, Optional
-from .cache_service import CacheService
+from flask_sqlalchemy import SQLAlchemy
+from .cache_service import CacheService, MISS
+from .http_client import HTTPClient
+from .esi_client import ESIClient
+from .order_book import OrderBook, order_columns, concat_columns, order_rows
+from .market_history_service import MarketHistoryService
+from models.upsert import bulk_upsert
+
+
+# Main NPC trade hubs: name -> (region_id, station_id)
+TRADE_HUBS = {
+    'jita': (10000002, 60003760),
+    'amarr': (10000043, 60008494),
+    'dodixie': (10000032, 60011866),
+    'rens': (10000030, 60004588),
+    'hek': (10000042, 60005686)
+}
 
 
 class MarketDataService:
     """Service for market data collection and price calculations"""
     
-    def __init__(self, cache_service: CacheService):
+    def __init__(self, cache_service: CacheService, http_client: HTTPClient = None,
+                 history_service: MarketHistoryService = None, db: SQLAlchemy = None, market_data_model=None,
+                 page_concurrency: int = 8, page_retries: int = 3, max_order_books: int = 4):
         self.cache_service = cache_service
+        self.db = db
+        self.model = market_data_model
+        # Stored prices older than this are not served and get refreshed from ESI
+        self.price_ttl = 300
+        self.history_service = history_service
+        self.http = http_client or HTTPClient()
+        self.esi = ESIClient(cache_service, self.http)
         self.esi_base_url = "https://esi.evetech.net/latest"
+        self.page_retries = page_retries
+        # Valuing more types than this downloads the whole region book instead of per-type orders
+        self.per_type_valuation_limit = 5
+        self.page_executor = ThreadPoolExecutor(max_workers=page_concurrency, thread_name_prefix='esi-orders')
+        # Full region order books are far too large for the JSON cache table, keep them in memory.
+        # At most max_order_books regions, the least recently downloaded one goes first
+        self.order_books = {}
+        self.max_order_books = max_order_books
+        # One lock per region: a cold download of one region does not hold up requests for another
+        self.order_book_locks = {}
+        self.order_book_locks_guard = threading.Lock()
     
     def get_market_orders(self, region_id: int, type_id: int = None) -> List[Dict]:
         """Get market orders for a region"""
+        if not type_id:
+            # Order dicts are only built for this response, the snapshot keeps columns
+            return order_rows(concat_columns(self.get_region_order_book(region_id)['page_columns']))
+        
         cache_key = f"market_orders_{region_id}_{type_id or 'all'}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
@@ -28,41 +73,266 @@ class MarketDataService:
             if type_id:
                 params['type_id'] = type_id
             
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 300)  # Cache for 5 minutes
+            data = self.esi.get(cache_key, url, 300, params=params,
+                                tags=[f"region:{region_id}"])  # Default: cache for 5 minutes
             return data
         except Exception as e:
             print(f"Error getting market orders: {e}")
             return []
     
+    def get_market_orders_many(self, region_id: int, type_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Get per-type market orders for several types with batched cache reads and writes"""
+        keys = {int(type_id): f"market_orders_{region_id}_{int(type_id)}" for type_id in type_ids}
+        cached = self.cache_service.get_many(keys.values())
+        orders = {type_id: cached[key] for type_id, key in keys.items() if key in cached}
+        stale = self.cache_service.get_stale_many(key for type_id, key in keys.items() if type_id not in orders)
+        
+        url = f"{self.esi_base_url}/markets/{region_id}/orders/"
+        futures = {
+            type_id: self.page_executor.submit(self.esi.request, url, stale[key][1] if key in stale else None,
+                                               params={'type_id': type_id})
+            for type_id, key in keys.items() if type_id not in orders
+        }
+        
+        updates = []
+        for type_id, future in futures.items():
+            key = keys[type_id]
+            try:
+                data, ttl, etag = self.esi.parse(future.result(), 300, stale.get(key))
+                updates.append((key, data, ttl, etag, [f"region:{region_id}"]))
+            except Exception as e:
+                print(f"Error getting market orders for type {type_id}: {e}")
+                data = []
+            orders[type_id] = data
+        
+        self.cache_service.set_many(updates)
+        return orders
+    
+    def get_region_order_book(self, region_id: int) -> Dict:
+        """Get a consolidated snapshot of every order in a region, downloading all pages"""
+        snapshot = self.order_books.get(region_id)
+        if snapshot and snapshot['expires_at'] > time.time():
+            return snapshot
+        
+        # One download per region and process at a time; waiting callers reuse its result
+        with self._order_book_lock(region_id):
+            snapshot = self.order_books.get(region_id)
+            if snapshot and snapshot['expires_at'] > time.time():
+                return snapshot
+            
+            try:
+                snapshot = self._download_order_book(region_id, snapshot)
+                self._keep_order_book(region_id, snapshot)
+                self._store_prices(list(snapshot['book'].prices(snapshot['book'].types).values()))
+                # Build the hub tables once per snapshot so hub queries are pure lookups
+                for hub_region_id, station_id in TRADE_HUBS.values():
+                    if hub_region_id == region_id:
+                        snapshot['book'].for_locations([station_id])
+            except Exception as e:
+                print(f"Error downloading order book for region {region_id}: {e}")
+                if not snapshot:
+                    return {'region_id': region_id, 'book': OrderBook([], region_id), 'pages': 0,
+                            'missing_pages': [], 'page_columns': {}, 'page_etags': {},
+                            'fetched_at': time.time(), 'expires_at': 0}
+            return snapshot
+    
+    def _keep_order_book(self, region_id: int, snapshot: Dict) -> None:
+        """Store a downloaded snapshot, dropping the oldest regions beyond max_order_books"""
+        with self.order_book_locks_guard:
+            self.order_books.pop(region_id, None)
+            self.order_books[region_id] = snapshot
+            while len(self.order_books) > self.max_order_books:
+                del self.order_books[next(iter(self.order_books))]
+    
+    def invalidate_region(self, region_id: int) -> int:
+        """Forget everything cached for a region: this process's order book and every region:{id} entry"""
+        with self._order_book_lock(region_id):
+            self.order_books.pop(region_id, None)
+        return self.cache_service.invalidate_tag(f"region:{region_id}")
+    
+    def _order_book_lock(self, region_id: int) -> threading.Lock:
+        with self.order_book_locks_guard:
+            return self.order_book_locks.setdefault(region_id, threading.Lock())
+    
+    def _download_order_book(self, region_id: int, previous: Dict = None) -> Dict:
+        """Download page 1, fan out the remaining X-Pages concurrently and merge them"""
+        url = f"{self.esi_base_url}/markets/{region_id}/orders/"
+        previous_pages = previous['page_columns'] if previous else {}
+        previous_etags = previous['page_etags'] if previous else {}
+        
+        first = self._fetch_order_page(url, 1, previous_etags.get(1))
+        # A 304 may omit X-Pages; the page count cannot change without page 1 changing
+        total_pages = int(first.headers.get('X-Pages') or (previous['pages'] if previous else 1))
+        expires_in = self.esi.expires_in(first, 300)
+        
+        page_columns = {}
+        page_etags = {}
+        missing_pages = []
+        
+        def collect(page: int, response: Optional[requests.Response]):
+            if response is not None and response.status_code == 304 and page in previous_pages:
+                page_columns[page] = previous_pages[page]
+                page_etags[page] = previous_etags[page]
+            elif response is not None and response.status_code == 200:
+                page_columns[page] = order_columns(response.json())
+                page_etags[page] = response.headers.get('ETag')
+            elif page in previous_pages:
+                # Keep the last good copy of a page that could not be refreshed
+                page_columns[page] = previous_pages[page]
+                page_etags[page] = None
+                missing_pages.append(page)
+            else:
+                missing_pages.append(page)
+        
+        collect(1, first)
+        futures = {
+            self.page_executor.submit(self._fetch_order_page, url, page, previous_etags.get(page)): page
+            for page in range(2, total_pages + 1)
+        }
+        # Parse each page as soon as it arrives instead of after the slowest one
+        for future in as_completed(futures):
+            page = futures[future]
+            try:
+                collect(page, future.result())
+            except Exception as e:
+                print(f"Error getting page {page} of region {region_id} orders: {e}")
+                collect(page, None)
+        
+        if missing_pages:
+            # Retry the gaps soon rather than serving an incomplete book until Expires
+            expires_in = min(expires_in, 60)
+        
+        return {
+            'region_id': region_id,
+            'book': OrderBook.from_columns(concat_columns(page_columns), region_id),
+            'pages': total_pages,
+            'missing_pages': sorted(missing_pages),
+            'page_columns': page_columns,
+            'page_etags': page_etags,
+            'fetched_at': time.time(),
+            'expires_at': time.time() + expires_in
+        }
+    
+    def _fetch_order_page(self, url: str, page: int, etag: str = None) -> requests.Response:
+        """Fetch one order page, retrying transient failures with exponential backoff"""
+        for attempt in range(self.page_retries + 1):
+            try:
+                response = self.esi.request(url, etag, params={'page': page})
+                if response.status_code < 500:
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} for page {page}", response=response)
+            except requests.RequestException as e:
+                if e.response is not None and e.response.status_code < 500:
+                    raise
+                error = e
+            
+            if attempt < self.page_retries:
+                time.sleep(0.5 * 2 ** attempt)
+        raise error
+    
     def get_market_prices(self, region_id: int) -> List[Dict]:
         """Get market prices for a region"""
         cache_key = f"market_prices_{region_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.esi_base_url}/markets/{region_id}/prices/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 3600)  # Cache for 1 hour
+            # Default: cache for 1 hour; a popular key, so serve it stale while one request refreshes it
+            data = self.esi.get(cache_key, url, 3600, stale_while_revalidate=600, tags=[f"region:{region_id}"])
             return data
         except Exception as e:
             print(f"Error getting market prices: {e}")
             return []
     
-    def get_type_prices(self, type_id: int, region_id: int = 10000002) -> Dict:
-        """Get prices for a specific type in a region"""
-        cache_key = f"type_prices_{type_id}_{region_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
-            return cached_data
+    def get_prices_batch(self, type_ids: List[int], region_id: int = 10000002,
+                         location_ids: List[int] = None) -> Dict[int, Dict]:
+        """Get prices for many types at once from the region's columnar order book.
+        
+        With location_ids only orders at those stations/structures are considered.
+        """
+        if location_ids:
+            return self.get_region_order_book(region_id)['book'].for_locations(location_ids).prices(type_ids)
+        
+        snapshot = self.order_books.get(region_id)
+        if not (snapshot and snapshot['expires_at'] > time.time()):
+            # Another worker may have stored a recent snapshot's prices already
+            stored = self._load_prices(type_ids, region_id)
+            if len(stored) == len(set(int(t) for t in type_ids)):
+                return stored
+            snapshot = self.get_region_order_book(region_id)
+        return snapshot['book'].prices(type_ids)
+    
+    def _store_prices(self, prices: List[Dict]) -> None:
+        """Upsert aggregated price rows into market_data in one statement"""
+        if not self.model or not prices:
+            return
+        
+        updated_at = datetime.datetime.utcnow()
+        rows = [{
+            'type_id': price['type_id'],
+            'region_id': price['region_id'],
+            'buy_price': price['buy_price'],
+            'sell_price': price['sell_price'],
+            'volume': price['buy_volume'] + price['sell_volume'],
+            'buy_volume': price['buy_volume'],
+            'sell_volume': price['sell_volume'],
+            'updated_at': updated_at
+        } for price in prices]
+        
+        try:
+            bulk_upsert(self.db, self.model, rows, ['type_id', 'region_id'])
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            print(f"Error storing market prices: {e}")
+    
+    def _load_prices(self, type_ids: List[int], region_id: int) -> Dict[int, Dict]:
+        """Read fresh stored prices for many types with a single indexed query"""
+        if not self.model:
+            return {}
+        
+        try:
+            fresh_after = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.price_ttl)
+            rows = self.model.query.filter(
+                self.model.region_id == region_id,
+                self.model.type_id.in_(set(int(t) for t in type_ids)),
+                self.model.updated_at > fresh_after
+            ).all()
+        except Exception as e:
+            print(f"Error loading market prices: {e}")
+            return {}
+        
+        return {
+            row.type_id: {
+                'type_id': row.type_id,
+                'region_id': row.region_id,
+                'buy_price': row.buy_price or 0,
+                'sell_price': row.sell_price or 0,
+                'buy_volume': row.buy_volume or 0,
+                'sell_volume': row.sell_volume or 0,
+                'spread': row.sell_price - row.buy_price if row.buy_price and row.sell_price else 0
+            }
+            for row in rows
+        }
+    
+    def get_type_prices(self, type_id: int, region_id: int = 10000002, location_ids: List[int] = None) -> Dict:
+        """Get prices for a specific type in a region, optionally only at some stations/structures"""
+        if location_ids:
+            book = self._valuation_book(np.array([type_id]), region_id, location_ids)
+            return book.prices([type_id])[type_id]
+        
+        # A loaded region snapshot answers without another request
+        snapshot = self.order_books.get(region_id)
+        if snapshot and snapshot['expires_at'] > time.time():
+            return snapshot['book'].prices([type_id])[type_id]
+        
+        stored = self._load_prices([type_id], region_id)
+        if type_id in stored:
+            return stored[type_id]
         
         try:
             # Get market orders for the type
@@ -94,7 +364,7 @@ class MarketDataService:
                 'spread': best_sell_price - best_buy_price if best_buy_price and best_sell_price else 0
             }
             
-            self.cache_service.set(cache_key, prices, 300)  # Cache for 5 minutes
+            self._store_prices([prices])
             return prices
         except Exception as e:
             print(f"Error getting type prices: {e}")
@@ -108,69 +378,136 @@ class MarketDataService:
                 'spread': 0
             }
     
-    def get_historical_prices(self, type_id: int, region_id: int = 10000002) -> List[Dict]:
-        """Get historical prices for a type (if available)"""
-        cache_key = f"historical_prices_{type_id}_{region_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
-            return cached_data
-        
-        try:
-            # This would typically use a third-party service like Fuzzworks
-            # For now, we'll return empty data
-            historical_data = []
-            self.cache_service.set(cache_key, historical_data, 3600)  # Cache for 1 hour
-            return historical_data
-        except Exception as e:
-            print(f"Error getting historical prices: {e}")
+    def get_historical_prices(self, type_id: int, region_id: int = 10000002, days: int = None) -> List[Dict]:
+        """Get daily historical prices for a type from the market history table"""
+        if not self.history_service:
             return []
+        return self.history_service.get_history(type_id, region_id, days)
+    
+    def refresh_history(self, type_ids: List[int], region_id: int = 10000002) -> Dict[int, int]:
+        """Append new history days for many types, returns the number of rows added per type"""
+        if not self.history_service:
+            return {}
+        return self.history_service.refresh(region_id, type_ids)
+    
+    def get_price_statistics(self, type_ids: List[int], region_id: int = 10000002) -> Dict[int, Dict]:
+        """Get rolling VWAP, volatility and average daily volume from stored history, without calling ESI"""
+        if not self.history_service:
+            return {}
+        return self.history_service.get_statistics(type_ids, region_id)
     
     def calculate_market_value(self, type_id: int, quantity: int, region_id: int = 10000002) -> Dict:
-        """Calculate market value for a quantity of items"""
-        prices = self.get_type_prices(type_id, region_id)
+        """Calculate market value for a quantity of items by walking the order book depth"""
+        valuation = self.value_items([(type_id, quantity)], region_id)['items'][0]
+        buy_value = valuation['sell_into_buy_orders']['value']
+        sell_value = valuation['buy_from_sell_orders']['value']
         
         return {
             'type_id': type_id,
             'quantity': quantity,
             'region_id': region_id,
-            'buy_value': prices['buy_price'] * quantity,
-            'sell_value': prices['sell_price'] * quantity,
-            'average_value': ((prices['buy_price'] + prices['sell_price']) / 2) * quantity if prices['buy_price'] and prices['sell_price'] else 0
+            'buy_value': buy_value,
+            'sell_value': sell_value,
+            'average_value': (buy_value + sell_value) / 2 if buy_value and sell_value else 0,
+            'sell_into_buy_orders': valuation['sell_into_buy_orders'],
+            'buy_from_sell_orders': valuation['buy_from_sell_orders']
         }
     
+    def value_items(self, items: List[Tuple[int, int]], region_id: int = 10000002,
+                    location_ids: List[int] = None) -> Dict:
+        """Value a list of (type_id, quantity) pairs against the order book in one vectorized pass.
+        
+        Repeated type_ids are summed first so one item cannot consume the same depth twice.
+        """
+        quantities = {}
+        for type_id, quantity in items:
+            quantities[int(type_id)] = quantities.get(int(type_id), 0) + int(quantity)
+        type_ids = np.fromiter(quantities.keys(), dtype=np.int64, count=len(quantities))
+        amounts = np.fromiter(quantities.values(), dtype=np.int64, count=len(quantities))
+        
+        book = self._valuation_book(type_ids, region_id, location_ids)
+        sides = {
+            # Selling walks the buy orders down, buying walks the sell orders up
+            'sell_into_buy_orders': book.walk(type_ids, amounts, 'buy'),
+            'buy_from_sell_orders': book.walk(type_ids, amounts, 'sell')
+        }
+        
+        valued = []
+        for i, type_id in enumerate(type_ids):
+            entry = {'type_id': int(type_id), 'quantity': int(amounts[i])}
+            for name, fills in sides.items():
+                entry[name] = {
+                    'value': float(fills['value'][i]),
+                    'filled_quantity': int(fills['filled'][i]),
+                    'unfilled_quantity': int(amounts[i] - fills['filled'][i]),
+                    'average_price': float(fills['average_price'][i]),
+                    'best_price': float(fills['best_price'][i]),
+                    'worst_price': float(fills['worst_price'][i]),
+                    'slippage': float(fills['slippage'][i])
+                }
+            valued.append(entry)
+        
+        return {
+            'region_id': region_id,
+            'items': valued,
+            'totals': {
+                name: {
+                    'value': float(fills['value'].sum()),
+                    'unfilled_quantity': int((amounts - fills['filled']).sum())
+                }
+                for name, fills in sides.items()
+            }
+        }
+    
+    def _valuation_book(self, type_ids: np.ndarray, region_id: int, location_ids: List[int] = None) -> OrderBook:
+        """Use the region snapshot when loaded, else per-type orders for a handful of types"""
+        snapshot = self.order_books.get(region_id)
+        if snapshot and snapshot['expires_at'] > time.time():
+            book = snapshot['book']
+        elif len(type_ids) <= self.per_type_valuation_limit:
+            orders = []
+            for type_orders in self.get_market_orders_many(region_id, type_ids).values():
+                orders.extend(type_orders)
+            book = OrderBook(orders, region_id)
+        else:
+            book = self.get_region_order_book(region_id)['book']
+        
+        return book.for_locations(location_ids) if location_ids else book
+    
+    def resolve_hub(self, hub: str) -> Optional[Tuple[int, List[int]]]:
+        """Region and station list for a trade hub name such as 'jita'"""
+        if hub.lower() not in TRADE_HUBS:
+            return None
+        region_id, station_id = TRADE_HUBS[hub.lower()]
+        return region_id, [station_id]
+    
     def get_region_info(self, region_id: int) -> Dict:
         """Get region information"""
         cache_key = f"region_{region_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.esi_base_url}/universe/regions/{region_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            data = self.esi.get(cache_key, url, 86400)  # Default: cache for 24 hours
             return data
         except Exception as e:
             print(f"Error getting region info: {e}")
-            return {'region_id': region_id, 'name': f'Region {region_id}'}
+            placeholder = {'region_id': region_id, 'name': f'Region {region_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
     
     def get_market_groups(self) -> List[Dict]:
         """Get market groups"""
         cache_key = "market_groups"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.esi_base_url}/markets/groups/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            data = self.esi.get(cache_key, url, 86400)  # Default: cache for 24 hours
             return data
         except Exception as e:
             print(f"Error getting market groups: {e}")
@@ -179,18 +516,16 @@ class MarketDataService:
     def get_market_group_info(self, group_id: int) -> Dict:
         """Get market group information"""
         cache_key = f"market_group_{group_id}"
-        cached_data = self.cache_service.get(cache_key)
-        if cached_data:
+        cached_data = self.cache_service.get(cache_key, MISS)
+        if cached_data is not MISS:
             return cached_data
         
         try:
             url = f"{self.esi_base_url}/markets/groups/{group_id}/"
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            data = response.json()
-            self.cache_service.set(cache_key, data, 86400)  # Cache for 24 hours
+            data = self.esi.get(cache_key, url, 86400)  # Default: cache for 24 hours
             return data
         except Exception as e:
             print(f"Error getting market group info: {e}")
-            return {'group_id': group_id, 'name': f'Group {group_id}'}
+            placeholder = {'group_id': group_id, 'name': f'Group {group_id}'}
+            self.cache_service.set_negative(cache_key, placeholder)
+            return placeholder
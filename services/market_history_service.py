@@ -0,0 +1,237 @@
+"""
+Market History Service
+Ingests daily market history from ESI and computes rolling price statistics
+"""
+
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func
+
+from .cache_service import CacheService
+from .http_client import HTTPClient
+from .esi_client import ESIClient
+from models.upsert import bulk_upsert
+
+
+class MarketHistoryService:
+    """Service for the append-only daily market history table"""
+    
+    WINDOWS = (7, 30, 90)
+    
+    def __init__(self, db: SQLAlchemy, market_history_model, cache_service: CacheService,
+                 http_client: HTTPClient = None, max_workers: int = 8):
+        self.db = db
+        self.model = market_history_model
+        self.cache_service = cache_service
+        self.http = http_client or HTTPClient()
+        self.esi = ESIClient(cache_service, self.http)
+        self.esi_base_url = "https://esi.evetech.net/latest"
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='esi-history')
+    
+    def refresh(self, region_id: int, type_ids: Iterable[int]) -> Dict[int, int]:
+        """Append the days ESI has that the table doesn't yet. Returns new row counts per type.
+        
+        History is published once a day, so each type is only re-requested after the
+        previous response's Expires, and then conditionally with its ETag.
+        """
+        url = f"{self.esi_base_url}/markets/{region_id}/history/"
+        marker_keys = {type_id: f"market_history_{region_id}_{type_id}" for type_id in set(int(t) for t in type_ids)}
+        fresh = self.cache_service.get_many(marker_keys.values())
+        stale_markers = self.cache_service.get_stale_many(key for key in marker_keys.values() if key not in fresh)
+        pending = {}
+        for type_id, marker_key in marker_keys.items():
+            if marker_key in fresh:
+                continue
+            stale = stale_markers.get(marker_key)
+            # Workers only do HTTP; the cache and the table are written from this thread
+            future = self.executor.submit(self.esi.request, url, stale[1] if stale else None,
+                                          params={'type_id': type_id})
+            pending[type_id] = (marker_key, stale, future)
+        
+        if not pending:
+            return {}
+        
+        latest = self._latest_dates(region_id, list(pending))
+        added = {}
+        rows = []
+        markers = []
+        for type_id, (marker_key, stale, future) in pending.items():
+            try:
+                response = future.result()
+                ttl = self.esi.expires_in(response, 3600)
+                if response.status_code == 304 and stale:
+                    markers.append((marker_key, stale[0], ttl, stale[1], [f"region:{region_id}"]))
+                    added[type_id] = 0
+                    continue
+                response.raise_for_status()
+                
+                new_rows = self._new_rows(region_id, type_id, response.json(), latest.get(type_id))
+                rows.extend(new_rows)
+                added[type_id] = len(new_rows)
+                markers.append((marker_key, {'rows_added': len(new_rows)}, ttl, response.headers.get('ETag'),
+                                [f"region:{region_id}"]))
+            except Exception as e:
+                print(f"Error getting market history for type {type_id} in region {region_id}: {e}")
+        
+        if rows:
+            try:
+                # Another worker may be storing the same days: an overlapping refresh overwrites them with equal values
+                bulk_upsert(self.db, self.model, rows, ['region_id', 'type_id', 'date'])
+                self.db.session.commit()
+            except Exception as e:
+                self.db.session.rollback()
+                print(f"Error storing market history: {e}")
+                return {}
+        
+        # Markers are only written once the rows they vouch for are committed
+        self.cache_service.set_many(markers)
+        return added
+    
+    def _latest_dates(self, region_id: int, type_ids: List[int]) -> Dict[int, datetime.date]:
+        """Most recent stored day per type, in one grouped query"""
+        try:
+            latest = self.db.session.query(self.model.type_id, func.max(self.model.date)).filter(
+                self.model.region_id == region_id,
+                self.model.type_id.in_(type_ids)
+            ).group_by(self.model.type_id).all()
+            return {type_id: date for type_id, date in latest}
+        except Exception as e:
+            print(f"Error getting latest market history dates: {e}")
+            return {}
+    
+    def _new_rows(self, region_id: int, type_id: int, history: List[Dict], latest: datetime.date = None) -> List[Dict]:
+        """ESI history days that are newer than the latest stored day"""
+        rows = []
+        for day in history:
+            date = datetime.date.fromisoformat(day['date'])
+            if latest and date <= latest:
+                continue
+            rows.append({
+                'region_id': region_id,
+                'type_id': type_id,
+                'date': date,
+                'average': day.get('average', 0.0),
+                'highest': day.get('highest', 0.0),
+                'lowest': day.get('lowest', 0.0),
+                'order_count': day.get('order_count', 0),
+                'volume': day.get('volume', 0)
+            })
+        return rows
+    
+    def get_history(self, type_id: int, region_id: int = 10000002, days: int = None) -> List[Dict]:
+        """Daily history rows for a type, oldest first, refreshing from ESI when due"""
+        self.refresh(region_id, [type_id])
+        
+        try:
+            query = self.model.query.filter_by(region_id=region_id, type_id=type_id)
+            if days:
+                since = datetime.datetime.utcnow().date() - datetime.timedelta(days=days)
+                query = query.filter(self.model.date >= since)
+            return [row.to_dict() for row in query.order_by(self.model.date).all()]
+        except Exception as e:
+            print(f"Error getting market history: {e}")
+            return []
+    
+    def get_statistics(self, type_ids: Iterable[int], region_id: int = 10000002,
+                       windows: Tuple[int, ...] = WINDOWS) -> Dict[int, Dict]:
+        """Rolling VWAP, volatility and average daily volume per type, read from the table only.
+        
+        Every type is laid out on the same calendar of days ending at the latest stored
+        day, with zero volume on days without trades, so all types and windows are
+        computed with array operations instead of per-row loops.
+        """
+        type_ids = sorted(set(int(t) for t in type_ids))
+        if not type_ids:
+            return {}
+        longest = max(windows)
+        
+        try:
+            end = self.db.session.query(func.max(self.model.date)).filter(
+                self.model.region_id == region_id,
+                self.model.type_id.in_(type_ids)
+            ).scalar()
+            rows = []
+            if end:
+                start = end - datetime.timedelta(days=longest)
+                rows = self.db.session.query(
+                    self.model.type_id, self.model.date, self.model.average, self.model.volume
+                ).filter(
+                    self.model.region_id == region_id,
+                    self.model.type_id.in_(type_ids),
+                    self.model.date >= start
+                ).all()
+        except Exception as e:
+            print(f"Error getting market history statistics: {e}")
+            end, rows = None, []
+        
+        length = longest + 1
+        volume = np.zeros((len(type_ids), length))
+        price = np.full((len(type_ids), length), np.nan)
+        if rows:
+            index = {type_id: i for i, type_id in enumerate(type_ids)}
+            row_index = np.fromiter((index[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+            column = np.fromiter(((row[1] - start).days for row in rows), dtype=np.int64, count=len(rows))
+            price[row_index, column] = [row[2] for row in rows]
+            volume[row_index, column] = [row[3] for row in rows]
+        
+        returns = self._log_returns(price)
+        turnover = np.nan_to_num(price) * volume
+        
+        aggregates = {}
+        for window in windows:
+            window_volume = volume[:, -window:].sum(axis=1)
+            window_returns = returns[:, -window:]
+            valid = ~np.isnan(window_returns)
+            count = valid.sum(axis=1)
+            mean = np.divide(np.nansum(window_returns, axis=1), count, out=np.zeros(len(type_ids)), where=count > 0)
+            squares = np.nansum((window_returns - mean[:, None]) ** 2, axis=1)
+            
+            aggregates[window] = {
+                'vwap': np.divide(turnover[:, -window:].sum(axis=1), window_volume,
+                                  out=np.zeros(len(type_ids)), where=window_volume > 0),
+                # Standard deviation of daily log returns between consecutive trading days
+                'volatility': np.sqrt(np.divide(squares, count - 1, out=np.zeros(len(type_ids)), where=count > 1)),
+                'average_daily_volume': window_volume / window,
+                'days_traded': (volume[:, -window:] > 0).sum(axis=1)
+            }
+        
+        return {
+            type_id: {
+                'type_id': type_id,
+                'region_id': region_id,
+                'as_of': end.isoformat() if end else None,
+                'windows': {
+                    f'{window}d': {
+                        'vwap': float(values['vwap'][i]),
+                        'volatility': float(values['volatility'][i]),
+                        'average_daily_volume': float(values['average_daily_volume'][i]),
+                        'days_traded': int(values['days_traded'][i])
+                    }
+                    for window, values in aggregates.items()
+                }
+            }
+            for i, type_id in enumerate(type_ids)
+        }
+    
+    @staticmethod
+    def _log_returns(price: np.ndarray) -> np.ndarray:
+        """Log return of each trading day against the previous trading day, NaN elsewhere"""
+        traded = ~np.isnan(price)
+        positions = np.where(traded, np.arange(price.shape[1]), 0)
+        # Index of the last trading day at or before each column, carried forward
+        last_traded = np.maximum.accumulate(positions, axis=1)
+        previous = np.zeros_like(last_traded)
+        previous[:, 1:] = last_traded[:, :-1]
+        
+        rows = np.arange(price.shape[0])[:, None]
+        previous_price = price[rows, previous]
+        has_previous = traded & ~np.isnan(previous_price) & (np.arange(price.shape[1]) > 0)
+        has_previous &= (previous_price > 0) & (price > 0)
+        
+        returns = np.full(price.shape, np.nan)
+        returns[has_previous] = np.log(price[has_previous] / previous_price[has_previous])
+        return returns
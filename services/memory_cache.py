@@ -0,0 +1,124 @@
+"""
+Memory Cache
+Bounded in-process LRU tier with per-entry expiry
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .cache_backend import CacheBackend
+
+
+class MemoryCache(CacheBackend):
+    """LRU cache bounded by entry count and approximate payload bytes, private to the process"""
+    
+    name = 'memory'
+    
+    def __init__(self, max_entries: int = 50000, max_bytes: int = 128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (data, expires_at timestamp, etag, size)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Fresh data for key, or None. Counts a hit or a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() >= entry[1]:
+                # Keep it: the ETag still allows a conditional refresh
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float, str]]:
+        """(data, expires_at, etag) regardless of expiry, without touching the counters"""
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry[:3] if entry else None
+    
+    def set(self, key: str, data: Any, expires_at: float, etag: str = None, size: int = 0,
+            blob: bytes = None) -> None:
+        """Store an entry; size is the approximate payload size in bytes (e.g. its encoded length)"""
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous:
+                self.bytes -= previous[3]
+            if size > self.max_bytes:
+                # Larger than the whole tier, leave it to the database
+                return
+            self.entries[key] = (data, expires_at, etag, size)
+            self.bytes += size
+            self._evict()
+    
+    def touch(self, key: str, expires_at: float) -> None:
+        """Move an entry's expiry without replacing its data"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                self.entries[key] = (entry[0], expires_at, entry[2], entry[3])
+                self.entries.move_to_end(key)
+    
+    def delete(self, key: str) -> None:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry:
+                self.bytes -= entry[3]
+    
+    def clear_expired(self) -> int:
+        """Drop expired entries, returns how many were removed"""
+        now = time.time()
+        with self.lock:
+            expired = [key for key, entry in self.entries.items() if now >= entry[1]]
+            for key in expired:
+                self.bytes -= self.entries.pop(key)[3]
+            return len(expired)
+    
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+    
+    def _evict(self) -> None:
+        """Drop least recently used entries until both limits hold. Caller holds the lock"""
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+            key, entry = self.entries.popitem(last=False)
+            self.bytes -= entry[3]
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(key)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def stats(self) -> Dict:
+        """Size and hit/miss/eviction counters"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.name,
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,101 @@
+"""
+Name Resolver
+Bulk ID-to-name resolution through ESI /universe/names/
+"""
+
+import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .cache_backend import CacheBackend
+from .cache_codec import CacheCodec
+from .cache_service import CacheService, MISS, NEGATIVE
+from .http_client import HTTPClient
+
+
+class NameResolver:
+    """Resolves many IDs to names with as few POST /universe/names/ calls as possible"""
+    
+    BATCH_SIZE = 1000  # ESI limit per request
+    MAX_ID = 2147483647  # /universe/names/ only accepts int32 IDs, so no player structures
+    
+    def __init__(self, cache_service: CacheService, http_client: HTTPClient,
+                 base_url: str = "https://esi.evetech.net/latest"):
+        self.cache_service = cache_service
+        self.http = http_client
+        self.base_url = base_url
+    
+    def resolve(self, ids: Iterable[int]) -> Dict[int, Dict]:
+        """Resolve IDs to {'id', 'name', 'category'}; IDs ESI cannot name are left out"""
+        # The cache service's hot tier answers repeated IDs, bounded and expiring with the entries
+        result = {}
+        wanted = {int(i) for i in ids if i}
+        cached = self.cache_service.get_many(f"name_{entity_id}" for entity_id in wanted)
+        unknown = []
+        for entity_id in wanted:
+            cached_data = cached.get(f"name_{entity_id}", MISS)
+            if cached_data is MISS:
+                if entity_id <= self.MAX_ID:
+                    unknown.append(entity_id)
+            elif cached_data:
+                result[entity_id] = cached_data
+            # None: ESI recently could not name it (negative entry)
+        
+        for start in range(0, len(unknown), self.BATCH_SIZE):
+            batch = unknown[start:start + self.BATCH_SIZE]
+            entries = self._post_names(batch)
+            for entry in entries:
+                result[entry['id']] = entry
+            # Cache for 24 hours
+            self.cache_service.set_many((f"name_{entry['id']}", entry, 86400, None) for entry in entries)
+            named = {entry['id'] for entry in entries}
+            self.cache_service.set_negative_many((f"name_{entity_id}", None) for entity_id in batch
+                                                 if entity_id not in named)
+        
+        return result
+    
+    def _post_names(self, ids: List[int]) -> List[Dict]:
+        """POST one batch; ESI rejects the whole batch if any ID is invalid, so split and retry"""
+        try:
+            response = self.http.post(f"{self.base_url}/universe/names/", json=ids)
+            if response.status_code == 404 and len(ids) > 1:
+                middle = len(ids) // 2
+                return self._post_names(ids[:middle]) + self._post_names(ids[middle:])
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            print(f"Error resolving names for {len(ids)} IDs: {e}")
+            return []
+
+
+class BackendNameCache:
+    """The calls NameResolver makes on CacheService, served by a bare CacheBackend.
+    
+    For callers without a cache_entries table (the legacy app.py). Negative
+    entries use CacheService's {NEGATIVE: placeholder} form and read back as the
+    placeholder; keys with no fresh entry are absent, as from CacheService.get_many.
+    """
+    
+    def __init__(self, backend: CacheBackend, codec: CacheCodec = None, negative_ttl: int = 300):
+        self.backend = backend
+        self.codec = codec or CacheCodec()
+        self.negative_ttl = negative_ttl
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        result = {}
+        for key, data in self.backend.get_many(list(keys)).items():
+            if type(data) is dict and len(data) == 1 and NEGATIVE in data:
+                data = data[NEGATIVE]
+            result[key] = data
+        return result
+    
+    def set_many(self, items: Iterable[Tuple]) -> None:
+        """Store many (key, data, ttl, etag) entries"""
+        now = time.time()
+        entries = []
+        for key, data, ttl, etag, *_ in items:
+            blob, size = self.codec.encode(data)
+            entries.append((key, data, now + ttl, etag, size, blob))
+        self.backend.set_many(entries)
+    
+    def set_negative_many(self, items: Iterable[Tuple[str, Any]], ttl: int = None) -> None:
+        self.set_many([(key, {NEGATIVE: placeholder}, ttl or self.negative_ttl, None) for key, placeholder in items])
@@ -0,0 +1,235 @@
+"""
+Order Book
+Columnar in-memory snapshot of a region's market orders
+"""
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+# Integer fields of an ESI market order, stored as int64 columns
+INT_FIELDS = ('order_id', 'type_id', 'location_id', 'system_id', 'volume_remain', 'volume_total',
+              'min_volume', 'duration')
+
+
+def order_columns(orders: List[Dict]) -> Dict[str, np.ndarray]:
+    """ESI order dicts as NumPy columns, a fraction of their size and enough to rebuild them"""
+    count = len(orders)
+    columns = {
+        field: np.fromiter((o.get(field, 0) for o in orders), dtype=np.int64, count=count) for field in INT_FIELDS
+    }
+    columns['price'] = np.fromiter((o.get('price', 0.0) for o in orders), dtype=np.float64, count=count)
+    columns['is_buy_order'] = np.fromiter((o.get('is_buy_order', False) for o in orders), dtype=bool, count=count)
+    # NumPy does not parse the trailing Z of ESI timestamps, they are all UTC anyway
+    columns['issued'] = np.array([(o.get('issued') or 'NaT').rstrip('Z') for o in orders], dtype='datetime64[s]')
+    columns['range'] = np.array([o.get('range', '') for o in orders], dtype=str)
+    return columns
+
+
+def concat_columns(pages: Dict[int, Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Join page number -> order_columns output into one set of columns, in page order"""
+    if not pages:
+        return order_columns([])
+    ordered = [pages[page] for page in sorted(pages)]
+    return {field: np.concatenate([page[field] for page in ordered]) for field in ordered[0]}
+
+
+def order_rows(columns: Dict[str, np.ndarray]) -> List[Dict]:
+    """Rebuild ESI order dicts from order_columns output"""
+    values = {field: column.tolist() for field, column in columns.items() if field != 'issued'}
+    values['issued'] = [None if issued == 'NaT' else f"{issued}Z"
+                        for issued in np.datetime_as_string(columns['issued'], unit='s').tolist()]
+    fields = sorted(values)
+    return [dict(zip(fields, row)) for row in zip(*(values[field] for field in fields))]
+
+
+class OrderBook:
+    """Region order book stored as NumPy columns sorted by type_id"""
+    
+    # Memoized station/structure sub-books per snapshot; ad-hoc location lists beyond this are not kept
+    MAX_LOCATION_BOOKS = 64
+    
+    def __init__(self, orders: List[Dict], region_id: int = None):
+        self.region_id = region_id
+        count = len(orders)
+        
+        type_id = np.fromiter((o.get('type_id', 0) for o in orders), dtype=np.int64, count=count)
+        price = np.fromiter((o.get('price', 0.0) for o in orders), dtype=np.float64, count=count)
+        volume_remain = np.fromiter((o.get('volume_remain', 0) for o in orders), dtype=np.int64, count=count)
+        is_buy = np.fromiter((o.get('is_buy_order', False) for o in orders), dtype=bool, count=count)
+        location_id = np.fromiter((o.get('location_id', 0) for o in orders), dtype=np.int64, count=count)
+        self._sort_columns(type_id, price, volume_remain, is_buy, location_id)
+    
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray], region_id: int = None) -> 'OrderBook':
+        """Book over order_columns output, without going through order dicts"""
+        book = cls.__new__(cls)
+        book.region_id = region_id
+        book._sort_columns(columns['type_id'], columns['price'], columns['volume_remain'],
+                           columns['is_buy_order'], columns['location_id'])
+        return book
+    
+    def _sort_columns(self, type_id, price, volume_remain, is_buy, location_id) -> None:
+        # Sort by type; within a type sells come first, then buys, each best price first
+        order = np.lexsort((np.where(is_buy, -price, price), is_buy, type_id))
+        self._set_columns(type_id[order], price[order], volume_remain[order], is_buy[order], location_id[order])
+    
+    def _set_columns(self, type_id, price, volume_remain, is_buy, location_id) -> None:
+        """Adopt already sorted columns and build the derived tables"""
+        self.type_id = type_id
+        self.price = price
+        self.volume_remain = volume_remain
+        self.is_buy = is_buy
+        self.location_id = location_id
+        
+        self._build_price_table()
+        self.ladders = {'sell': self._build_ladder(~self.is_buy), 'buy': self._build_ladder(self.is_buy)}
+        
+        # Row positions grouped by location, for station/structure scoped books
+        self.location_order = np.argsort(self.location_id, kind='stable')
+        self.locations = self.location_id[self.location_order]
+        self.location_books = {}
+    
+    def __len__(self) -> int:
+        return len(self.type_id)
+    
+    def _build_price_table(self) -> None:
+        """Best bid/ask and total volumes for every type in one grouped reduction"""
+        self.types, self.type_starts = np.unique(self.type_id, return_index=True)
+        if not len(self.types):
+            self.best_bid = self.best_ask = np.zeros(0)
+            self.buy_volume = self.sell_volume = np.zeros(0, dtype=np.int64)
+            return
+        
+        sell_prices = np.where(self.is_buy, np.inf, self.price)
+        buy_prices = np.where(self.is_buy, self.price, -np.inf)
+        self.best_ask = np.minimum.reduceat(sell_prices, self.type_starts)
+        self.best_bid = np.maximum.reduceat(buy_prices, self.type_starts)
+        self.sell_volume = np.add.reduceat(np.where(self.is_buy, 0, self.volume_remain), self.type_starts)
+        self.buy_volume = np.add.reduceat(np.where(self.is_buy, self.volume_remain, 0), self.type_starts)
+    
+    def _build_ladder(self, mask: np.ndarray) -> Dict[str, np.ndarray]:
+        """One side of the book with prefix sums of volume and cost along each type's ladder"""
+        price = self.price[mask]
+        volume = self.volume_remain[mask]
+        types, starts = np.unique(self.type_id[mask], return_index=True)
+        return {
+            'types': types,
+            'starts': starts,
+            'ends': np.append(starts[1:], len(price)).astype(np.int64),
+            'price': price,
+            # Leading zero so cum_volume[i] is the volume strictly before order i
+            'cum_volume': np.concatenate(([0], np.cumsum(volume))),
+            'cum_cost': np.concatenate(([0.0], np.cumsum(volume * price)))
+        }
+    
+    def walk(self, type_ids: np.ndarray, quantities: np.ndarray, side: str) -> Dict[str, np.ndarray]:
+        """Fill each quantity against one side of the book, best price first.
+        
+        side='sell' walks sell orders (the cost of buying), side='buy' walks buy
+        orders (the proceeds of selling). Returns filled quantity, total value,
+        average/best/worst fill price and slippage versus the best price per item.
+        """
+        ladder = self.ladders[side]
+        type_ids = np.asarray(type_ids, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        empty = np.zeros(len(type_ids))
+        if not len(ladder['types']):
+            return {'filled': empty.astype(np.int64), 'value': empty, 'average_price': empty,
+                    'best_price': empty, 'worst_price': empty, 'slippage': empty}
+        
+        index = np.minimum(np.searchsorted(ladder['types'], type_ids), len(ladder['types']) - 1)
+        found = ladder['types'][index] == type_ids
+        start = ladder['starts'][index]
+        end = np.where(found, ladder['ends'][index], start)
+        
+        cum_volume = ladder['cum_volume']
+        cum_cost = ladder['cum_cost']
+        base = cum_volume[start]
+        filled = np.clip(np.minimum(quantities, cum_volume[end] - base), 0, None)
+        has_fill = filled > 0
+        
+        # Binary search for the order that completes each fill, then interpolate inside it
+        target = base + filled
+        last = np.searchsorted(cum_volume, target, side='left') - 1
+        last = np.clip(last, start, np.maximum(end - 1, start))
+        value = cum_cost[last] - cum_cost[start] + (target - cum_volume[last]) * ladder['price'][last]
+        value = np.where(has_fill, value, 0.0)
+        
+        best_price = np.where(has_fill, ladder['price'][start], 0.0)
+        worst_price = np.where(has_fill, ladder['price'][last], 0.0)
+        average_price = np.divide(value, filled, out=np.zeros(len(value)), where=has_fill)
+        slippage = np.divide(np.abs(average_price - best_price), best_price,
+                             out=np.zeros(len(value)), where=has_fill & (best_price > 0))
+        
+        return {
+            'filled': filled,
+            'value': value,
+            'average_price': average_price,
+            'best_price': best_price,
+            'worst_price': worst_price,
+            'slippage': slippage
+        }
+    
+    def for_locations(self, location_ids: Iterable[int]) -> 'OrderBook':
+        """Sub-book with only the orders at the given stations/structures.
+        
+        Built from the location index without touching the order dicts, and memoized
+        for the life of this snapshot so repeated hub queries are served from memory.
+        """
+        key = frozenset(int(location_id) for location_id in location_ids)
+        book = self.location_books.get(key)
+        if book is not None:
+            return book
+        
+        wanted = np.fromiter(key, dtype=np.int64, count=len(key))
+        starts = np.searchsorted(self.locations, wanted, side='left')
+        ends = np.searchsorted(self.locations, wanted, side='right')
+        if len(wanted):
+            rows = np.concatenate([self.location_order[start:end] for start, end in zip(starts, ends)])
+        else:
+            rows = np.zeros(0, dtype=np.int64)
+        # Row positions in ascending order keep the (type, side, price) sort
+        rows.sort()
+        
+        book = OrderBook.__new__(OrderBook)
+        book.region_id = self.region_id
+        book._set_columns(self.type_id[rows], self.price[rows], self.volume_remain[rows],
+                          self.is_buy[rows], self.location_id[rows])
+        if len(self.location_books) < self.MAX_LOCATION_BOOKS:
+            self.location_books[key] = book
+        return book
+    
+    def prices(self, type_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Price summary for each requested type, in the same shape as MarketDataService.get_type_prices"""
+        requested = np.unique(np.fromiter((int(t) for t in type_ids), dtype=np.int64))
+        if not len(self.types):
+            return {int(t): self._price_entry(t, 0.0, 0.0, 0, 0) for t in requested}
+        
+        index = np.minimum(np.searchsorted(self.types, requested), len(self.types) - 1)
+        found = self.types[index] == requested
+        
+        # Types without any order on a side report 0, like the per-type path does
+        best_ask = np.where(found, self.best_ask[index], np.inf)
+        best_bid = np.where(found, self.best_bid[index], -np.inf)
+        sell_price = np.where(np.isfinite(best_ask), best_ask, 0.0)
+        buy_price = np.where(np.isfinite(best_bid), best_bid, 0.0)
+        sell_volume = np.where(found, self.sell_volume[index], 0)
+        buy_volume = np.where(found, self.buy_volume[index], 0)
+        
+        return {
+            int(type_id): self._price_entry(type_id, buy_price[i], sell_price[i], buy_volume[i], sell_volume[i])
+            for i, type_id in enumerate(requested)
+        }
+    
+    def _price_entry(self, type_id, buy_price, sell_price, buy_volume, sell_volume) -> Dict:
+        return {
+            'type_id': int(type_id),
+            'region_id': self.region_id,
+            'buy_price': float(buy_price),
+            'sell_price': float(sell_price),
+            'buy_volume': int(buy_volume),
+            'sell_volume': int(sell_volume),
+            'spread': float(sell_price - buy_price) if buy_price and sell_price else 0
+        }
@@ -0,0 +1,308 @@
+"""
+Shared Cache
+Hot cache tier shared by all worker processes of a host, stored in SQLite (WAL)
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from .cache_backend import CacheBackend
+from .cache_codec import CacheCodec
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    cache_key TEXT PRIMARY KEY,
+    blob BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    etag TEXT,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed ON cache_entries (accessed);
+CREATE TABLE IF NOT EXISTS cache_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_totals VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN
+    UPDATE cache_totals SET entries = entries + 1, bytes = bytes + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN
+    UPDATE cache_totals SET entries = entries - 1, bytes = bytes - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_resize AFTER UPDATE OF size ON cache_entries BEGIN
+    UPDATE cache_totals SET bytes = bytes - old.size + new.size;
+END;
+"""
+
+UPSERT = """
+INSERT INTO cache_entries (cache_key, blob, expires_at, etag, size, accessed) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (cache_key) DO UPDATE SET blob = excluded.blob, expires_at = excluded.expires_at,
+    etag = excluded.etag, size = excluded.size, accessed = excluded.accessed
+"""
+
+
+class SharedCache(CacheBackend):
+    """LRU cache in one SQLite database file that every process on the host opens.
+    
+    Entries hold CacheCodec blobs, so a hit decodes the payload. The database runs
+    in WAL mode: readers never block each other or the single writer. Totals are
+    kept by triggers so the limits can be checked on every write; when they are
+    exceeded the least recently used entries are evicted down to 90% of them.
+    """
+    
+    name = 'sqlite'
+    ACCESS_RESOLUTION = 60.0  # seconds; a hit moves an entry in the LRU order at most this often
+    BATCH_SIZE = 500
+    
+    def __init__(self, path: str, codec: CacheCodec = None, max_entries: int = 50000,
+                 max_bytes: int = 128 * 1024 * 1024, busy_timeout: float = 5.0):
+        self.path = path
+        self.codec = codec or CacheCodec()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # Counters are per process, sizes are shared
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.errors = 0
+        
+        # Every statement is idempotent, concurrent workers may all run it
+        self._connection().executescript(SCHEMA)
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Fresh data for key, or None. Counts a hit or a miss"""
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                "SELECT blob, expires_at, accessed FROM cache_entries WHERE cache_key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._error('reading', e)
+            row = None
+        
+        if row is None or now >= row[1]:
+            with self.lock:
+                self.misses += 1
+                if row is not None:
+                    self.expirations += 1
+            return None
+        
+        if now - row[2] > self.ACCESS_RESOLUTION:
+            self._mark_accessed([key], now)
+        with self.lock:
+            self.hits += 1
+        return self.codec.decode(row[0])
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Fresh data for the keys that have it, one query per 500 keys"""
+        keys = list(keys)
+        now = time.time()
+        result = {}
+        stale_positions = []
+        expired = 0
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[start:start + self.BATCH_SIZE]
+            try:
+                rows = self._connection().execute(
+                    f"SELECT cache_key, blob, expires_at, accessed FROM cache_entries "
+                    f"WHERE cache_key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+            except sqlite3.Error as e:
+                self._error('reading', e)
+                continue
+            for key, blob, expires_at, accessed in rows:
+                if now >= expires_at:
+                    expired += 1
+                    continue
+                result[key] = self.codec.decode(blob)
+                if now - accessed > self.ACCESS_RESOLUTION:
+                    stale_positions.append(key)
+        
+        if stale_positions:
+            self._mark_accessed(stale_positions, now)
+        with self.lock:
+            self.hits += len(result)
+            self.misses += len(keys) - len(result)
+            self.expirations += expired
+        return result
+    
+    def get_entry(self, key: str) -> Optional[Tuple[Any, float, str]]:
+        """(data, expires_at, etag) regardless of expiry, without touching the counters"""
+        try:
+            row = self._connection().execute(
+                "SELECT blob, expires_at, etag FROM cache_entries WHERE cache_key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._error('reading', e)
+            return None
+        return (self.codec.decode(row[0]), row[1], row[2]) if row else None
+    
+    def set(self, key: str, data: Any, expires_at: float, etag: str = None, size: int = 0,
+            blob: bytes = None) -> None:
+        self.set_many([(key, data, expires_at, etag, size, blob)])
+    
+    def set_many(self, entries: Iterable[Tuple[str, Any, float, Optional[str], int, Optional[bytes]]]) -> None:
+        """Store many entries in one write transaction"""
+        now = time.time()
+        rows = []
+        oversized = []
+        for key, data, expires_at, etag, size, blob in entries:
+            if blob is None:
+                blob = self.codec.encode(data)[0]
+            if len(blob) > self.max_bytes:
+                # Larger than the whole tier, leave it to the database
+                oversized.append((key,))
+                continue
+            rows.append((key, blob, expires_at, etag, len(blob), now))
+        
+        try:
+            with self._transaction() as connection:
+                connection.executemany(UPSERT, rows)
+                connection.executemany("DELETE FROM cache_entries WHERE cache_key = ?", oversized)
+                self._evict(connection)
+        except sqlite3.Error as e:
+            self._error('writing', e)
+    
+    def touch(self, key: str, expires_at: float) -> None:
+        """Move an entry's expiry without replacing its data"""
+        try:
+            with self._transaction() as connection:
+                connection.execute("UPDATE cache_entries SET expires_at = ?, accessed = ? WHERE cache_key = ?",
+                                   (expires_at, time.time(), key))
+        except sqlite3.Error as e:
+            self._error('writing', e)
+    
+    def delete(self, key: str) -> None:
+        try:
+            with self._transaction() as connection:
+                connection.execute("DELETE FROM cache_entries WHERE cache_key = ?", (key,))
+        except sqlite3.Error as e:
+            self._error('writing', e)
+    
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """Delete many keys in one write transaction"""
+        try:
+            with self._transaction() as connection:
+                connection.executemany("DELETE FROM cache_entries WHERE cache_key = ?", [(key,) for key in keys])
+        except sqlite3.Error as e:
+            self._error('writing', e)
+    
+    def clear_expired(self) -> int:
+        """Drop expired entries, returns how many were removed"""
+        try:
+            with self._transaction() as connection:
+                return connection.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        except sqlite3.Error as e:
+            self._error('writing', e)
+            return 0
+    
+    def clear(self) -> None:
+        try:
+            with self._transaction() as connection:
+                connection.execute("DELETE FROM cache_entries")
+        except sqlite3.Error as e:
+            self._error('writing', e)
+    
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Drop least recently used entries down to 90% of both limits once either is exceeded"""
+        entries, total = connection.execute("SELECT entries, bytes FROM cache_totals").fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        
+        excess_entries = entries - int(self.max_entries * 0.9)
+        excess_bytes = total - int(self.max_bytes * 0.9)
+        victims = []
+        freed = 0
+        for key, size in connection.execute("SELECT cache_key, size FROM cache_entries ORDER BY accessed"):
+            if len(victims) >= excess_entries and freed >= excess_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        connection.executemany("DELETE FROM cache_entries WHERE cache_key = ?", victims)
+        with self.lock:
+            self.evictions += len(victims)
+        if self.on_evict:
+            for key, in victims:
+                self.on_evict(key)
+    
+    def _mark_accessed(self, keys, now: float) -> None:
+        try:
+            with self._transaction() as connection:
+                connection.executemany("UPDATE cache_entries SET accessed = ? WHERE cache_key = ?",
+                                       [(now, key) for key in keys])
+        except sqlite3.Error as e:
+            self._error('writing', e)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection; reopened after a fork (e.g. gunicorn --preload)"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            # Autocommit: reads see the latest commit, writes open their own transaction
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+    
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        # Take the write lock up front so a read inside the transaction cannot deadlock an upgrade
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    
+    def _error(self, action: str, error: Exception) -> None:
+        with self.lock:
+            self.errors += 1
+        print(f"Error {action} shared cache {self.path}: {error}")
+    
+    def __contains__(self, key: str) -> bool:
+        return self.get_entry(key) is not None
+    
+    def __len__(self) -> int:
+        return self._totals()[0]
+    
+    def _totals(self) -> Tuple[int, int]:
+        try:
+            return tuple(self._connection().execute("SELECT entries, bytes FROM cache_totals").fetchone())
+        except sqlite3.Error as e:
+            self._error('reading', e)
+            return 0, 0
+    
+    def stats(self) -> Dict:
+        """Shared size and this process's hit/miss/eviction counters"""
+        entries, total = self._totals()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.name,
+                'path': self.path,
+                'entries': entries,
+                'bytes': total,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'errors': self.errors
+            }
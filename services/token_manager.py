@@ -0,0 +1,154 @@
+"""
+Token Manager
+In-memory EVE SSO access tokens per character, refreshed only shortly before they expire
+"""
+
+import json
+import time
+import datetime
+import threading
+from typing import Dict, Optional, Tuple
+
+from flask_sqlalchemy import SQLAlchemy
+from .eve_sso_service import EVESSOService, EVEToken
+
+
+class TokenFlight:
+    """One refresh in progress for a character; other requests wait for its result"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.token: Optional[EVEToken] = None
+
+
+class TokenManager:
+    """Keeps every character's access token in memory until safety_window seconds before it expires.
+    
+    A warm request only reads a dict. Near expiry one request per character refreshes the
+    token against login.eveonline.com and stores it; parallel requests for the same
+    character wait for that refresh instead of starting their own.
+    """
+    
+    def __init__(self, eve_sso_service: EVESSOService, db: SQLAlchemy, safety_window: int = 120,
+                 refresh_wait_timeout: float = 30.0):
+        self.eve_sso_service = eve_sso_service
+        self.db = db
+        self.safety_window = safety_window
+        self.refresh_wait_timeout = refresh_wait_timeout
+        self.tokens: Dict[int, Tuple[str, float]] = {}  # character_id -> (access_token, expires_at timestamp)
+        self.flights: Dict[int, TokenFlight] = {}
+        self.guard = threading.Lock()
+        self.metrics = {'hits': 0, 'loaded': 0, 'refreshes': 0, 'shared': 0, 'failures': 0}
+    
+    def ensure_token(self, user) -> bool:
+        """Put a valid access token on user, refreshing it only inside the safety window.
+        Returns False when the refresh token was rejected and the user was deactivated"""
+        entry = self.tokens.get(user.character_id)
+        if entry and entry[1] - time.time() > self.safety_window:
+            self.metrics['hits'] += 1
+            if user.access_token != entry[0]:
+                user.access_token = entry[0]
+            return True
+        
+        # Not in memory yet, or another worker refreshed it since: the row may be good enough
+        if self._usable(user):
+            self.metrics['loaded'] += 1
+            self.store(user.character_id, user.access_token, user.token_expires_at)
+            return True
+        
+        token = self._refresh_once(user)
+        if not token:
+            return False
+        if user.access_token != token.access_token:
+            user.access_token = token.access_token
+        return True
+    
+    def store(self, character_id: int, access_token: str, expires_at: datetime.datetime) -> None:
+        """Remember a token issued elsewhere (SSO callback); expires_at is naive UTC"""
+        self.tokens[character_id] = (access_token, self._to_timestamp(expires_at))
+    
+    def invalidate(self, character_id: int) -> None:
+        """Forget a character's token, the next request reads the database again"""
+        self.tokens.pop(character_id, None)
+    
+    def clear(self) -> None:
+        """Forget every token (database reset)"""
+        self.tokens.clear()
+    
+    def stats(self) -> Dict:
+        """Token hits, refreshes and requests that shared a refresh"""
+        return dict(self.metrics, characters=len(self.tokens), refreshing=len(self.flights),
+                    safety_window=self.safety_window)
+    
+    def claim(self, character_id: int) -> Tuple[TokenFlight, bool]:
+        """The refresh in flight for a character and whether the caller just started it.
+        The caller that started it must pass its result to release"""
+        with self.guard:
+            flight = self.flights.get(character_id)
+            if flight:
+                return flight, False
+            flight = self.flights[character_id] = TokenFlight()
+            return flight, True
+    
+    def release(self, character_id: int, flight: TokenFlight, token: Optional[EVEToken]) -> None:
+        """Publish a claimed refresh's result (None on failure) to the requests waiting for it"""
+        if token:
+            self.store(character_id, token.access_token, token.expires_at)
+        flight.token = token
+        with self.guard:
+            del self.flights[character_id]
+        flight.done.set()
+    
+    def _refresh_once(self, user) -> Optional[EVEToken]:
+        flight, leader = self.claim(user.character_id)
+        if not leader:
+            self.metrics['shared'] += 1
+            flight.done.wait(self.refresh_wait_timeout)
+            return flight.token
+        
+        token = None
+        try:
+            token = self._refresh(user)
+            return token
+        finally:
+            self.release(user.character_id, flight, token)
+    
+    def _refresh(self, user) -> Optional[EVEToken]:
+        """Refresh against EVE SSO and persist the new token on the user row"""
+        try:
+            # Another worker process may have refreshed the row while this one was waiting
+            self.db.session.refresh(user)
+            if self._usable(user):
+                return EVEToken(user.access_token, user.refresh_token, user.token_expires_at, [])
+            
+            self.metrics['refreshes'] += 1
+            new_token = self.eve_sso_service.refresh_token(user.refresh_token)
+            if new_token:
+                user.access_token = new_token.access_token
+                user.refresh_token = new_token.refresh_token
+                user.token_expires_at = new_token.expires_at
+                user.scopes = json.dumps(new_token.scopes)
+                user.updated_at = datetime.datetime.utcnow()
+                self.db.session.commit()
+                return new_token
+            else:
+                self.metrics['failures'] += 1
+                self.invalidate(user.character_id)
+                user.is_active = False
+                self.db.session.commit()
+                return None
+        except Exception as e:
+            self.metrics['failures'] += 1
+            print(f"Error refreshing token for user {user.character_name}: {e}")
+            return None
+    
+    def _usable(self, user) -> bool:
+        """Whether the token stored on the row outlives the safety window"""
+        if not user.token_expires_at:
+            return False
+        return self._to_timestamp(user.token_expires_at) - time.time() > self.safety_window
+    
+    @staticmethod
+    def _to_timestamp(value: datetime.datetime) -> float:
+        """Convert a naive UTC datetime from the database to a Unix timestamp"""
+        return value.replace(tzinfo=datetime.timezone.utc).timestamp()
@@ -0,0 +1,215 @@
+"""
+Token Refresher
+Background refresh of the access tokens of every active character before they expire
+"""
+
+import json
+import time
+import atexit
+import hashlib
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import or_, text
+
+from .token_manager import TokenManager
+
+
+class TokenRefresher:
+    """Refreshes tokens that expire within lead_time seconds, soonest first, on an interval.
+    
+    The SSO calls run on a bounded thread pool; the new tokens are written back
+    batch_size rows per commit. lead_time is larger than the TokenManager safety
+    window, so request handlers find a fresh token instead of refreshing it themselves.
+    """
+    
+    def __init__(self, app: Flask, db: SQLAlchemy, user_model, token_manager: TokenManager,
+                 interval: float = 60.0, lead_time: int = 300, max_workers: int = 4, batch_size: int = 50):
+        self.app = app
+        self.db = db
+        self.user_model = user_model
+        self.token_manager = token_manager
+        self.interval = interval
+        self.lead_time = lead_time
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='token-refresh')
+        self.stop_event = threading.Event()
+        self.rejected = {}  # character_id -> refresh token SSO refused, skipped until the row has another one
+        self.thread = None
+        self.metrics = {
+            'runs': 0,
+            'refreshed': 0,
+            'failures': 0,
+            'skipped': 0,
+            'commits': 0,
+            'last_run_at': None,
+            'last_due': 0,
+            'last_duration_ms': 0.0
+        }
+    
+    def start(self) -> None:
+        """Start the refresher thread; the first run happens after one interval"""
+        if self.thread:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='token-refresher', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=10)
+        self.thread = None
+    
+    def refresh_due(self) -> Dict:
+        """Refresh every active token expiring within lead_time now. Returns the run's report"""
+        start = time.perf_counter()
+        refreshed = failures = skipped = 0
+        with self.app.app_context():
+            with self._run_lock() as acquired:
+                if not acquired:
+                    # Another worker process is refreshing the same rows
+                    return {'due': 0, 'refreshed': 0, 'failures': 0, 'skipped': 0, 'duration_ms': 0.0}
+                
+                due = self._due_ids()
+                for offset in range(0, len(due), self.batch_size):
+                    # Rows are loaded per batch: a commit expires everything the session holds
+                    users = self.user_model.query.filter(self.user_model.id.in_(due[offset:offset + self.batch_size])).all()
+                    batch_refreshed, batch_failures, batch_skipped = self._refresh_batch(users)
+                    refreshed += batch_refreshed
+                    failures += batch_failures
+                    skipped += batch_skipped
+        
+        duration_ms = round((time.perf_counter() - start) * 1000, 2)
+        self.metrics['runs'] += 1
+        self.metrics['refreshed'] += refreshed
+        self.metrics['failures'] += failures
+        self.metrics['skipped'] += skipped
+        self.metrics['last_run_at'] = time.time()
+        self.metrics['last_due'] = len(due)
+        self.metrics['last_duration_ms'] = duration_ms
+        return {'due': len(due), 'refreshed': refreshed, 'failures': failures, 'skipped': skipped,
+                'duration_ms': duration_ms}
+    
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.refresh_due()
+            except Exception as e:
+                self.metrics['failures'] += 1
+                print(f"Error refreshing tokens: {e}")
+    
+    def _due_ids(self) -> List[int]:
+        """Ids of active users whose token expires within lead_time, soonest first"""
+        cutoff = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lead_time)
+        expires_at = self.user_model.token_expires_at
+        rows = (self.db.session.query(self.user_model.id, self.user_model.character_id, self.user_model.refresh_token)
+                .filter(self.user_model.is_active.is_(True), or_(expires_at.is_(None), expires_at < cutoff))
+                .order_by(expires_at.asc().nullsfirst())
+                .all())
+        # SSO already refused these refresh tokens: the request path refreshes or deactivates them.
+        # Rows that got a new token or stopped being due are forgotten
+        self.rejected = {row.character_id: row.refresh_token for row in rows
+                         if self.rejected.get(row.character_id) == row.refresh_token}
+        return [row.id for row in rows if row.character_id not in self.rejected]
+    
+    def _refresh_batch(self, users: List):
+        """SSO calls in parallel, then one commit for the whole batch"""
+        claimed = []
+        skipped = 0
+        for user in users:
+            flight, leader = self.token_manager.claim(user.character_id)
+            if leader:
+                claimed.append((user, flight))
+            else:
+                # A request is already refreshing this character
+                skipped += 1
+        
+        sso = self.token_manager.eve_sso_service
+        futures = [self.executor.submit(sso.refresh_token, user.refresh_token) for user, _ in claimed]
+        tokens = []
+        for future in futures:
+            try:
+                tokens.append(future.result())
+            except Exception as e:
+                print(f"Error refreshing token: {e}")
+                tokens.append(None)
+        
+        updates = [(user.id, user, token) for (user, _), token in zip(claimed, tokens) if token]
+        for (user, _), token in zip(claimed, tokens):
+            if not token:
+                # Left for the request path, which deactivates the character if SSO keeps refusing
+                self.rejected[user.character_id] = user.refresh_token
+        failures = len(claimed) - len(updates)
+        refreshed = 0
+        try:
+            if updates:
+                for _, user, token in updates:
+                    self._apply(user, token)
+                self.db.session.commit()
+                self.metrics['commits'] += 1
+                refreshed = len(updates)
+        except Exception as e:
+            # SSO may already have rotated the refresh tokens: the rollback must not lose the new ones
+            self.db.session.rollback()
+            print(f"Error saving refreshed tokens, saving them one at a time: {e}")
+            refreshed = self._save_each(updates)
+            failures += len(updates) - refreshed
+        finally:
+            for (user, flight), token in zip(claimed, tokens):
+                self.token_manager.release(user.character_id, flight, token)
+        return refreshed, failures, skipped
+    
+    def _save_each(self, updates: List) -> int:
+        """Fallback after a failed batch commit: one commit per row, so one bad row loses only its own token"""
+        saved = 0
+        for user_id, _, token in updates:
+            try:
+                user = self.db.session.get(self.user_model, user_id)
+                if not user:
+                    continue
+                self._apply(user, token)
+                self.db.session.commit()
+                self.metrics['commits'] += 1
+                saved += 1
+            except Exception as e:
+                # The new access token still works, requests get it from memory until it expires
+                self.db.session.rollback()
+                print(f"Error saving refreshed token for user {user_id}: {e}")
+        return saved
+    
+    @staticmethod
+    def _apply(user, token) -> None:
+        user.access_token = token.access_token
+        user.refresh_token = token.refresh_token
+        user.token_expires_at = token.expires_at
+        user.scopes = json.dumps(token.scopes)
+        user.updated_at = datetime.datetime.utcnow()
+    
+    @contextmanager
+    def _run_lock(self):
+        """PostgreSQL advisory lock so one worker per deployment runs a refresh; always held elsewhere"""
+        if self.db.engine.dialect.name != 'postgresql':
+            yield True
+            return
+        
+        lock_id = int.from_bytes(hashlib.blake2b(b'token-refresher', digest_size=8).digest(), 'big', signed=True)
+        with self.db.engine.connect() as connection:
+            locked = bool(connection.execute(text("SELECT pg_try_advisory_lock(:id)"), {'id': lock_id}).scalar())
+            try:
+                yield locked
+            finally:
+                if locked:
+                    connection.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': lock_id})
+    
+    def stats(self) -> Dict:
+        """Tokens refreshed, failures and run durations"""
+        return dict(self.metrics, rejected=len(self.rejected), interval=self.interval, lead_time=self.lead_time,
+                    max_workers=self.max_workers, batch_size=self.batch_size)